@@ -0,0 +1,145 @@
+"""
+Benchmark de l'extraction des métadonnées : anciennes méthodes contre la
+lecture en une passe de tag_reader (à froid, en pool, puis depuis le cache).
+
+    python benchmark_metadata.py [--folder DOSSIER] [--count N] [--workers N]
+
+Sans --folder, N fichiers MP3 balisés (avec pochette) sont générés dans un
+dossier temporaire.
+"""
+
+import io
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import eyed3
+import mutagen
+from mutagen.easyid3 import EasyID3
+from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB, TCON, TRCK
+from PIL import Image
+
+from src.services.tag_reader import TagReader, read_metadata
+from src.services.library_scanner import AUDIO_EXTENSIONS
+
+# Configurer le logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logging.getLogger('eyed3').setLevel(logging.ERROR)
+
+logger = logging.getLogger(__name__)
+
+# Trame MPEG-1 Layer III, 128 kbit/s, 44,1 kHz (417 octets)
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def generate_library(folder: Path, count: int, seconds: int = 2):
+    """Génère count fichiers MP3 balisés, avec une pochette 500x500"""
+    cover = io.BytesIO()
+    Image.new('RGB', (500, 500), (200, 120, 40)).save(cover, 'JPEG', quality=90)
+    frames = MP3_FRAME * int(seconds * 44100 / 1152)
+    for index in range(count):
+        path = folder / f'{index:05}.mp3'
+        with open(path, 'wb') as f:
+            f.write(frames)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=f'Titre {index}'))
+        tags.add(TPE1(encoding=3, text=f'Artiste {index % 50}'))
+        tags.add(TALB(encoding=3, text=f'Album {index % 200}'))
+        tags.add(TCON(encoding=3, text='Rock'))
+        tags.add(TRCK(encoding=3, text=f'{index % 12 + 1}/12'))
+        tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='', data=cover.getvalue()))
+        tags.save(path)
+
+
+def legacy_eyed3(path: str):
+    """Ancienne extraction de MetadataManager : eyed3 et pochette écrite à chaque appel"""
+    audiofile = eyed3.load(path)
+    if audiofile and audiofile.tag:
+        metadata = {
+            'title': audiofile.tag.title,
+            'artist': audiofile.tag.artist,
+            'album': audiofile.tag.album,
+            'duration': audiofile.info.time_secs,
+            'bitrate': audiofile.info.bit_rate[1],
+            'sample_rate': audiofile.info.sample_freq
+        }
+        if audiofile.tag.images:
+            cover_path = Path(path).parent / f"{Path(path).stem}_cover.jpg"
+            with open(cover_path, 'wb') as img_file:
+                img_file.write(audiofile.tag.images[0].image_data)
+        return metadata
+
+
+def legacy_mutagen_twice(path: str):
+    """Ancienne extraction de MetadataExtractor : EasyID3 puis mutagen.File, pochette réduite"""
+    try:
+        audio = EasyID3(path)
+    except Exception:
+        audio = None
+    audio = mutagen.File(path, easy=True) if audio is None else audio
+    full = mutagen.File(path)
+    metadata = {'title': audio.get('title'), 'duration': full.info.length}
+    frames = full.tags.getall('APIC') if full.tags is not None else []
+    if frames:
+        covers = Path(path).parent / 'covers'
+        covers.mkdir(exist_ok=True)
+        image = Image.open(io.BytesIO(frames[0].data))
+        image.thumbnail((300, 300))
+        image.convert('RGB').save(covers / f'{Path(path).stem}_cover.jpg', 'JPEG', quality=85)
+    return metadata
+
+
+def measure(name: str, function, count: int):
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    logger.info(f"{name:<40} {elapsed:8.3f} s  {count / elapsed:10.0f} fichiers/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'extraction des métadonnées")
+    parser.add_argument('--folder', help="Dossier de fichiers audio existants")
+    parser.add_argument('--count', type=int, default=500, help="Fichiers générés (sans --folder)")
+    parser.add_argument('--workers', type=int, help="Processus du pool (par défaut un par cœur)")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='citrus-bench-'))
+    try:
+        if args.folder:
+            # Copie : les anciennes méthodes écrivent des pochettes à côté des fichiers
+            sources = [p for p in Path(args.folder).rglob('*') if p.suffix.lower() in AUDIO_EXTENSIONS]
+            for index, source in enumerate(sources):
+                shutil.copy2(source, work_dir / f'{index:05}{source.suffix.lower()}')
+        else:
+            generate_library(work_dir, args.count)
+        paths = sorted(str(p) for p in work_dir.iterdir() if p.is_file())
+        mp3_paths = [p for p in paths if p.endswith('.mp3')]
+        logger.info(f"{len(paths)} fichiers dans {work_dir}")
+
+        if mp3_paths:
+            measure("MetadataManager (eyed3)", lambda: [legacy_eyed3(p) for p in mp3_paths], len(mp3_paths))
+        measure("MetadataExtractor (double lecture)", lambda: [legacy_mutagen_twice(p) for p in paths], len(paths))
+        measure("read_metadata (une passe)", lambda: [read_metadata(p) for p in paths], len(paths))
+
+        reader = TagReader(db_path=str(work_dir / 'tag_cache.db'), workers=args.workers)
+        measure("TagReader.read_many (pool, à froid)", lambda: reader.read_many(paths), len(paths))
+        measure("TagReader.read_many (cache mémoire)", lambda: reader.read_many(paths), len(paths))
+        cold_reader = TagReader(db_path=str(work_dir / 'tag_cache.db'))
+        measure("TagReader.read_many (cache SQLite)", lambda: cold_reader.read_many(paths), len(paths))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Import unique des anciennes playlists JSON (data/playlists) dans la base.
+
+    python migrate_playlists.py [--folder DOSSIER]
+
+Les fichiers importés sont renommés en .json.migrated : relancer le script
+n'importe que les fichiers restants.
+"""
+
+import sys
+import logging
+import argparse
+
+from src import create_app
+from src.database import db
+from src.utils.metadata_manager import metadata_manager
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importe les playlists JSON dans la base")
+    parser.add_argument('--folder', help="Dossier des playlists JSON (par défaut data/playlists)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        stats = metadata_manager.migrate_json_playlists(args.folder)
+    print(f"{stats['imported']} playlists importées, {stats['skipped']} déjà présentes, {stats['failed']} illisibles")
+
+
+if __name__ == '__main__':
+    main()
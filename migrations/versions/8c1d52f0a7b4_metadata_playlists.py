@@ -0,0 +1,44 @@
+"""Metadata playlists
+
+Revision ID: 8c1d52f0a7b4
+Revises: 9068ef8fc65d
+Create Date: 2026-10-19 10:12:31.418204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d52f0a7b4'
+down_revision = '9068ef8fc65d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('metadata_playlists',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.String(length=500), nullable=True),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_metadata_playlists_updated_at'), 'metadata_playlists', ['updated_at'], unique=False)
+    op.create_table('metadata_playlist_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('playlist_id', sa.String(length=32), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['playlist_id'], ['metadata_playlists.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('playlist_id', 'position')
+    )
+
+
+def downgrade():
+    op.drop_table('metadata_playlist_entries')
+    op.drop_index(op.f('ix_metadata_playlists_updated_at'), table_name='metadata_playlists')
+    op.drop_table('metadata_playlists')
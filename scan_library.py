@@ -0,0 +1,50 @@
+"""
+Analyse incrémentale du dossier de musique (MUSIC_FOLDER) en ligne de commande.
+
+    python scan_library.py [--root DOSSIER] [--workers N] [--prune]
+
+Seuls les fichiers nouveaux ou modifiés depuis la dernière analyse sont lus.
+"""
+
+import sys
+import logging
+import argparse
+
+from src import create_app
+from src.database import db
+from src.services.library_scanner import library_scanner
+from src.services.waveform import waveform_jobs
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse le dossier de musique et met à jour la bibliothèque")
+    parser.add_argument('--root', help="Dossier à analyser (par défaut MUSIC_FOLDER)")
+    parser.add_argument('--workers', type=int, help="Processus de lecture des balises")
+    parser.add_argument('--prune', action='store_true', help="Supprimer les pistes dont le fichier a disparu")
+    args = parser.parse_args()
+
+    app = create_app()
+    library_scanner.configure(workers=args.workers)
+    with app.app_context():
+        db.create_all()
+        stats = library_scanner.scan(args.root or app.config['MUSIC_FOLDER'], db.engine, prune=args.prune)
+    print(
+        f"{stats['seen']} fichiers, {stats['unchanged']} inchangés, {stats['parsed']} analysés, "
+        f"{stats['failed']} illisibles, {stats['removed']} disparus en {stats['elapsed']} s"
+    )
+    if library_scanner.analyze and stats['parsed']:
+        # Les formes d'onde sont calculées par un thread démon : attendre la fin
+        print("Calcul des formes d'onde et des extraits...")
+        waveform_jobs.queue.join()
+
+
+if __name__ == '__main__':
+    main()
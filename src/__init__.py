@@ -73,14 +73,91 @@ def create_app(config_name='default'):
     from .routes.stream import stream_bp
     from .routes.iptv import iptv_bp
     from .routes.admin import admin_bp
+    from .routes.media import media_bp
+    from .routes.events import events_bp
+    from .routes.images import images_bp
     app.register_blueprint(stream_bp)
     app.register_blueprint(iptv_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(media_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(images_bp)
+
+    # Chaîne d'intégration des fichiers téléchargés dans la bibliothèque
+    from .services.ingest import ingest_pipeline
+    ingest_pipeline.configure(
+        workers=app.config.get('INGEST_WORKERS'),
+        queue_size=app.config.get('INGEST_QUEUE_SIZE'),
+        batch_size=app.config.get('INGEST_BATCH_SIZE'),
+        flush_interval=app.config.get('INGEST_FLUSH_INTERVAL'),
+        analyze=app.config.get('ANALYZE_ON_INGEST', True) and not app.config.get('TESTING')
+    )
+    ingest_pipeline.start(app)
+
+    # Lecture des balises en une passe, avec cache persistant
+    from .services.tag_reader import tag_reader
+    tag_reader.configure(
+        db_path=app.config.get('TAG_CACHE_PATH'),
+        workers=app.config.get('LIBRARY_SCAN_WORKERS')
+    )
+    from .services.cover_store import cover_store
+    cover_store.configure(
+        root=app.config.get('COVER_FOLDER', str(Path(app.config['UPLOAD_FOLDER']) / 'covers')),
+        sizes=app.config.get('COVER_SIZES'),
+        workers=app.config.get('COVER_WORKERS')
+    )
+    from .services.image_resizer import image_resizer
+    image_resizer.configure(
+        root=app.config.get('DERIVED_IMAGE_FOLDER', str(Path(app.config['UPLOAD_FOLDER']) / 'derived')),
+        max_bytes=app.config.get('DERIVED_IMAGE_CACHE_MB', 256) * 1024 * 1024,
+        concurrency=app.config.get('IMAGE_DECODE_CONCURRENCY'),
+        folders={'playlists': str(Path(app.config['UPLOAD_FOLDER']) / 'playlists')}
+    )
+    from .services.tag_editor import tag_editor
+    tag_editor.configure(workers=app.config.get('TAG_EDIT_WORKERS'))
+
+    # Analyse incrémentale du dossier de musique
+    from .services.library_scanner import library_scanner
+    library_scanner.configure(
+        workers=app.config.get('LIBRARY_SCAN_WORKERS'),
+        batch_size=app.config.get('LIBRARY_SCAN_BATCH_SIZE'),
+        analyze=app.config.get('ANALYZE_ON_INGEST', True) and not app.config.get('TESTING')
+    )
+
+    # Surveillance en direct de la bibliothèque (hors tests)
+    if app.config.get('LIBRARY_WATCH', True) and not app.config.get('TESTING'):
+        from .services.library_watcher import library_watcher
+        library_watcher.configure(debounce=app.config.get('LIBRARY_WATCH_DEBOUNCE'))
+        library_watcher.start(app, [
+            app.config['MUSIC_FOLDER'],
+            str(Path(app.config['UPLOAD_FOLDER']) / 'downloads')
+        ])
 
     # Initialiser le gestionnaire de téléchargements
     from .routes.download import init_download_manager
     init_download_manager(app)
 
+    # Pool de conversion (ffmpeg)
+    from .utils.media_processor import media_processor
+    media_processor.configure(
+        workers=app.config.get('MEDIA_WORKERS'),
+        thermal_limit=app.config.get('MEDIA_THERMAL_LIMIT'),
+        cache_root=app.config.get('CONVERSION_CACHE_FOLDER',
+                                  str(Path(app.config['UPLOAD_FOLDER']) / 'conversions')),
+        cache_bytes=app.config.get('CONVERSION_CACHE_MB', 2048) * 1024 * 1024
+    )
+
+    # Budget mémoire du préchargement des pistes suivantes
+    from .utils.prefetch import page_prefetcher
+    page_prefetcher.budget_bytes = app.config.get('PREFETCH_BUDGET_MB', 256) * 1024 * 1024
+
+    # Cache des extraits de prévisualisation
+    from .services.preview import preview_service
+    preview_service.configure(
+        app.config.get('PREVIEW_FOLDER', str(Path(app.config['UPLOAD_FOLDER']) / 'previews')),
+        app.config.get('PREVIEW_CACHE_MB', 512) * 1024 * 1024
+    )
+
     init_db()
 
 
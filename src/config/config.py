@@ -20,6 +20,64 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
     CACHE_THRESHOLD = 500  # Nombre maximum d'éléments dans le cache
 
+    # Relais IPTV : un seul flux amont partagé par tous les clients locaux
+    IPTV_RELAY_ENABLED = True
+
+    # Préchargement des prochaines pistes dans le cache de pages
+    PREFETCH_BUDGET_MB = 256
+
+    # Extraits de prévisualisation (cache borné)
+    PREVIEW_FOLDER = str(Path(__file__).parent.parent / 'static' / 'uploads' / 'previews')
+    PREVIEW_CACHE_MB = 512
+    # Pochettes dédupliquées par empreinte : tailles générées (JPEG et WebP) et threads
+    COVER_FOLDER = str(Path(__file__).parent.parent / 'static' / 'uploads' / 'covers')
+    COVER_SIZES = (96, 300, 600)
+    COVER_WORKERS = 2
+    # Variantes d'images redimensionnées à la demande (/img) : cache borné et décodages simultanés
+    DERIVED_IMAGE_FOLDER = str(Path(__file__).parent.parent / 'static' / 'uploads' / 'derived')
+    DERIVED_IMAGE_CACHE_MB = 256
+    IMAGE_DECODE_CONCURRENCY = 2
+
+    # Ordonnanceur de téléchargements : pool fixe et plafonds par source
+    DOWNLOAD_WORKERS = 3
+    DOWNLOAD_SOURCE_LIMITS = {'youtube': 2, 'soundcloud': 2, 'spotify': 1}
+
+    # Cache des métadonnées yt-dlp (secondes) et instances d'extraction réutilisées
+    MEDIA_INFO_TTL = 6 * 3600
+    MEDIA_INFO_WORKERS = 2
+
+    # Intégration des téléchargements dans la bibliothèque : threads par étape,
+    # capacité des files et enregistrement par lots (N pistes ou T secondes)
+    INGEST_WORKERS = {'probe': 2, 'transcode': 1, 'tag': 2, 'cover': 1}
+    INGEST_QUEUE_SIZE = 32
+    INGEST_BATCH_SIZE = 50
+    INGEST_FLUSH_INTERVAL = 2.0
+    # Pics de forme d'onde et extraits planifiés dès l'enregistrement des pistes
+    # (chaîne d'intégration, surveillance et analyse de MUSIC_FOLDER)
+    ANALYZE_ON_INGEST = True
+
+    # Analyse de MUSIC_FOLDER : processus de lecture des balises (None = un par cœur)
+    # et fichiers enregistrés par transaction
+    LIBRARY_SCAN_WORKERS = None
+    LIBRARY_SCAN_BATCH_SIZE = 2000
+    # Cache persistant des balises lues, par (chemin, taille, mtime)
+    TAG_CACHE_PATH = str(Path(__file__).parent.parent / 'static' / 'uploads' / 'tag_cache.db')
+    # Fichiers dont les balises sont réécrites en parallèle (édition par lot)
+    TAG_EDIT_WORKERS = 4
+
+    # Conversions : workers simultanés (None = un par cœur, moins un) et
+    # température (°C) au-delà de laquelle un seul worker continue
+    MEDIA_WORKERS = None
+    MEDIA_THERMAL_LIMIT = 75.0
+    # Résultats de conversion réutilisés (clé : contenu, format, qualité, sous-titres)
+    CONVERSION_CACHE_FOLDER = str(Path(__file__).parent.parent / 'static' / 'uploads' / 'conversions')
+    CONVERSION_CACHE_MB = 2048
+
+    # Surveillance inotify des dossiers de musique et de téléchargements
+    # (silence attendu avant traitement, en secondes)
+    LIBRARY_WATCH = True
+    LIBRARY_WATCH_DEBOUNCE = 2.0
+
 class DevelopmentConfig(Config):
     """Configuration pour le développement"""
     DEBUG = True
@@ -5,5 +5,6 @@ Package des modèles de données
 from .user import User
 from .playlist import Playlist
 from .track import Track
+from .metadata_playlist import MetadataPlaylist, MetadataPlaylistEntry
 
-__all__ = ['User', 'Playlist', 'Track']
+__all__ = ['User', 'Playlist', 'Track', 'MetadataPlaylist', 'MetadataPlaylistEntry']
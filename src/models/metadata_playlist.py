@@ -0,0 +1,60 @@
+"""
+Modèle de données pour les playlists de métadonnées (pistes libres, sans
+fichier dans la bibliothèque)
+"""
+
+from datetime import datetime, UTC
+from ..database import db
+
+class MetadataPlaylist(db.Model):
+    """Modèle pour une playlist de métadonnées"""
+    __tablename__ = 'metadata_playlists'
+
+    id = db.Column(db.String(32), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(500))
+    # Compteur tenu à jour à chaque ajout : la liste n'a pas à compter les pistes
+    track_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC), index=True)
+
+    # Relations
+    entries = db.relationship(
+        'MetadataPlaylistEntry',
+        order_by='MetadataPlaylistEntry.position',
+        cascade='all, delete-orphan',
+        lazy='selectin'
+    )
+
+    def to_summary(self):
+        """Résumé pour la liste des playlists"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'track_count': self.track_count,
+            'updated_at': self.updated_at.isoformat()
+        }
+
+    def to_dict(self):
+        """Convertit la playlist en dictionnaire, avec ses pistes"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'tracks': [entry.data for entry in self.entries]
+        }
+
+class MetadataPlaylistEntry(db.Model):
+    """Modèle pour une piste d'une playlist de métadonnées"""
+    __tablename__ = 'metadata_playlist_entries'
+    __table_args__ = (
+        db.UniqueConstraint('playlist_id', 'position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.String(32), db.ForeignKey('metadata_playlists.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.JSON, nullable=False)
@@ -4,6 +4,10 @@ Modèle de données pour les playlists
 
 from datetime import datetime, UTC
 from ..database import db
+from ..utils.image import get_image_url
+
+# Largeur de la pochette affichée (variante réduite servie par /img)
+COVER_WIDTH = 300
 
 # Table d'association pour les pistes dans les playlists
 playlist_tracks = db.Table('playlist_tracks',
@@ -55,6 +59,7 @@ class Playlist(db.Model):
             'name': self.name,
             'description': self.description,
             'cover_image': self.cover_image,
+            'cover_url': get_image_url(self.cover_image, 'playlists', width=COVER_WIDTH),
             'track_count': self.track_count,
             'total_duration': self.total_duration,
             'created_at': self.created_at.isoformat(),
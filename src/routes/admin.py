@@ -10,6 +10,7 @@ from ..models.user import User
 from ..models.track import Track
 from ..models.playlist import Playlist
 from ..utils.db_optimizations import get_db_stats, optimize_db, query_cache
+from ..services.library_scanner import library_scanner
 
 # Création du blueprint
 admin_bp = Blueprint('admin', __name__)
@@ -132,3 +133,30 @@ def get_slow_queries():
     except Exception as e:
         current_app.logger.error(f"Erreur lors de la récupération des requêtes lentes: {str(e)}")
         return jsonify({'error': 'Erreur serveur'}), 500
+
+@admin_bp.route('/api/admin/library/scan', methods=['POST'])
+@login_required
+def start_library_scan():
+    """Lance l'analyse incrémentale du dossier de musique"""
+    # Vérifier si l'utilisateur est un administrateur
+    if not hasattr(request.user, 'is_admin') or not request.user.is_admin:
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    started = library_scanner.start(
+        current_app._get_current_object(),
+        prune=bool(data.get('prune', False))
+    )
+    if not started:
+        return jsonify({'error': 'Analyse déjà en cours', 'scan': library_scanner.get_status()}), 409
+    return jsonify({'success': True, 'scan': library_scanner.get_status()}), 202
+
+@admin_bp.route('/api/admin/library/scan', methods=['GET'])
+@login_required
+def get_library_scan():
+    """État de la dernière analyse de la bibliothèque"""
+    # Vérifier si l'utilisateur est un administrateur
+    if not hasattr(request.user, 'is_admin') or not request.user.is_admin:
+        return jsonify({'error': 'Accès non autorisé'}), 403
+    
+    return jsonify(library_scanner.get_status())
@@ -2,16 +2,25 @@
 Routes API pour la gestion de la musique
 """
 
-from flask import Blueprint, jsonify, request, send_file, current_app, Response
+from flask import Blueprint, jsonify, request, send_file, current_app, Response, redirect, url_for
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 import json
 import subprocess
 import tempfile
+import numpy as np
 from ..models.track import Track
 from ..database import db, db_session
 from ..utils.query_optimizations import optimize_track_search
+from ..utils.bandwidth import bandwidth_governor, INTERACTIVE
+from ..utils.prefetch import page_prefetcher
+from ..services.waveform import waveform_jobs, read_peaks, peaks_path_for
+from ..services.preview import preview_service
+from ..services.ingest import ingest_pipeline
+from ..services.tag_reader import tag_reader
+from ..services.tag_editor import tag_editor
+from ..utils.exceptions import ServiceError, ValidationError
 
 api_bp = Blueprint('api', __name__)
 
@@ -127,12 +136,126 @@ def get_track(track_id):
 def stream_track(track_id):
     """Stream une piste audio"""
     track = Track.query.get_or_404(track_id)
-    return send_file(
+
+    # Ne compter que l'ouverture de la piste, pas chaque requête Range suivante
+    if not request.range or request.range.ranges[0][0] == 0:
+        page_prefetcher.record_access(track.file_path)
+
+    response = send_file(
         track.file_path,
         mimetype='audio/mpeg',
         as_attachment=False,
         download_name=f"{track.title}.mp3"
     )
+    # send_file gère déjà les requêtes Range : on limite le corps tel quel
+    response.response = bandwidth_governor.wrap(response.response, current_user.id, INTERACTIVE)
+    return response
+
+@api_bp.route('/api/tracks/<int:track_id>/peaks', methods=['GET'])
+@login_required
+def get_track_peaks(track_id):
+    """
+    Récupère les pics de forme d'onde d'une piste.
+
+    Paramètres : resolution (nombre de pics, défaut 800), format (bin ou json).
+    Le format binaire contient des paires (min, max) int16 little-endian.
+    """
+    track = Track.query.get_or_404(track_id)
+    resolution = min(max(request.args.get('resolution', 800, type=int), 1), 65536)
+    output_format = request.args.get('format', 'bin')
+
+    status = waveform_jobs.get_status(track.file_path)
+    if status != 'ready':
+        if status == 'missing':
+            waveform_jobs.enqueue(track.file_path)
+            status = 'pending'
+        return jsonify({'status': status}), 202 if status == 'pending' else 500
+
+    peaks = read_peaks(peaks_path_for(track.file_path))
+    mins, maxs, samples_per_peak = peaks.select(resolution)
+
+    if output_format == 'json':
+        response = jsonify({
+            'sample_rate': peaks.sample_rate,
+            'samples_per_peak': samples_per_peak,
+            'min': mins.tolist(),
+            'max': maxs.tolist()
+        })
+    else:
+        pairs = np.empty(len(mins) * 2, dtype='<i2')
+        pairs[0::2] = mins
+        pairs[1::2] = maxs
+        response = Response(pairs.tobytes(), mimetype='application/octet-stream')
+        response.headers['X-Peaks-Count'] = str(len(mins))
+        response.headers['X-Samples-Per-Peak'] = f"{samples_per_peak:.3f}"
+        response.headers['X-Sample-Rate'] = str(peaks.sample_rate)
+
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@api_bp.route('/api/tracks/<int:track_id>/preview', methods=['GET'])
+@login_required
+def get_track_preview(track_id):
+    """
+    Sert l'extrait de prévisualisation d'une piste.
+    Tant qu'il n'est pas prêt, sa génération est planifiée et le client est
+    redirigé vers le flux complet.
+    """
+    track = Track.query.get_or_404(track_id)
+
+    cached = preview_service.get(track.file_path)
+    if not cached:
+        preview_service.submit_batch([track.file_path])
+        return redirect(url_for('api.stream_track', track_id=track_id))
+
+    preview_path, key = cached
+    response = send_file(preview_path, mimetype='audio/mpeg', etag=key, max_age=31536000)
+    # La clé dépend du fichier source : l'extrait ne change jamais pour cette version
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@api_bp.route('/api/tracks/previews', methods=['POST'])
+@login_required
+def generate_previews():
+    """Planifie par lot la génération des extraits de plusieurs pistes"""
+    data = request.get_json(silent=True) or {}
+    try:
+        track_ids = [int(i) for i in data.get('ids', [])][:200]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Liste de pistes invalide'}), 400
+
+    rows = Track.query.with_entities(Track.file_path).filter(
+        Track.id.in_(track_ids)
+    ).all() if track_ids else []
+    scheduled = preview_service.submit_batch([row.file_path for row in rows])
+    return jsonify({'scheduled': scheduled, 'cache': preview_service.get_stats()}), 202
+
+@api_bp.route('/api/tracks/<int:track_id>/queue-hint', methods=['POST'])
+@login_required
+def queue_hint(track_id):
+    """
+    Reçoit la suite de la file de lecture au démarrage d'une piste et
+    précharge les prochaines pistes dans le cache de pages
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        next_ids = [int(i) for i in data.get('next', [])][:page_prefetcher.max_ahead]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Liste de pistes invalide'}), 400
+
+    rows = Track.query.with_entities(Track.id, Track.file_path).filter(
+        Track.id.in_(next_ids)
+    ).all() if next_ids else []
+    paths = {row.id: row.file_path for row in rows}
+
+    scheduled = page_prefetcher.hint([paths[i] for i in next_ids if i in paths])
+    return jsonify({'current': track_id, 'scheduled': scheduled}), 202
+
+@api_bp.route('/api/tracks/prefetch/stats', methods=['GET'])
+@login_required
+def prefetch_stats():
+    """Statistiques du préchargement (taux de succès, budget mémoire)"""
+    return jsonify(page_prefetcher.get_stats())
 
 @api_bp.route('/api/tracks/<int:track_id>', methods=['PUT'])
 @login_required
@@ -149,6 +272,48 @@ def update_track(track_id):
     db.session.commit()
     return jsonify(track.to_dict())
 
+@api_bp.route('/api/tracks/<int:track_id>/metadata', methods=['GET'])
+@login_required
+def get_track_metadata(track_id):
+    """Balises et propriétés audio lues dans le fichier de la piste"""
+    track = Track.query.get_or_404(track_id)
+    record = tag_reader.read(track.file_path)
+    if record is None:
+        return jsonify({'error': 'Fichier introuvable ou illisible'}), 404
+    return jsonify({'id': track.id, **record.to_dict()})
+
+@api_bp.route('/api/tracks/<int:track_id>/metadata', methods=['PATCH'])
+@login_required
+def edit_track_metadata(track_id):
+    """Modifie les balises du fichier et la piste, sans renvoi du fichier"""
+    Track.query.get_or_404(track_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(tag_editor.edit(track_id, data))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except ServiceError as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/api/tracks/metadata', methods=['PATCH'])
+@login_required
+def edit_tracks_metadata():
+    """
+    Modifie les balises d'un lot de pistes en parallèle :
+    {"tracks": [{"id": 1, "album": "..."}, ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    edits = data.get('tracks')
+    if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+        return jsonify({'error': 'Liste de pistes invalide'}), 400
+    try:
+        result = tag_editor.edit_many(edits)
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except ServiceError as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result), 207 if result['errors'] else 200
+
 @api_bp.route('/api/tracks/<int:track_id>', methods=['DELETE'])
 @login_required
 def delete_track(track_id):
@@ -195,6 +360,10 @@ def upload_track():
     db.session.add(track)
     db.session.commit()
     
+    # Calculer la forme d'onde et l'extrait une fois pour toutes, en arrière-plan
+    waveform_jobs.enqueue(file_path)
+    preview_service.submit_batch([file_path])
+    
     return jsonify(track.to_dict()), 201
 
 
@@ -256,73 +425,47 @@ def get_library():
 @api_bp.route('/api/download', methods=['POST'])
 @login_required
 def download_track():
-    """Télécharge une piste audio à partir d'une URL (version simplifiée)"""
+    """
+    Télécharge une piste audio à partir d'une URL (version simplifiée) : la
+    demande passe par le gestionnaire de téléchargements, qui confie le
+    fichier obtenu à la chaîne d'intégration de la bibliothèque
+    """
+    from . import download as download_routes
+
     data = request.get_json()
     
     if not data or 'url' not in data:
         return jsonify({'error': 'URL requise'}), 400
     
-    url = data['url']
-    title = data.get('title', 'Titre inconnu')
-    artist = data.get('artist', 'Artiste inconnu')
+    manager = download_routes.download_manager
+    if manager is None:
+        return jsonify({'error': 'Gestionnaire de téléchargements indisponible'}), 503
     
     try:
-        # Vérifier si le dossier d'upload existe
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        # Générer un nom de fichier sécurisé avec timestamp pour éviter les doublons
-        import time
-        timestamp = int(time.time())
-        filename = secure_filename(f"{artist} - {title} - {timestamp}.mp3")
-        destination = os.path.join(upload_folder, filename)
-        
-        # Vérifier si une piste avec ce chemin existe déjà
-        existing_track = Track.query.filter_by(file_path=destination).first()
-        if existing_track:
-            # Si la piste existe déjà, renvoyer ses informations
+        # Ordonnanceur commun, bande passante et dédoublonnage par identifiant canonique
+        task_id = manager.add_download(
+            data['url'], data.get('service', 'youtube'),
+            user_id=current_user.id,
+            tags={
+                'title': data.get('title'),
+                'artist': data.get('artist'),
+                'album': data.get('album')
+            }
+        )
+        status = manager.get_status(task_id)['status']
+        if status == 'completed':
             return jsonify({
                 'success': True,
                 'message': 'Piste déjà téléchargée',
-                'track': {
-                    'id': existing_track.id,
-                    'title': existing_track.title,
-                    'artist': existing_track.artist,
-                    'file_path': existing_track.file_path
-                }
+                'task_id': task_id,
+                'status': status
             })
-        
-        # Simuler un téléchargement réussi (pour développement)
-        # Dans un environnement de production, vous utiliseriez yt-dlp ou une autre bibliothèque
-        # pour télécharger réellement le fichier audio
-        
-        # Créer un fichier audio vide pour simuler le téléchargement
-        with open(destination, 'wb') as f:
-            # Écrire quelques octets pour simuler un fichier audio
-            f.write(b'\x00' * 1024)
-        
-        # Créer l'entrée dans la base de données
-        track = Track(
-            title=title,
-            artist=artist,
-            album=data.get('album', 'Album inconnu'),
-            duration=data.get('duration', 0),
-            file_path=destination
-        )
-        
-        db.session.add(track)
-        db.session.commit()
-        
         return jsonify({
             'success': True,
-            'message': 'Téléchargement simulé avec succès',
-            'track': {
-                'id': track.id,
-                'title': track.title,
-                'artist': track.artist,
-                'file_path': track.file_path
-            }
-        })
+            'message': 'Téléchargement démarré',
+            'task_id': task_id,
+            'status': status
+        }), 202
         
     except Exception as e:
         current_app.logger.error(f"Exception lors du téléchargement: {str(e)}")
@@ -330,3 +473,18 @@ def download_track():
             'error': 'Erreur lors du téléchargement',
             'details': str(e)
         }), 500
+
+@api_bp.route('/api/ingest/<item_id>', methods=['GET'])
+@login_required
+def get_ingest_status(item_id):
+    """État de l'intégration d'un téléchargement dans la bibliothèque"""
+    item = ingest_pipeline.get(item_id)
+    if not item:
+        return jsonify({'error': 'Élément introuvable'}), 404
+    return jsonify(item.to_dict())
+
+@api_bp.route('/api/ingest/stats', methods=['GET'])
+@login_required
+def get_ingest_stats():
+    """Files et compteurs de la chaîne d'intégration"""
+    return jsonify(ingest_pipeline.get_stats())
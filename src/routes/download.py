@@ -2,10 +2,13 @@
 Routes pour le téléchargement de musique
 """
 
+import threading
 from flask import Blueprint, jsonify, request, current_app
-from flask_login import login_required
+from flask_login import login_required, current_user
 from pathlib import Path
 from ..services.downloader import DownloadManager
+from ..services.scheduler import download_scheduler
+from ..services.media_info import media_info, summarize
 
 download_bp = Blueprint('download', __name__)
 
@@ -20,6 +23,17 @@ def init_download_manager(app):
             download_dir = Path(current_app.config['UPLOAD_FOLDER']) / 'downloads'
             download_dir.mkdir(parents=True, exist_ok=True)
             download_manager = DownloadManager(download_dir)
+            download_scheduler.configure(
+                workers=current_app.config.get('DOWNLOAD_WORKERS', 3),
+                source_limits=current_app.config.get('DOWNLOAD_SOURCE_LIMITS')
+            )
+            media_info.configure(
+                download_dir / 'media_info.db',
+                workers=current_app.config.get('MEDIA_INFO_WORKERS', 2),
+                ttl=current_app.config.get('MEDIA_INFO_TTL')
+            )
+            # Préchauffer les extracteurs yt-dlp sans retarder le démarrage
+            threading.Thread(target=media_info.warm_up, name='media-info-warmup', daemon=True).start()
 
 # Initialisation au démarrage
 from flask import current_app
@@ -39,9 +53,18 @@ def start_download():
     service = data.get('service', 'youtube')  # Par défaut YouTube
     
     try:
-        task_id = download_manager.add_download(url, service)
+        task_id = download_manager.add_download(url, service, user_id=current_user.id)
+        # La demande a pu être rattachée à une tâche existante (même média)
+        status = download_manager.get_status(task_id)['status']
+        if status == 'completed':
+            return jsonify({
+                'task_id': task_id,
+                'status': status,
+                'message': 'Déjà téléchargé'
+            }), 200
         return jsonify({
             'task_id': task_id,
+            'status': status,
             'message': 'Téléchargement démarré'
         }), 202
     except Exception as e:
@@ -49,6 +72,30 @@ def start_download():
             'error': str(e)
         }), 500
 
+@download_bp.route('/api/downloads/metrics', methods=['GET'])
+@login_required
+def get_download_metrics():
+    """Profondeur des files et temps d'attente de l'ordonnanceur"""
+    return jsonify({**download_scheduler.get_metrics(), 'metadata': media_info.get_stats()})
+
+@download_bp.route('/api/downloads/info', methods=['POST'])
+@login_required
+def get_download_info():
+    """
+    Aperçu avant téléchargement d'une ou plusieurs URL (titre, durée,
+    pistes d'une playlist), servi depuis le cache quand c'est possible
+    """
+    data = request.get_json() or {}
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    if not urls:
+        return jsonify({'error': 'URL requise'}), 400
+    
+    results = media_info.get_many(urls)
+    return jsonify({
+        url: info if 'error' in info else summarize(info)
+        for url, info in results.items()
+    })
+
 @download_bp.route('/api/downloads/<task_id>', methods=['GET'])
 @login_required
 def get_download_status(task_id):
@@ -80,8 +127,16 @@ def cancel_download(task_id):
 @download_bp.route('/api/downloads', methods=['GET'])
 @login_required
 def list_downloads():
-    """Liste tous les téléchargements"""
-    tasks = download_manager.get_all_tasks()
+    """Liste l'historique des téléchargements, page par page"""
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+    status = request.args.get('status')
+    parent_id = request.args.get('parent')  # Pistes d'une playlist
+    
+    result = download_manager.list_tasks(page, per_page, status=status, parent_id=parent_id)
     return jsonify({
-        'downloads': tasks  # Les tâches sont déjà des dictionnaires
+        'downloads': result['items'],  # Les tâches sont déjà des dictionnaires
+        'total': result['total'],
+        'page': result['page'],
+        'per_page': result['per_page']
     })
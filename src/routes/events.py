@@ -0,0 +1,34 @@
+"""
+Routes du flux d'événements de progression (Server-Sent Events)
+"""
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_login import login_required, current_user
+from ..utils.events import event_bus
+
+events_bp = Blueprint('events', __name__)
+
+@events_bp.route('/api/events')
+@login_required
+def stream_events():
+    """
+    Flux unique par client : téléchargements, conversions et torrents.
+    Paramètre optionnel ?channels=downloads,conversions,streams
+    """
+    channels = [c for c in request.args.get('channels', '').split(',') if c]
+    subscription = event_bus.subscribe(user_id=current_user.id, channels=channels)
+    
+    response = Response(
+        stream_with_context(event_bus.stream(subscription)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Désactiver la mise en tampon des proxys (nginx)
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@events_bp.route('/api/events/stats')
+@login_required
+def get_event_stats():
+    """Statistiques du bus d'événements"""
+    return jsonify(event_bus.get_stats())
@@ -0,0 +1,84 @@
+"""
+Routes des images : pochettes (stockage adressé par contenu) et variantes
+redimensionnées à la demande
+"""
+
+from flask import Blueprint, jsonify, request, send_file, redirect, url_for, abort
+from flask_login import login_required
+
+from ..models.track import Track
+from ..services.cover_store import cover_store, MIMETYPES
+from ..services.image_resizer import image_resizer, OUTPUT_FORMATS
+from ..utils.exceptions import ServiceError, ValidationError
+
+images_bp = Blueprint('images', __name__)
+
+@images_bp.route('/covers/<key>/<int:size>.<fmt>', methods=['GET'])
+@login_required
+def get_cover(key, size, fmt):
+    """Sert une variante de pochette ; son contenu ne change jamais"""
+    path = cover_store.get(key, size, fmt)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=MIMETYPES[fmt], etag=f'{key}-{size}', max_age=31536000)
+    # L'adresse dépend de l'image : la variante est immuable
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@images_bp.route('/api/tracks/<int:track_id>/cover', methods=['GET'])
+@login_required
+def get_track_cover(track_id):
+    """
+    Redirige vers la pochette d'une piste, à la taille fixe la plus proche
+    de ?size=, en WebP si le navigateur l'accepte
+    """
+    track = Track.query.get_or_404(track_id)
+    key = cover_store.add_file(track.file_path)
+    if key is None:
+        return jsonify({'error': 'Aucune pochette pour cette piste'}), 404
+
+    size = cover_store.fit_size(request.args.get('size', type=int))
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpg'
+    response = redirect(url_for('images.get_cover', key=key, size=size, fmt=fmt))
+    # La pochette d'une piste peut changer : la redirection n'est gardée que peu de temps
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    response.headers['Vary'] = 'Accept'
+    return response
+
+@images_bp.route('/img/<source>/<name>', methods=['GET'])
+@login_required
+def get_image(source, name):
+    """
+    Variante réduite d'une image : /img/playlists/<fichier>?w=300&fmt=webp
+    ou /img/covers/<clé>?w=150 (fmt par défaut : WebP si accepté)
+    """
+    fmt = request.args.get('fmt')
+    if fmt is None:
+        fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpg'
+    try:
+        result = image_resizer.get(
+            source, name,
+            width=request.args.get('w', type=int),
+            height=request.args.get('h', type=int),
+            fmt=fmt
+        )
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except ServiceError as e:
+        return jsonify({'error': str(e)}), 503
+    if result is None:
+        abort(404)
+
+    path, key = result
+    response = send_file(path, mimetype=OUTPUT_FORMATS[fmt][2], etag=key, max_age=31536000)
+    # Les noms d'images envoyées sont uniques et les pochettes adressées par contenu
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    if 'fmt' not in request.args:
+        response.headers['Vary'] = 'Accept'
+    return response
+
+@images_bp.route('/api/covers/stats', methods=['GET'])
+@login_required
+def cover_stats():
+    """Statistiques du stockage des pochettes et des variantes dérivées"""
+    return jsonify({'covers': cover_store.get_stats(), 'derived': image_resizer.get_stats()})
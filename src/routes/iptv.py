@@ -3,9 +3,12 @@ Routes pour l'IPTV.
 Gère l'accès aux flux IPTV.
 """
 
-from flask import Blueprint, jsonify, request, render_template
-from flask_login import login_required
+from flask import Blueprint, jsonify, request, render_template, redirect, Response, current_app
+from flask_login import login_required, current_user
 from ..services.iptv_scraper import IPTVScraper
+from ..services.iptv_relay import iptv_relay, is_public_url
+from ..utils.exceptions import ServiceError
+from ..utils.bandwidth import bandwidth_governor, INTERACTIVE
 
 iptv_bp = Blueprint('iptv', __name__)
 scraper = IPTVScraper()
@@ -14,7 +17,8 @@ scraper = IPTVScraper()
 @login_required
 def iptv():
     """Page principale IPTV"""
-    return render_template('iptv.html', title='IPTV')
+    return render_template('iptv.html', title='IPTV',
+                           relay_enabled=current_app.config.get('IPTV_RELAY_ENABLED', True))
 
 # API Routes
 @iptv_bp.route('/api/iptv/streams', methods=['GET'])
@@ -58,3 +62,81 @@ async def get_categories():
     })
     
     return jsonify(list(categories.values()))
+
+
+# Relais HLS
+@iptv_bp.route('/api/iptv/relay', methods=['GET', 'POST'])
+@login_required
+def open_relay():
+    """
+    Ouvre le relais d'un flux HLS.
+    GET redirige directement vers la playlist locale, POST renvoie ses informations.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        url = data.get('url')
+        stream_id = data.get('stream_id')
+        if not url and stream_id in scraper.cache:
+            url = scraper.cache[stream_id]['url']
+    else:
+        url = request.args.get('url')
+
+    if not url:
+        return jsonify({'error': 'URL requise'}), 400
+    if not is_public_url(url):
+        return jsonify({'error': 'URL non autorisée'}), 400
+
+    channel_id = iptv_relay.open_channel(url)
+    playlist_url = iptv_relay.playlist_url(channel_id)
+
+    if request.method == 'GET':
+        return redirect(playlist_url)
+
+    return jsonify({
+        'channel_id': channel_id,
+        'playlist_url': playlist_url
+    })
+
+@iptv_bp.route('/api/iptv/relay/<channel_id>/p/<name>')
+@login_required
+def relay_playlist(channel_id, name):
+    """Sert une playlist relayée, réécrite vers les URLs locales"""
+    try:
+        text = iptv_relay.get_playlist(channel_id, name.split('.', 1)[0])
+    except KeyError:
+        return jsonify({'error': 'Flux non trouvé'}), 404
+    except ServiceError as e:
+        return jsonify({'error': str(e)}), 502
+
+    return Response(text, mimetype='application/vnd.apple.mpegurl',
+                    headers={'Cache-Control': 'no-cache'})
+
+@iptv_bp.route('/api/iptv/relay/<channel_id>/s/<name>')
+@login_required
+def relay_segment(channel_id, name):
+    """Sert un segment depuis la fenêtre glissante du relais"""
+    try:
+        content, content_type = iptv_relay.get_segment(channel_id, name.split('.', 1)[0])
+    except KeyError:
+        return jsonify({'error': 'Segment non trouvé'}), 404
+    except ServiceError as e:
+        return jsonify({'error': str(e)}), 502
+
+    body = bandwidth_governor.wrap([content], current_user.id, INTERACTIVE)
+    return Response(body, mimetype=content_type,
+                    headers={'Cache-Control': 'public, max-age=60',
+                             'Content-Length': str(len(content))})
+
+@iptv_bp.route('/api/iptv/relay/<channel_id>', methods=['DELETE'])
+@login_required
+def close_relay(channel_id):
+    """Ferme le relais d'une chaîne"""
+    if not iptv_relay.close_channel(channel_id):
+        return jsonify({'error': 'Flux non trouvé'}), 404
+    return jsonify({'message': 'Relais fermé'})
+
+@iptv_bp.route('/api/iptv/relay/stats')
+@login_required
+def relay_stats():
+    """Statistiques du relais IPTV"""
+    return jsonify(iptv_relay.get_stats())
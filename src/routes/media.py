@@ -2,9 +2,10 @@
 Routes pour la gestion des médias (conversion, sous-titres, etc.)
 """
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, send_file, current_app
 from ..utils.auth import login_required
-from ..utils.media_processor import media_processor
+from ..utils.media_processor import media_processor, PRIORITIES, INTERACTIVE
+from ..utils.bandwidth import bandwidth_governor
 from datetime import datetime
 import os
 from werkzeug.utils import secure_filename
@@ -59,22 +60,27 @@ def convert_media():
                 output_format,
                 subtitle_path=subtitle_path,
                 quality=quality,
-                schedule_time=schedule_dt
+                schedule_time=schedule_dt,
+                user_id=request.user.id
             )
             return jsonify({
                 'message': 'Conversion programmée',
                 'schedule_time': schedule_time
             })
         else:
-            output_path = media_processor.convert_media(
+            conversion_id = media_processor.convert_media(
                 input_path,
                 output_format,
                 subtitle_path=subtitle_path,
-                quality=quality
+                quality=quality,
+                priority=PRIORITIES.get(request.form.get('priority'), INTERACTIVE),
+                user_id=request.user.id
             )
+            status = media_processor.get_conversion_status(conversion_id)
             return jsonify({
                 'message': 'Conversion démarrée',
-                'output_path': output_path
+                'conversion_id': conversion_id,
+                'output_path': status['output']
             })
             
     except Exception as e:
@@ -89,22 +95,68 @@ def get_conversion_status(conversion_id):
     status = media_processor.get_conversion_status(conversion_id)
     return jsonify(status)
 
+@media_bp.route('/media/conversion/<conversion_id>', methods=['DELETE'])
+@login_required
+def cancel_conversion(conversion_id):
+    """
+    Annule une conversion en cours (ffmpeg est interrompu)
+    """
+    if not media_processor.cancel_conversion(conversion_id):
+        return jsonify({'error': 'Conversion introuvable ou déjà terminée'}), 404
+    return jsonify({'message': 'Conversion annulée'})
+
 @media_bp.route('/media/bandwidth', methods=['POST'])
 @login_required
 def set_bandwidth_limit():
     """
-    Définit une limite de bande passante
+    Reconfigure à chaud les limites de bande passante (en KB/s, null = illimité).
+
+    Accepte l'ancien format {"limit": 512} (limite globale) ou
+    {"global_kbps", "per_user_kbps", "classes": {"interactive", "background"},
+    "background_share"}.
     """
     try:
-        limit = request.json.get('limit')
-        if limit is None:
+        data = request.json or {}
+        if 'limit' in data:
+            data.setdefault('global_kbps', data['limit'])
+
+        keys = ('global_kbps', 'per_user_kbps', 'classes', 'background_share')
+        if not any(key in data for key in keys):
             return jsonify({'error': 'Limite non spécifiée'}), 400
-            
-        media_processor.set_bandwidth_limit(int(limit))
-        return jsonify({'message': 'Limite de bande passante mise à jour'})
+
+        def kbps(value):
+            return int(value) if value is not None else None
+
+        options = {}
+        if 'global_kbps' in data:
+            media_processor.set_bandwidth_limit(kbps(data['global_kbps']))
+        if 'per_user_kbps' in data:
+            options['per_user_kbps'] = kbps(data['per_user_kbps'])
+        if 'classes' in data:
+            options['class_kbps'] = {
+                name: kbps(value) for name, value in data['classes'].items()
+            }
+        if 'background_share' in data:
+            options['background_share'] = float(data['background_share'])
+        bandwidth_governor.configure(**options)
+
+        return jsonify({
+            'message': 'Limite de bande passante mise à jour',
+            'bandwidth': bandwidth_governor.get_config()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@media_bp.route('/media/bandwidth', methods=['GET'])
+@login_required
+def get_bandwidth_limit():
+    """
+    Récupère la configuration et les statistiques de bande passante
+    """
+    return jsonify(bandwidth_governor.get_config())
+
 @media_bp.route('/media/stats')
 @login_required
 def get_system_stats():
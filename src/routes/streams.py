@@ -2,7 +2,7 @@
 Routes pour la gestion des streams (IPTV et Torrents)
 """
 
-from flask import Blueprint, jsonify, request, send_file, Response
+from flask import Blueprint, jsonify, request, send_file, Response, redirect
 from ..utils.auth import login_required
 from ..utils.stream_manager import stream_manager
 import m3u8
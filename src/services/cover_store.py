@@ -0,0 +1,289 @@
+"""
+Stockage des pochettes adressé par contenu.
+
+Une pochette est identifiée par l'empreinte de ses octets : les pistes
+d'un même album partagent la même image, décodée une seule fois. Quelques
+tailles fixes sont produites en JPEG et en WebP dans un pool de threads,
+puis ne changent plus jamais, ce qui permet de les servir avec des en-têtes
+de cache immuables. Un index SQLite relie chaque fichier audio, par
+(chemin, taille, mtime), à la clé de sa pochette.
+"""
+
+import os
+import io
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Iterable, Optional
+
+import mutagen
+from PIL import Image
+
+from .tag_reader import tag_reader
+from ..utils.exceptions import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Côtés maximaux des variantes générées (pixels)
+COVER_SIZES = (96, 300, 600)
+# Formats produits et qualité d'encodage
+COVER_FORMATS = {'jpg': ('JPEG', {'quality': 85, 'progressive': True, 'optimize': True}),
+                 'webp': ('WEBP', {'quality': 80, 'method': 4})}
+MIMETYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp'}
+# Images à côté du fichier audio, à défaut de pochette intégrée
+SIDECAR_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cover_index (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    key TEXT NOT NULL
+);
+"""
+
+
+def cover_key(data: bytes) -> str:
+    """Clé d'une pochette : empreinte de ses octets"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def cover_url(key: str, size: int, fmt: str = 'jpg') -> str:
+    """Adresse publique d'une variante (servie par le blueprint images)"""
+    return f'/covers/{key}/{size}.{fmt}'
+
+
+def embedded_picture(path: str) -> Optional[bytes]:
+    """Image intégrée au fichier (ID3 APIC, FLAC/Vorbis, MP4 covr)"""
+    audio = mutagen.File(path)
+    if audio is None:
+        return None
+    pictures = getattr(audio, 'pictures', None)
+    if pictures:
+        return pictures[0].data
+    tags = audio.tags
+    if tags is None:
+        return None
+    if hasattr(tags, 'getall'):
+        frames = tags.getall('APIC')
+        if frames:
+            return frames[0].data
+    covers = tags.get('covr') if hasattr(tags, 'get') else None
+    if covers:
+        return bytes(covers[0])
+    return None
+
+
+def sidecar_picture(path: str) -> Optional[bytes]:
+    """Image de même nom que le fichier audio (piste.jpg...)"""
+    stem = os.path.splitext(path)[0]
+    for ext in SIDECAR_EXTENSIONS:
+        try:
+            with open(stem + ext, 'rb') as f:
+                return f.read()
+        except OSError:
+            continue
+    return None
+
+
+class CoverIndex:
+    """Table SQLite fichier audio -> clé de pochette ('' : pas de pochette)"""
+
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT key FROM cover_index WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (path, size, mtime_ns)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, path: str, size: int, mtime_ns: int, key: str):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO cover_index (path, size, mtime_ns, key) VALUES (?, ?, ?, ?)',
+                (path, size, mtime_ns, key)
+            )
+            self.conn.commit()
+
+
+class CoverStore:
+    """Pochettes dédupliquées, générées une fois en tailles fixes"""
+
+    def __init__(self, root: str = 'static/uploads/covers', sizes: Iterable[int] = COVER_SIZES,
+                 workers: int = 2):
+        self.root = str(root)
+        self.sizes = tuple(sorted(sizes))
+        self.workers = workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self._index = None
+        self.stats = {'generated': 0, 'deduplicated': 0, 'failed': 0}
+
+    def configure(self, root: Optional[str] = None, sizes: Optional[Iterable[int]] = None,
+                  workers: Optional[int] = None):
+        if root:
+            self.root = str(root)
+            self._index = None
+        if sizes:
+            self.sizes = tuple(sorted(int(size) for size in sizes))
+        if workers is not None:
+            self.workers = max(int(workers), 1)
+
+    @property
+    def index(self) -> CoverIndex:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._index is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._index = CoverIndex(os.path.join(self.root, 'index.db'))
+        return self._index
+
+    def _directory(self, key: str) -> str:
+        return os.path.join(self.root, key[:2])
+
+    def path_for(self, key: str, size: int, fmt: str = 'jpg') -> str:
+        return os.path.join(self._directory(key), f'{key}-{size}.{fmt}')
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self._directory(key), f'{key}.json')
+
+    def exists(self, key: str) -> bool:
+        # Le manifeste est écrit en dernier : sa présence garantit toutes les variantes
+        return os.path.exists(self._manifest_path(key))
+
+    def fit_size(self, requested: Optional[int]) -> int:
+        """Plus petite taille générée couvrant requested (la plus grande à défaut)"""
+        if not requested:
+            return self.sizes[-1]
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return self.sizes[-1]
+
+    def get(self, key: str, size: int, fmt: str = 'jpg') -> Optional[str]:
+        """Chemin d'une variante prête, ou None"""
+        if not KEY_PATTERN.match(key) or size not in self.sizes or fmt not in COVER_FORMATS:
+            return None
+        path = self.path_for(key, size, fmt)
+        return path if self.exists(key) and os.path.exists(path) else None
+
+    def add(self, data: bytes, wait: bool = True) -> str:
+        """
+        Enregistre une image et planifie ses variantes si elle est nouvelle.
+
+        Args:
+            data: Octets de l'image
+            wait: Attendre la fin de la génération
+
+        Returns:
+            Clé de la pochette
+
+        Raises:
+            ServiceError: Image illisible (si wait)
+        """
+        key = cover_key(data)
+        if self.exists(key):
+            with self.lock:
+                self.stats['deduplicated'] += 1
+            return key
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cover')
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._generate, key, data)
+                self.pending[key] = future
+            else:
+                self.stats['deduplicated'] += 1
+        if wait:
+            future.result()
+        return key
+
+    def _generate(self, key: str, data: bytes):
+        """Décode l'image une fois et écrit chaque taille dans chaque format"""
+        try:
+            image = Image.open(io.BytesIO(data))
+            width, height = image.size
+            # JPEG : décodage directement à l'échelle réduite (DCT)
+            image.draft('RGB', (self.sizes[-1], self.sizes[-1]))
+            image = image.convert('RGB')
+            os.makedirs(self._directory(key), exist_ok=True)
+            for size in reversed(self.sizes):
+                # Réduction en cascade : chaque taille part de la précédente
+                image.thumbnail((size, size), Image.LANCZOS)
+                for fmt, (format_name, options) in COVER_FORMATS.items():
+                    path = self.path_for(key, size, fmt)
+                    tmp_path = f'{path}.tmp'
+                    image.save(tmp_path, format_name, **options)
+                    os.replace(tmp_path, path)
+            manifest = {'width': width, 'height': height, 'sizes': list(self.sizes),
+                        'formats': list(COVER_FORMATS)}
+            tmp_path = f'{self._manifest_path(key)}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self._manifest_path(key))
+            with self.lock:
+                self.stats['generated'] += 1
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            with self.lock:
+                self.stats['failed'] += 1
+            raise ServiceError(f"Pochette illisible: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def add_file(self, path: str) -> Optional[str]:
+        """
+        Clé de la pochette d'un fichier audio (intégrée, ou image voisine),
+        générée au besoin. Le résultat est indexé par (chemin, taille, mtime).
+
+        Returns:
+            Clé, ou None si le fichier n'a pas de pochette lisible
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        # Sans pochette : réponse du cache des balises, l'index n'est pas consulté
+        record = tag_reader.read(path)
+        if not (record and record.has_cover) and not any(
+                os.path.exists(os.path.splitext(path)[0] + ext) for ext in SIDECAR_EXTENSIONS):
+            return None
+        known = self.index.get(path, stat.st_size, stat.st_mtime_ns)
+        if known is not None:
+            return known or None
+
+        key = ''
+        try:
+            data = embedded_picture(path) if record and record.has_cover else None
+            data = data or sidecar_picture(path)
+            if data:
+                key = self.add(data)
+        except (mutagen.MutagenError, ServiceError) as e:
+            # Une pochette illisible n'empêche pas d'utiliser la piste
+            logger.warning(f"Pochette illisible pour {path}: {str(e)}")
+        self.index.put(path, stat.st_size, stat.st_mtime_ns, key)
+        return key or None
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {**self.stats, 'pending': len(self.pending), 'sizes': list(self.sizes)}
+
+
+# Instance globale du stockage des pochettes
+cover_store = CoverStore()
@@ -5,8 +5,10 @@ Supporte également la création d'archives ZIP pour les téléchargements multi
 """
 
 import os
+import json
 import asyncio
 import aiohttp
+import threading
 import uuid
 import zipfile
 import tempfile
@@ -16,9 +18,16 @@ from datetime import datetime
 from pathlib import Path
 from pydantic import BaseModel
 
-from utils.exceptions import DownloadError, ValidationError
+from ..utils.exceptions import DownloadError, ValidationError, TaskCancelled
+from .scheduler import download_scheduler, INTERACTIVE, BATCH
+from ..utils.process_control import remove_partial_files
+from .spotdl import run_spotdl, spotify_track_id, SPOTDL_BATCH_SIZE
 
-from utils.deezer import DeezerClient
+# Taille des écritures sur disque (les segments sont alignés dessus)
+WRITE_CHUNK_SIZE = 1024 * 1024
+# Taille à partir de laquelle un fichier est découpé en segments parallèles
+SEGMENT_THRESHOLD = 16 * 1024 * 1024
+MAX_SEGMENTS = 4
 
 class DownloadStatus(BaseModel):
     id: str
@@ -51,24 +60,43 @@ class BatchStatus(BaseModel):
     playlist_title: Optional[str]
 
 class DownloadManager:
-    def __init__(self):
+    def __init__(self, download_dir: str = "downloads"):
+        self.download_dir = download_dir
         self.downloads: Dict[str, DownloadStatus] = {}
         self.batches: Dict[str, BatchStatus] = {}
-        self.queue = asyncio.Queue()
-        self.batch_queue = asyncio.Queue()
-        self.max_concurrent = 3
-        self.active_downloads = 0
-        self.download_lock = asyncio.Lock()
+        # Les téléchargements passent par le pool commun de l'ordonnanceur
+        self.scheduler = download_scheduler
+        self._local = threading.local()
+        
+        # Suivi des lots : les workers mettent à jour les compteurs à chaque
+        # fin de téléchargement, aucune boucle ne re-parcourt les pistes
+        self._batch_lock = threading.Lock()
+        self._batch_of: Dict[str, str] = {}  # téléchargement -> lot
+        self._batch_done: Dict[str, threading.Event] = {}
+        # Annulation coopérative des téléchargements en cours
+        self._cancel_events: Dict[str, threading.Event] = {}
+        # Pistes Spotify confiées ensemble à un même processus spotDL
+        self._groups: Dict[str, List[str]] = {}  # groupe -> téléchargements
+        self._group_of: Dict[str, str] = {}  # téléchargement -> groupe
         
         # Plus de clients API : tout passe par yt-dlp désormais
-        # Démarrer les workers
-        asyncio.create_task(self._process_queue())
-        asyncio.create_task(self._process_batch_queue())
     
-    async def add_to_queue(self, track: dict) -> str:
+    async def add_to_queue(self, track: dict, batch_id: Optional[str] = None) -> str:
         """
         Ajoute un téléchargement à la file d'attente (yt-dlp uniquement).
         """
+        status = self._register(track, batch_id)
+        # Une piste d'un lot passe après les demandes unitaires
+        self.scheduler.submit(
+            status.id, self._run_download, status.id,
+            priority=BATCH if batch_id or track.get("playlist_id") else INTERACTIVE,
+            source=track["source"],
+            user_id=track.get("user_id")
+        )
+        return status.id
+    
+    def _register(self, track: dict, batch_id: Optional[str] = None) -> DownloadStatus:
+        """Crée le statut d'un téléchargement et le rattache à son lot"""
         download_id = str(uuid.uuid4())
         
         status = DownloadStatus(
@@ -88,41 +116,164 @@ class DownloadManager:
             playlist_title=track.get("playlist_title")
         )
         self.downloads[download_id] = status
-        await self.queue.put(download_id)
-        return download_id
-
-    async def _process_queue(self):
-        while True:
-            download_id = await self.queue.get()
-            status = self.downloads[download_id]
+        if batch_id:
+            # Rattacher au lot avant l'exécution : la fin peut arriver très vite
+            with self._batch_lock:
+                self._batch_of[download_id] = batch_id
+                self.batches[batch_id].tracks.append(status)
+        return status
+    
+    def _queue_spotify_group(self, tracks: List[dict], batch_id: str) -> List[str]:
+        """
+        Met en file des pistes Spotify d'un lot comme une seule tâche :
+        un processus spotDL les télécharge toutes (son démarrage est lent).
+        """
+        group_id = f"spotdl-{uuid.uuid4()}"
+        download_ids = [self._register(track, batch_id).id for track in tracks]
+        self._groups[group_id] = download_ids
+        for download_id in download_ids:
+            self._group_of[download_id] = group_id
+        self.scheduler.submit(
+            group_id, self._run_spotify_group, group_id,
+            priority=BATCH,
+            source="spotify",
+            user_id=tracks[0].get("user_id")
+        )
+        return download_ids
+    
+    async def _run_spotify_group(self, group_id: str):
+        """Télécharge les pistes d'un groupe Spotify en un seul appel à spotDL"""
+        download_ids = self._groups.get(group_id, [])
+        active = [self.downloads[i] for i in download_ids if self.downloads[i].status != "cancelled"]
+        cancel_event = self._cancel_events.setdefault(group_id, threading.Event())
+        for status in active:
+            status.status = "downloading"
+            status.started_at = datetime.now()
+            self._batch_started(status.id)
+        try:
+            if not active:
+                return
             try:
-                await self._download_with_ytdlp(status)
+                files = await asyncio.to_thread(
+                    run_spotdl, [status.url for status in active], 'static/music', cancel_event
+                )
+            except TaskCancelled:
+                for status in active:
+                    status.status = "cancelled"
+                    status.completed_at = status.completed_at or datetime.now()
+                return
             except Exception as e:
-                status.status = 'error'
-                status.error = str(e)
-            self.queue.task_done()
+                for status in active:
+                    status.status = "error"
+                    status.error = str(e)
+                    status.completed_at = datetime.now()
+                return
+            
+            for status in active:
+                paths = files.get(status.url) or []
+                if status.status == "cancelled":
+                    # Annulée pendant l'exécution du groupe : ne pas garder le fichier
+                    remove_partial_files(paths)
+                    continue
+                if paths:
+                    status.status = "completed"
+                    status.file_path = paths[0]
+                    status.progress = 100
+                else:
+                    status.status = "error"
+                    status.error = "spotDL n'a produit aucun fichier pour cette piste"
+                status.completed_at = datetime.now()
+        finally:
+            self._cancel_events.pop(group_id, None)
+            self._groups.pop(group_id, None)
+            for download_id in download_ids:
+                self._group_of.pop(download_id, None)
+                self._settle(download_id, self.downloads[download_id].status)
+
+    async def _run_download(self, download_id: str):
+        """
+        Exécute un téléchargement lorsqu'un worker de l'ordonnanceur est libre.
+        """
+        status = self.downloads[download_id]
+        
+        # Annulé après sa sortie de file : cancel_download n'a pas pu le compter
+        if status.status == "cancelled":
+            self._settle(download_id, "cancelled")
+            return
+        
+        status.started_at = datetime.now()
+        self._batch_started(download_id)
+        cancel_event = self._cancel_events.setdefault(download_id, threading.Event())
+        try:
+            await self._download_with_ytdlp(status, cancel_event)
+        finally:
+            self._cancel_events.pop(download_id, None)
+            self._settle(download_id, status.status)
+    
+    def _batch_started(self, download_id: str):
+        """Passe le lot en cours de traitement à la première piste démarrée"""
+        with self._batch_lock:
+            batch = self.batches.get(self._batch_of.get(download_id))
+            if batch and batch.status == "pending":
+                batch.status = "processing"
+                batch.started_at = datetime.now()
+    
+    def _settle(self, download_id: str, outcome: str):
+        """
+        Compte la fin d'un téléchargement dans son lot (une seule fois : le
+        rattachement est retiré) et termine le lot quand toutes ses pistes
+        sont réglées.
+        """
+        with self._batch_lock:
+            batch_id = self._batch_of.pop(download_id, None)
+            batch = self.batches.get(batch_id)
+            if not batch:
+                return
+            if outcome == "completed":
+                batch.completed_tracks += 1
+            elif outcome == "cancelled":
+                batch.cancelled_tracks += 1
+            else:
+                batch.failed_tracks += 1
+            
+            done = batch.completed_tracks + batch.failed_tracks + batch.cancelled_tracks
+            if done == batch.total_tracks:
+                if batch.status != "cancelled":
+                    batch.status = "completed"
+                    batch.completed_at = datetime.now()
+                self._batch_done.pop(batch_id).set()
 
-    async def _download_with_ytdlp(self, status):
-        """Télécharge une piste ou playlist via yt-dlp (scrapping only) ou spotDL pour Spotify."""
+    async def _download_with_ytdlp(self, status, cancel_event: Optional[threading.Event] = None):
+        """
+        Télécharge une piste ou playlist via yt-dlp (scrapping only) ou spotDL pour Spotify.
+        
+        Une annulation interrompt yt-dlp depuis son hook de progression ou
+        termine le groupe de processus de spotDL ; les fichiers partiels
+        sont supprimés.
+        """
         import yt_dlp
-        import subprocess
         import os
-        import glob
-        import shlex
+        cancel_event = cancel_event or threading.Event()
+        started = datetime.now().timestamp()
+        partials = set()
+        
+        def check_cancelled(d):
+            partials.update(p for p in (d.get('tmpfilename'), d.get('filename'),
+                                        (d.get('info_dict') or {}).get('filepath')) if p)
+            if cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled('Téléchargement annulé')
+        
         status.status = 'downloading'
         try:
             if 'spotify.com/track' in status.url or 'spotify.com/playlist' in status.url or 'spotify.com/album' in status.url:
                 # Utiliser spotDL (nécessite spotdl installé dans le venv)
                 output_dir = 'static/music'
                 os.makedirs(output_dir, exist_ok=True)
-                # Appel spotdl
-                cmd = f"spotdl --path {shlex.quote(output_dir)} {shlex.quote(status.url)}"
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise Exception(f"spotDL error: {result.stderr}")
-                # Chercher le dernier fichier téléchargé
-                files = sorted(glob.glob(os.path.join(output_dir, '*.mp3')), key=os.path.getmtime, reverse=True)
-                status.file_path = files[0] if files else None
+                # Répertoire propre à l'exécution : chemins exacts, sans parcourir la bibliothèque
+                files = await asyncio.to_thread(run_spotdl, [status.url], output_dir, cancel_event)
+                if not files[status.url]:
+                    raise Exception("spotDL n'a produit aucun fichier")
+                status.file_path = files[status.url][0]
                 status.status = 'completed'
                 status.progress = 100
                 status.completed_at = datetime.now()
@@ -136,7 +287,9 @@ class DownloadManager:
                         'preferredquality': '192',
                     }],
                     'quiet': True,
-                    'no_warnings': True
+                    'no_warnings': True,
+                    'progress_hooks': [check_cancelled],
+                    'postprocessor_hooks': [check_cancelled]
                 }
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                     info = ydl.extract_info(status.url, download=True)
@@ -144,16 +297,16 @@ class DownloadManager:
                     status.file_path = ydl.prepare_filename(info)
                     status.progress = 100
                     status.completed_at = datetime.now()
+        except (TaskCancelled, yt_dlp.utils.DownloadCancelled):
+            status.status = 'cancelled'
+            status.completed_at = status.completed_at or datetime.now()
+            candidates = set(partials)
+            candidates.update(f"{path}.part" for path in partials)
+            remove_partial_files(candidates, since=started - 1)
         except Exception as e:
             status.status = 'error'
             status.error = str(e)
             status.completed_at = datetime.now()
-
-        
-        self.downloads[download_id] = status
-        await self.queue.put(download_id)
-        
-        return download_id
     
     async def create_batch(
         self,
@@ -166,18 +319,10 @@ class DownloadManager:
         """
         batch_id = str(uuid.uuid4())
         
-        # Créer les téléchargements individuels
-        download_ids = []
-        for track in tracks:
-            track["playlist_id"] = playlist_id
-            track["playlist_title"] = playlist_title
-            download_id = await self.add_to_queue(track)
-            download_ids.append(download_id)
-        
-        # Créer le statut du lot
+        # Créer le statut du lot (les pistes y sont ajoutées à la mise en file)
         batch_status = BatchStatus(
             id=batch_id,
-            tracks=[self.downloads[did] for did in download_ids],
+            tracks=[],
             total_tracks=len(tracks),
             completed_tracks=0,
             failed_tracks=0,
@@ -191,10 +336,40 @@ class DownloadManager:
         )
         
         self.batches[batch_id] = batch_status
-        await self.batch_queue.put(batch_id)
+        if not tracks:
+            batch_status.status = "completed"
+            batch_status.completed_at = datetime.now()
+            return batch_id
+        self._batch_done[batch_id] = threading.Event()
+        
+        # Créer les téléchargements individuels ; les pistes Spotify sont
+        # regroupées par processus spotDL
+        spotify_tracks = []
+        for track in tracks:
+            track["playlist_id"] = playlist_id
+            track["playlist_title"] = playlist_title
+            if spotify_track_id(track["url"]):
+                spotify_tracks.append(track)
+            else:
+                await self.add_to_queue(track, batch_id=batch_id)
+        for start in range(0, len(spotify_tracks), SPOTDL_BATCH_SIZE):
+            self._queue_spotify_group(spotify_tracks[start:start + SPOTDL_BATCH_SIZE], batch_id)
         
         return batch_id
     
+    async def wait_batch(self, batch_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Attend la fin d'un lot sans scruter ses pistes.
+        
+        Returns:
+            True si le lot est terminé
+        """
+        with self._batch_lock:
+            event = self._batch_done.get(batch_id)
+        if event is None:
+            return batch_id in self.batches
+        return await asyncio.to_thread(event.wait, timeout)
+    
     async def get_status(self, download_id: str) -> dict:
         """
         Récupère le statut d'un téléchargement.
@@ -206,7 +381,8 @@ class DownloadManager:
     
     async def get_batch_status(self, batch_id: str) -> dict:
         """
-        Récupère le statut d'un lot de téléchargements.
+        Récupère le statut d'un lot de téléchargements (compteurs tenus à jour
+        par les workers, sans parcours des pistes).
         """
         if batch_id not in self.batches:
             raise ValidationError(f"Lot {batch_id} non trouvé")
@@ -226,6 +402,25 @@ class DownloadManager:
             
         status.status = "cancelled"
         status.completed_at = datetime.now()
+        group_id = self._group_of.get(download_id)
+        if group_id:
+            # Piste d'un groupe spotDL : le groupe n'est arrêté que si toutes ses pistes le sont
+            members = self._groups.get(group_id, [])
+            if all(self.downloads[i].status == "cancelled" for i in members):
+                if self.scheduler.cancel(group_id):
+                    self._groups.pop(group_id, None)
+                    for member in members:
+                        self._group_of.pop(member, None)
+                        self._settle(member, "cancelled")
+                else:
+                    self._cancel_events.setdefault(group_id, threading.Event()).set()
+            return
+        # Encore en file : aucun worker ne la comptera, la régler ici
+        if self.scheduler.cancel(download_id):
+            self._settle(download_id, "cancelled")
+        else:
+            # En cours : le worker s'arrête au prochain hook ou tue spotDL
+            self._cancel_events.setdefault(download_id, threading.Event()).set()
     
     async def cancel_batch(self, batch_id: str):
         """
@@ -246,222 +441,209 @@ class DownloadManager:
             if track.status == "pending":
                 await self.cancel_download(track.id)
     
-    async def _process_queue(self):
-        """
-        Traite la file d'attente des téléchargements.
-        """
-        while True:
-            try:
-                # Attendre qu'il y ait de la place
-                async with self.download_lock:
-                    if self.active_downloads >= self.max_concurrent:
-                        await asyncio.sleep(1)
-                        continue
-                    
-                    self.active_downloads += 1
-                
-                # Récupérer le prochain téléchargement
-                download_id = await self.queue.get()
-                status = self.downloads[download_id]
-                
-                # Vérifier si le téléchargement n'a pas été annulé
-                if status.status == "cancelled":
-                    self.queue.task_done()
-                    continue
-                
-                # Mettre à jour le statut
-                status.status = "downloading"
-                status.started_at = datetime.now()
-                
-                try:
-                    # Télécharger selon la source
-                    if status.source == "spotify":
-                        await self._download_spotify(status)
-                    elif status.source == "youtube":
-                        await self._download_youtube(status)
-                    elif status.source == "soundcloud":
-                        await self._download_soundcloud(status)
-                    elif status.source == "deezer":
-                        await self._download_deezer(status)
-                    else:
-                        raise DownloadError(f"Source non supportée: {status.source}")
-                    
-                    # Marquer comme terminé
-                    status.status = "completed"
-                    status.progress = 100.0
-                    status.completed_at = datetime.now()
-                    
-                except Exception as e:
-                    status.status = "error"
-                    status.error = str(e)
-                    status.completed_at = datetime.now()
-                
-                finally:
-                    # Libérer un slot
-                    async with self.download_lock:
-                        self.active_downloads -= 1
-                    
-                    self.queue.task_done()
-                
-            except Exception as e:
-                print(f"Erreur dans le worker de téléchargement: {e}")
-                await asyncio.sleep(1)
-    
-    async def _process_batch_queue(self):
+    def _get_session(self) -> aiohttp.ClientSession:
         """
-        Traite la file d'attente des lots.
+        Session HTTP partagée par les téléchargements d'un même worker.
+        
+        Chaque worker de l'ordonnanceur garde sa boucle d'événements : la
+        session (et son pool de connexions) est donc conservée par thread.
         """
-        while True:
-            try:
-                # Récupérer le prochain lot
-                batch_id = await self.batch_queue.get()
-                batch = self.batches[batch_id]
-                
-                # Vérifier si le lot n'a pas été annulé
-                if batch.status == "cancelled":
-                    self.batch_queue.task_done()
-                    continue
-                
-                # Mettre à jour le statut
-                batch.status = "processing"
-                batch.started_at = datetime.now()
-                
-                try:
-                    # Attendre que tous les téléchargements soient terminés
-                    while True:
-                        # Compter les téléchargements terminés
-                        completed = 0
-                        failed = 0
-                        cancelled = 0
-                        
-                        for track in batch.tracks:
-                            if track.status == "completed":
-                                completed += 1
-                            elif track.status == "error":
-                                failed += 1
-                            elif track.status == "cancelled":
-                                cancelled += 1
-                        
-                        # Mettre à jour les compteurs
-                        batch.completed_tracks = completed
-                        batch.failed_tracks = failed
-                        batch.cancelled_tracks = cancelled
-                        
-                        # Vérifier si tout est terminé
-                        total_done = completed + failed + cancelled
-                        if total_done == batch.total_tracks:
-                            break
-                        
-                        await asyncio.sleep(1)
-                    
-                    # Marquer comme terminé
-                    batch.status = "completed"
-                    batch.completed_at = datetime.now()
-                    
-                except Exception as e:
-                    print(f"Erreur dans le traitement du lot: {e}")
-                
-                finally:
-                    self.batch_queue.task_done()
-                
-            except Exception as e:
-                print(f"Erreur dans le worker de lots: {e}")
-                await asyncio.sleep(1)
+        session = getattr(self._local, 'session', None)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+            )
+            self._local.session = session
+        return session
     
-    async def _download_spotify(self, status: DownloadStatus):
+    async def _download_file(self, url: str, status: DownloadStatus):
         """
-        Télécharge une piste Spotify.
+        Télécharge un fichier avec suivi de progression et reprise.
+        
+        Aucun chemin de l'application n'y mène : les téléchargements passent
+        par yt-dlp (_download_with_ytdlp), qui reprend lui-même ses .part.
+        
+        Les octets sont écrits dans un fichier .part ; l'état de chaque
+        segment est enregistré à côté (.part.json) pour reprendre avec des
+        requêtes Range après une erreur ou un redémarrage. La reprise n'est
+        acceptée que si l'ETag (ou Last-Modified) et la taille n'ont pas
+        changé. Les gros fichiers sont découpés en segments téléchargés en
+        parallèle, et le fichier terminé est mis en place atomiquement.
         """
         try:
-            # Obtenir l'URL de téléchargement
-            download_url = await self.spotify.get_download_url(status.url)
+            # Créer le dossier de destination
+            os.makedirs(self.download_dir, exist_ok=True)
             
-            # Télécharger le fichier
-            await self._download_file(download_url, status)
+            # Générer le nom du fichier
+            filename = f"{status.title} - {status.artist or 'Unknown'}"
+            filename = "".join(c for c in filename if c.isalnum() or c in "- ") + ".mp3"
+            filepath = os.path.join(self.download_dir, filename)
+            part_path = f"{filepath}.part"
+            state_path = f"{part_path}.json"
             
-        except Exception as e:
-            raise DownloadError(f"Erreur Spotify: {str(e)}")
-    
-    async def _download_youtube(self, status: DownloadStatus):
-        """
-        Télécharge une vidéo YouTube.
-        """
-        try:
-            # Obtenir l'URL de téléchargement
-            download_url = await self.youtube.get_download_url(status.url)
+            session = self._get_session()
+            remote = await self._probe(session, url)
+            state = self._load_part_state(state_path, part_path, url, remote)
             
-            # Télécharger le fichier
-            await self._download_file(download_url, status)
+            if remote['ranges'] and remote['total']:
+                if state is None:
+                    # Nouveau téléchargement : réserver la taille finale
+                    state = {
+                        'url': url,
+                        'validator': remote['validator'],
+                        'total': remote['total'],
+                        'segments': self._split_segments(remote['total'])
+                    }
+                    with open(part_path, 'wb') as f:
+                        f.truncate(remote['total'])
+                    self._save_part_state(state_path, state)
+                await self._download_segments(session, url, part_path, state_path, state, status)
+            else:
+                # Le serveur ne permet pas la reprise : flux unique depuis le début
+                await self._download_stream(session, url, part_path, status, remote['total'])
             
-        except Exception as e:
-            raise DownloadError(f"Erreur YouTube: {str(e)}")
-    
-    async def _download_soundcloud(self, status: DownloadStatus):
-        """
-        Télécharge une piste SoundCloud.
-        """
-        try:
-            # Obtenir l'URL de téléchargement
-            download_url = await self.soundcloud.get_download_url(status.url)
+            if remote['total'] and os.path.getsize(part_path) != remote['total']:
+                raise DownloadError("Taille du fichier téléchargé incorrecte")
             
-            # Télécharger le fichier
-            await self._download_file(download_url, status)
+            os.replace(part_path, filepath)
+            if os.path.exists(state_path):
+                os.remove(state_path)
             
+            # Mettre à jour le chemin du fichier
+            status.file_path = filepath
+            
+        except DownloadError:
+            raise
         except Exception as e:
-            raise DownloadError(f"Erreur SoundCloud: {str(e)}")
+            raise DownloadError(f"Erreur de téléchargement: {str(e)}")
     
-    async def _download_deezer(self, status: DownloadStatus):
+    async def _probe(self, session: aiohttp.ClientSession, url: str) -> dict:
+        """Récupère la taille, le validateur et la prise en charge des Range"""
+        async with session.head(url, allow_redirects=True) as response:
+            if response.status >= 400:
+                raise DownloadError(f"Erreur HTTP {response.status}: {response.reason}")
+            total = int(response.headers.get("content-length", 0)) or None
+            return {
+                'total': total,
+                'validator': response.headers.get("etag") or response.headers.get("last-modified"),
+                'ranges': response.headers.get("accept-ranges", "").lower() == "bytes"
+            }
+    
+    @staticmethod
+    def _split_segments(total: int) -> List[List[int]]:
         """
-        Télécharge une piste Deezer.
+        Découpe [0, total) en segments [début, fin exclue, octets reçus],
+        alignés sur la taille des écritures.
         """
+        count = 1
+        if total >= SEGMENT_THRESHOLD:
+            count = min(MAX_SEGMENTS, total // SEGMENT_THRESHOLD + 1)
+        size = -(-total // count // WRITE_CHUNK_SIZE) * WRITE_CHUNK_SIZE
+        return [[start, min(start + size, total), 0] for start in range(0, total, size)]
+    
+    @staticmethod
+    def _load_part_state(state_path: str, part_path: str, url: str, remote: dict) -> Optional[dict]:
+        """Retourne l'état de reprise s'il correspond toujours à la ressource distante"""
         try:
-            # Obtenir l'URL de téléchargement
-            download_url = await self.deezer.get_download_url(status.url)
-            
-            # Télécharger le fichier
-            await self._download_file(download_url, status)
-            
-        except Exception as e:
-            raise DownloadError(f"Erreur Deezer: {str(e)}")
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('url') == url
+                and state.get('validator') is not None
+                and state.get('validator') == remote['validator']
+                and state.get('total') == remote['total']
+                and os.path.exists(part_path)
+                and os.path.getsize(part_path) == remote['total']):
+            return state
+        return None
     
-    async def _download_file(self, url: str, status: DownloadStatus):
-        """
-        Télécharge un fichier avec suivi de progression.
-        """
+    @staticmethod
+    def _save_part_state(state_path: str, state: dict):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    
+    async def _download_segments(self, session: aiohttp.ClientSession, url: str, part_path: str,
+                                 state_path: str, state: dict, status: DownloadStatus):
+        """Télécharge en parallèle les segments restants dans le fichier .part"""
+        total = state['total']
+        state_lock = asyncio.Lock()
+        
+        async def save_progress():
+            async with state_lock:
+                done = sum(segment[2] for segment in state['segments'])
+                status.progress = (done / total) * 100
+                await asyncio.to_thread(self._save_part_state, state_path, state)
+        
+        async def fetch(segment: List[int]):
+            start, end, received = segment
+            if start + received >= end:
+                return
+            headers = {"Range": f"bytes={start + received}-{end - 1}"}
+            if state['validator']:
+                headers["If-Range"] = state['validator']
+            async with session.get(url, headers=headers) as response:
+                if response.status != 206:
+                    # Ressource modifiée ou Range ignoré : la reprise est impossible
+                    raise DownloadError(f"Reprise refusée par le serveur (HTTP {response.status})")
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer += chunk
+                    if len(buffer) >= WRITE_CHUNK_SIZE:
+                        data = bytes(buffer[:WRITE_CHUNK_SIZE])
+                        del buffer[:WRITE_CHUNK_SIZE]
+                        await asyncio.to_thread(os.pwrite, fd, data, start + segment[2])
+                        segment[2] += len(data)
+                        await save_progress()
+                if buffer:
+                    await asyncio.to_thread(os.pwrite, fd, bytes(buffer), start + segment[2])
+                    segment[2] += len(buffer)
+                    await save_progress()
+            if start + segment[2] != end:
+                raise DownloadError("Segment incomplet")
+        
+        fd = os.open(part_path, os.O_WRONLY)
+        tasks = [asyncio.ensure_future(fetch(segment)) for segment in state['segments']]
         try:
-            # Créer le dossier de destination
-            os.makedirs("downloads", exist_ok=True)
-            
-            # Générer le nom du fichier
-            filename = f"{status.title} - {status.artist or 'Unknown'}.mp3"
-            filename = "".join(c for c in filename if c.isalnum() or c in "- ")
-            filepath = os.path.join("downloads", filename)
-            
-            # Télécharger le fichier
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise DownloadError(
-                            f"Erreur HTTP {response.status}: {response.reason}"
-                        )
-                    
-                    # Obtenir la taille totale
-                    total_size = int(response.headers.get("content-length", 0))
-                    
-                    # Écrire le fichier
-                    with open(filepath, "wb") as f:
-                        downloaded = 0
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                status.progress = (downloaded / total_size) * 100
-            
-            # Mettre à jour le chemin du fichier
-            status.file_path = filepath
+            await asyncio.gather(*tasks)
+            await asyncio.to_thread(os.fsync, fd)
+        except BaseException:
+            # Un segment en échec arrête les autres avant la fermeture du fichier
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            os.close(fd)
+    
+    async def _download_stream(self, session: aiohttp.ClientSession, url: str, part_path: str,
+                               status: DownloadStatus, total: Optional[int]):
+        """Télécharge d'un seul tenant, sans reprise possible"""
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise DownloadError(
+                    f"Erreur HTTP {response.status}: {response.reason}"
+                )
+            total = total or int(response.headers.get("content-length", 0))
             
-        except Exception as e:
-            raise DownloadError(f"Erreur de téléchargement: {str(e)}")
+            f = await asyncio.to_thread(open, part_path, "wb")
+            try:
+                downloaded = 0
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer += chunk
+                    downloaded += len(chunk)
+                    if len(buffer) >= WRITE_CHUNK_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                    if total > 0:
+                        status.progress = (downloaded / total) * 100
+                if buffer:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+            finally:
+                await asyncio.to_thread(f.close)
 
 
 # Fonctions utilitaires pour les téléchargements multi-appareils
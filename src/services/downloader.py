@@ -2,13 +2,26 @@ import os
 import json
 import uuid
 import logging
+import time
+import tempfile
 import threading
 import yt_dlp
 from pathlib import Path
-from typing import Dict, Optional, List, Union
+from typing import Dict, Optional, List, Set, Union
 from dataclasses import dataclass, asdict, field
 from datetime import datetime, UTC
 
+from ..utils.bandwidth import bandwidth_governor, BACKGROUND
+from .scheduler import download_scheduler, INTERACTIVE, BATCH
+from .job_store import JobStore, ACTIVE_STATUSES
+from ..utils.events import event_bus, DOWNLOADS
+from ..utils.media_ids import canonicalize_url, media_key, content_hash
+from .media_info import media_info, FORMATS_TTL
+from ..utils.process_control import run_cancellable, kill_children, remove_partial_files
+from ..utils.exceptions import TaskCancelled
+from .ingest import ingest_pipeline
+from .spotdl import run_spotdl
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -22,24 +35,75 @@ class DownloadTask:
     error: Optional[str] = None
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
+    user_id: Optional[int] = None
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    priority: int = INTERACTIVE
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    # Une playlist est développée en pistes filles (parent_id) agrégées par le lot
+    kind: str = 'track'  # track, playlist
+    parent_id: Optional[str] = None
+    total_tracks: int = 0
+    completed_tracks: int = 0
+    failed_tracks: int = 0
+    # Dédoublonnage : média désigné par l'URL et empreinte du fichier obtenu
+    media_key: Optional[str] = None
+    content_hash: Optional[str] = None
+    
+    # Champs de date stockés en ISO 8601 dans la table des tâches
+    DATE_FIELDS = ('start_time', 'end_time', 'created_at')
     
     def to_dict(self):
         result = asdict(self)
-        result['start_time'] = self.start_time.isoformat() if self.start_time else None
-        result['end_time'] = self.end_time.isoformat() if self.end_time else None
+        for name in self.DATE_FIELDS:
+            value = getattr(self, name)
+            result[name] = value.isoformat() if value else None
         return result
+    
+    @classmethod
+    def from_row(cls, row: Dict) -> 'DownloadTask':
+        """Reconstruit une tâche depuis une ligne de la table des tâches"""
+        values = {name: row[name] for name in cls.__dataclass_fields__ if name in row}
+        for name in cls.DATE_FIELDS:
+            if values.get(name):
+                values[name] = datetime.fromisoformat(values[name])
+        return cls(**values)
 
 class DownloadManager:
-    def __init__(self, download_dir: Path):
+    # Intervalle minimal entre deux enregistrements de la progression
+    PROGRESS_SAVE_INTERVAL = 1.0
+    # Tentatives par piste d'une playlist avant de la compter en échec
+    MAX_TRACK_ATTEMPTS = 3
+    # Champs poussés à chaque appel du hook de progression
+    PROGRESS_FIELDS = ('status', 'progress', 'downloaded_bytes', 'total_bytes', 'error', 'parent_id')
+    # Fichiers annexes produits par yt-dlp à côté d'un fichier téléchargé
+    SIDE_FILE_SUFFIXES = ('.part', '.ytdl', '.mp3', '.temp.mp3', '.info.json', '.webp', '.jpg', '.png')
+    
+    def __init__(self, download_dir: Path, db_path: Optional[str] = None):
         self.download_dir = download_dir
+        # Seules les tâches vivantes restent en mémoire ; l'historique est en base
         self.tasks: Dict[str, DownloadTask] = {}
+        self.saved_at: Dict[str, float] = {}
+        # Utilisateurs rattachés à une tâche demandée avant eux par un autre
+        self.watchers: Dict[str, Set[int]] = {}
+        # Balises fournies avec la demande, reprises à l'intégration du fichier
+        self.ingest_tags: Dict[str, Dict[str, str]] = {}
+        # Annulation coopérative : signal par tâche et fichiers écrits par yt-dlp
+        self.cancel_events: Dict[str, threading.Event] = {}
+        self.partials: Dict[str, Set[str]] = {}
+        self._current = threading.local()
         self.lock = threading.Lock()
-        self.active_threads: List[threading.Thread] = []
+        # Sérialise la recherche d'un doublon et la création de la tâche
+        self.dedupe_lock = threading.Lock()
+        self.scheduler = download_scheduler
         
         # Créer le répertoire de téléchargement s'il n'existe pas
         if not os.path.exists(download_dir):
             os.makedirs(download_dir, exist_ok=True)
         
+        self.store = JobStore(db_path or os.path.join(download_dir, 'downloads.db'))
+        
         # yt-dlp options avec configuration améliorée
         self.ydl_opts = {
             # Format audio
@@ -74,15 +138,18 @@ class DownloadManager:
             'noplaylist': False,  # Permettre les playlists
             'ignoreerrors': True,  # Continuer en cas d'erreur
         }
+        
+        # Reprendre les tâches interrompues par un redémarrage
+        self.resume_pending()
     
-    def _progress_hook(self, d):
+    def _progress_hook(self, d, task_id: Optional[str] = None):
         """Hook pour suivre la progression du téléchargement"""
         # Essayer d'obtenir l'ID de la tâche de différentes façons selon la version de yt-dlp
-        task_id = None
-        if 'info_dict' in d and isinstance(d['info_dict'], dict):
-            task_id = d['info_dict'].get('id')
-        elif 'id' in d:
-            task_id = d['id']
+        if task_id is None:
+            if 'info_dict' in d and isinstance(d['info_dict'], dict):
+                task_id = d['info_dict'].get('id')
+            elif 'id' in d:
+                task_id = d['id']
             
         if not task_id:
             logger.warning(f"Impossible d'identifier la tâche pour la progression: {d.get('filename', 'unknown')}")
@@ -92,10 +159,11 @@ class DownloadManager:
             task = self.tasks.get(task_id)
             if not task:
                 return
+            self._track_partial(task_id, d.get('tmpfilename'), d.get('filename'))
                 
-            # Vérifier si la tâche a été annulée
+            # Tâche annulée : interrompre yt-dlp depuis sa boucle de téléchargement
             if task.status == 'cancelled':
-                return
+                raise yt_dlp.utils.DownloadCancelled('Téléchargement annulé')
                 
             if d['status'] == 'downloading':
                 task.status = 'downloading'
@@ -110,6 +178,13 @@ class DownloadManager:
                 if 'speed' in d and d['speed'] is not None:
                     speed_mb = d['speed'] / 1024 / 1024  # Convertir en MB/s
                     task.error = f"Téléchargement en cours: {speed_mb:.2f} MB/s"
+
+                # Octets reçus depuis le dernier appel, à soumettre au gouverneur
+                downloaded = d.get('downloaded_bytes') or 0
+                delta = max(downloaded - task.downloaded_bytes, 0)
+                task.downloaded_bytes = downloaded
+                task.total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or task.total_bytes
+                user_id = task.user_id
                     
             elif d['status'] == 'finished':
                 task.status = 'converting'
@@ -120,103 +195,588 @@ class DownloadManager:
                 task.status = 'failed'
                 task.error = str(d.get('error', 'Erreur inconnue'))
                 task.end_time = datetime.now()
+
+        self._save_progress(task_id, force=d['status'] != 'downloading')
+        self._publish(task, immediate=d['status'] != 'downloading', fields=self.PROGRESS_FIELDS)
+
+        # Le hook est appelé dans la boucle de téléchargement de yt-dlp :
+        # bloquer ici (hors verrou) ralentit réellement le transfert
+        if d['status'] == 'downloading' and delta:
+            bandwidth_governor.throttle(delta, user_id, BACKGROUND)
+    
+    def _postprocessor_hook(self, d, task_id: str):
+        """Hook des post-traitements (conversion ffmpeg) : arrêt avant chaque étape"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            self._track_partial(task_id, (d.get('info_dict') or {}).get('filepath'))
+            if task.status == 'cancelled':
+                raise yt_dlp.utils.DownloadCancelled('Téléchargement annulé')
+    
+    def _track_partial(self, task_id: str, *paths: Optional[str]):
+        """Retient les fichiers écrits pour une tâche (appelé sous le verrou)"""
+        known = self.partials.setdefault(task_id, set())
+        known.update(path for path in paths if path)
     
-    def add_download(self, url: str, service: str = 'youtube') -> str:
-        """Ajoute une nouvelle tâche de téléchargement"""
-        # Générer un ID unique pour la tâche
-        task_id = str(uuid.uuid4())[:8]
+    def _discard_partials(self, task: DownloadTask):
+        """Supprime les fichiers partiels d'une tâche annulée"""
+        with self.lock:
+            paths = self.partials.pop(task.id, set())
+        candidates = set(paths)
+        for path in paths:
+            candidates.add(f"{path}.part")
+            candidates.add(f"{path}.ytdl")
+            stem = os.path.splitext(path[:-5] if path.endswith('.part') else path)[0]
+            candidates.update(stem + suffix for suffix in self.SIDE_FILE_SUFFIXES)
+        # Un fichier antérieur à la tâche appartient à un autre téléchargement
+        since = task.start_time.timestamp() - 1 if task.start_time else None
+        removed = remove_partial_files(candidates, since)
+        if removed:
+            logger.info(f"{removed} fichier(s) partiel(s) supprimé(s) pour la tâche {task.id}")
+    
+    def _save_progress(self, task_id: str, force: bool = False):
+        """Enregistre l'avancement d'une tâche, au plus une fois par intervalle"""
+        now = time.monotonic()
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.status == 'cancelled':
+                return
+            if not force and now - self.saved_at.get(task_id, 0) < self.PROGRESS_SAVE_INTERVAL:
+                return
+            self.saved_at[task_id] = now
+            parent = self.tasks.get(task.parent_id) if task.parent_id else None
+            if parent:
+                parent.progress = self._batch_progress(parent)
+            fields = {
+                'status': task.status,
+                'progress': task.progress,
+                'downloaded_bytes': task.downloaded_bytes,
+                'total_bytes': task.total_bytes,
+                'error': task.error
+            }
+        self.store.update(task_id, only_if_active=True, **fields)
+    
+    def _publish(self, task: DownloadTask, immediate: bool = False,
+                 fields: Optional[tuple] = None):
+        """Pousse l'état d'une tâche aux clients abonnés (fusionné par le bus)"""
+        data = {name: getattr(task, name) for name in fields} if fields else task.to_dict()
+        watchers = self.watchers.get(task.id)
+        owners = frozenset({task.user_id, *watchers}) if watchers else task.user_id
+        event_bus.publish(DOWNLOADS, task.id, data, user_id=owners, immediate=immediate)
+    
+    def _finish(self, task_id: str):
+        """Enregistre l'état final d'une tâche et la retire de la mémoire"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            self.saved_at.pop(task_id, None)
+            if not task:
+                return
+            if task.status in ACTIVE_STATUSES:
+                task.status = 'failed'
+                task.error = task.error or 'Téléchargement interrompu'
+            # Une piste de playlist en échec repasse en file
+            retry = (task.status == 'failed' and task.parent_id is not None
+                     and task.attempts < self.MAX_TRACK_ATTEMPTS)
+            if retry:
+                task.status = 'pending'
+                task.progress = 0.0
+            else:
+                del self.tasks[task_id]
         
-        # Créer la tâche
-        task = DownloadTask(
-            id=task_id,
-            url=url,
-            service=service,
-            start_time=datetime.now(UTC)
-        )
+        self._publish(task, immediate=True)
+        if not retry:
+            self.watchers.pop(task_id, None)
+            self.cancel_events.pop(task_id, None)
+            with self.lock:
+                self.partials.pop(task_id, None)
+        if retry:
+            if self.store.update(task_id, only_if_active=True, status='pending', error=task.error):
+                logger.info(f"Nouvelle tentative ({task.attempts + 1}) pour {task.url}")
+                self._submit(task)
+            else:
+                # Annulée entre-temps
+                with self.lock:
+                    self.tasks.pop(task_id, None)
+            return
         
-        # Enregistrer la tâche
+        # Une tâche annulée a déjà été enregistrée par cancel_task
+        if task.status != 'cancelled':
+            self.store.update(
+                task_id, only_if_active=True,
+                status=task.status,
+                progress=task.progress,
+                downloaded_bytes=task.downloaded_bytes,
+                total_bytes=task.total_bytes,
+                filename=task.filename,
+                content_hash=task.content_hash,
+                error=task.error,
+                total_tracks=task.total_tracks,
+                end_time=(task.end_time or datetime.now()).isoformat()
+            )
+        tags = self.ingest_tags.pop(task_id, None)
+        if task.status == 'completed' and task.kind == 'track':
+            self._ingest(task, tags)
+        if task.parent_id:
+            self._child_finished(task.parent_id, task.status)
+    
+    def _ingest(self, task: DownloadTask, extra_tags: Optional[Dict[str, str]] = None):
+        """
+        Confie le fichier obtenu à la chaîne d'intégration (table tracks). Les
+        balises fournies avec la demande priment sur celles de l'aperçu.
+        """
+        if not ingest_pipeline.running or not (task.filename and os.path.isfile(task.filename)):
+            return
+        # Titre et artiste de l'aperçu, s'il est encore en cache
+        info = media_info.peek(task.url) or {}
+        tags = {
+            'title': info.get('track') or info.get('title'),
+            'artist': info.get('artist') or info.get('uploader'),
+            'album': info.get('album')
+        }
+        tags.update({key: value for key, value in (extra_tags or {}).items() if value})
+        try:
+            ingest_pipeline.submit(path=task.filename, tags=tags)
+        except Exception as e:
+            logger.warning(f"Intégration de {task.filename} impossible: {str(e)}")
+    
+    def _batch_progress(self, parent: DownloadTask) -> float:
+        """Progression d'un lot : pistes terminées et avancement des pistes en cours (sous verrou)"""
+        if not parent.total_tracks:
+            return 0.0
+        running = sum(t.progress for t in self.tasks.values() if t.parent_id == parent.id)
+        done = parent.completed_tracks + parent.failed_tracks
+        return min((done * 100 + running) / parent.total_tracks, 100.0)
+    
+    def _child_finished(self, parent_id: str, status: str):
+        """Agrège la fin d'une piste dans son lot et termine le lot à la dernière"""
         with self.lock:
-            self.tasks[task_id] = task
+            parent = self.tasks.get(parent_id)
+            if not parent or parent.status == 'cancelled':
+                return
+            if status == 'completed':
+                parent.completed_tracks += 1
+            else:
+                parent.failed_tracks += 1
+            parent.progress = self._batch_progress(parent)
+            if parent.completed_tracks + parent.failed_tracks >= parent.total_tracks:
+                parent.status = 'completed' if parent.completed_tracks else 'failed'
+                parent.progress = 100.0
+                parent.end_time = datetime.now()
+                if parent.failed_tracks:
+                    parent.error = f"{parent.failed_tracks} piste(s) en échec"
+                del self.tasks[parent_id]
+            fields = {
+                'status': parent.status,
+                'progress': parent.progress,
+                'completed_tracks': parent.completed_tracks,
+                'failed_tracks': parent.failed_tracks,
+                'error': parent.error
+            }
+            if parent.end_time:
+                fields['end_time'] = parent.end_time.isoformat()
+        self.store.update(parent_id, only_if_active=True, **fields)
+        self._publish(parent, immediate=parent.status not in ACTIVE_STATUSES)
+    
+    def _submit(self, task: DownloadTask):
+        """Confie une tâche à l'ordonnanceur"""
+        target = self._expand_playlist if task.kind == 'playlist' else self._download
+        self.scheduler.submit(task.id, target, task.id, task.url, task.service,
+                              priority=task.priority, source=task.service, user_id=task.user_id)
+    
+    def resume_pending(self) -> int:
+        """
+        Replanifie les tâches en attente ou interrompues lors du dernier arrêt.
+        yt-dlp reprend les fichiers .part déjà commencés.
         
-        # Nettoyer les threads terminés
-        self._cleanup_threads()
+        Returns:
+            Nombre de tâches replanifiées
+        """
+        rows = self.store.recover()
+        for row in rows:
+            task = DownloadTask.from_row(row)
+            if task.kind == 'playlist' and self._restore_batch(task):
+                continue
+            with self.lock:
+                self.tasks[task.id] = task
+            self._submit(task)
+        return len(rows)
+    
+    def _restore_batch(self, task: DownloadTask) -> bool:
+        """
+        Remet en mémoire un lot déjà développé (ses pistes sont reprises une à une).
+        
+        Returns:
+            False si la playlist n'a pas encore été développée
+        """
+        counts = self.store.count_children(task.id)
+        if not counts:
+            return False
+        task.total_tracks = sum(counts.values())
+        task.completed_tracks = counts.get('completed', 0)
+        task.failed_tracks = counts.get('failed', 0) + counts.get('cancelled', 0)
         
-        # Démarrer le téléchargement dans un thread séparé
-        thread = threading.Thread(target=self._download, args=(task_id, url, service))
-        thread.daemon = True
-        thread.start()
+        if task.completed_tracks + task.failed_tracks >= task.total_tracks:
+            # Arrêt survenu juste après la dernière piste : clore le lot
+            self.store.update(
+                task.id,
+                status='completed' if task.completed_tracks else 'failed',
+                progress=100.0,
+                total_tracks=task.total_tracks,
+                completed_tracks=task.completed_tracks,
+                failed_tracks=task.failed_tracks,
+                end_time=datetime.now().isoformat()
+            )
+            return True
         
-        # Garder une référence au thread
+        task.status = 'downloading'
         with self.lock:
-            self.active_threads.append(thread)
+            self.tasks[task.id] = task
+            task.progress = self._batch_progress(task)
+        self.store.update(task.id, status='downloading', total_tracks=task.total_tracks)
+        return True
+    
+    def add_download(self, url: str, service: str = 'youtube', user_id: Optional[int] = None,
+                     priority: Optional[int] = None, tags: Optional[Dict[str, str]] = None) -> str:
+        """
+        Ajoute une nouvelle tâche de téléchargement à l'ordonnanceur.
+
+        Sans priorité explicite, une playlist ou un album part en lot et une
+        piste seule en interactif.
+
+        Une demande pour un média déjà en cours (même sous une autre URL) est
+        rattachée à la tâche existante ; une piste déjà téléchargée n'est pas
+        téléchargée à nouveau.
+
+        Args:
+            tags: Titre, artiste, album connus par ailleurs, écrits à
+                l'intégration du fichier dans la bibliothèque
+
+        Returns:
+            ID de la tâche créée ou de la tâche existante
+        """
+        collection = self._is_collection_url(url)
+        if priority is None:
+            priority = BATCH if collection else INTERACTIVE
+        key = media_key(url)
+        
+        with self.dedupe_lock:
+            # Une playlist terminée est redéveloppée : elle a pu s'enrichir
+            existing = self._find_existing(key, include_completed=not collection)
+            if existing:
+                self._attach(existing, user_id)
+                return existing['id']
+            
+            # Créer la tâche
+            task = DownloadTask(
+                id=str(uuid.uuid4())[:8],
+                url=url,
+                service=service,
+                user_id=user_id,
+                priority=priority,
+                created_at=datetime.now(UTC),
+                kind='playlist' if collection else 'track',
+                media_key=key
+            )
+            
+            # Enregistrer la tâche (en base d'abord : elle survit à un redémarrage)
+            self.store.create(task.to_dict())
+            with self.lock:
+                self.tasks[task.id] = task
+                if tags and not collection:
+                    self.ingest_tags[task.id] = tags
         
-        return task_id
+        # Le téléchargement attend un worker libre du pool commun
+        self._submit(task)
+        self._publish(task, immediate=True)
         
-    def _cleanup_threads(self):
-        """Nettoie les threads terminés de la liste"""
+        return task.id
+    
+    def _find_existing(self, key: str, include_completed: bool = True) -> Optional[Dict]:
+        """Tâche vivante, ou terminée dont le fichier existe encore, pour ce média"""
+        row = self.store.find_by_key(key, include_completed)
+        if not row:
+            return None
+        if row['status'] == 'completed' and not (row['filename'] and os.path.exists(row['filename'])):
+            # Fichier supprimé depuis : retélécharger
+            return None
+        return row
+    
+    def _attach(self, row: Dict, user_id: Optional[int]):
+        """Rattache la demande d'un autre utilisateur à une tâche vivante"""
+        if row['status'] not in ACTIVE_STATUSES or user_id is None or user_id == row['user_id']:
+            return
         with self.lock:
-            # Filtrer les threads qui sont encore en vie
-            self.active_threads = [t for t in self.active_threads if t.is_alive()]
-            
-            # Limiter le nombre de tâches conservées en mémoire
-            if len(self.tasks) > 100:
-                # Garder uniquement les 50 tâches les plus récentes
-                sorted_tasks = sorted(
-                    self.tasks.items(),
-                    key=lambda x: x[1].start_time if x[1].start_time else datetime.min,
-                    reverse=True
-                )
-                self.tasks = dict(sorted_tasks[:50])
+            if row['id'] in self.tasks:
+                self.watchers.setdefault(row['id'], set()).add(user_id)
+        logger.info(f"Demande dédoublonnée rattachée à la tâche {row['id']}")
+    
+    @staticmethod
+    def _is_collection_url(url: str) -> bool:
+        """
+        Indique si l'URL désigne une playlist, un album ou un set. Une vidéo
+        ouverte depuis une liste (watch?v=...&list=...) reste une piste, comme
+        sa clé de dédoublonnage (youtube:<vidéo>).
+        """
+        if canonicalize_url(url)[0] == 'youtube':
+            return False
+        return any(marker in url for marker in ('list=', '/playlist', '/album', '/sets/'))
+        
+    def _expand_playlist(self, task_id: str, url: str, service: str):
+        """
+        Première phase d'une playlist : énumère les entrées sans télécharger,
+        puis crée une tâche par piste dans l'ordonnanceur.
+        """
+        if not self.store.claim(task_id):
+            with self.lock:
+                self.tasks.pop(task_id, None)
+            return
+        
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            task.status = 'downloading'
+            task.attempts += 1
+            task.start_time = datetime.now(UTC)
+            task.error = "Analyse de la playlist..."
+            self._current.cancel_event = self.cancel_events.setdefault(task_id, threading.Event())
+        
+        try:
+            children = self._create_children(task, self._list_entries(url, service))
+        except TaskCancelled:
+            # Annulée pendant l'analyse : cancel_task a déjà tout enregistré
+            self._finish(task_id)
+            return
+        except Exception as e:
+            logger.error(f"Erreur lors de l'analyse de la playlist {url}: {str(e)}")
+            with self.lock:
+                task.status = 'failed'
+                task.error = f"Playlist illisible: {str(e)}"
+            self._finish(task_id)
+            return
+        finally:
+            self._current.cancel_event = None
+            self.cancel_events.pop(task_id, None)
+        
+        with self.lock:
+            cancelled = task.status == 'cancelled'
+            task.total_tracks = len(children)
+            task.filename = f"Playlist: {len(children)} tracks"
+            task.error = None
+        if cancelled:
+            self.store.cancel_children(task_id, "Playlist annulée")
+            with self.lock:
+                self.tasks.pop(task_id, None)
+                for child in children:
+                    self.tasks.pop(child.id, None)
+            return
+        
+        if not children:
+            # Toutes les pistes sont déjà téléchargées ou en cours
+            with self.lock:
+                task.status = 'completed'
+                task.progress = 100.0
+                task.end_time = datetime.now()
+            self._finish(task_id)
+            return
+        
+        self.store.update(task_id, only_if_active=True, total_tracks=task.total_tracks,
+                          filename=task.filename, error=None)
+        for child in children:
+            self._submit(child)
+    
+    def _list_entries(self, url: str, service: str) -> List[Dict]:
+        """Énumère les pistes d'une playlist (titre et URL) sans rien télécharger"""
+        if self._is_spotify(url, service):
+            return self._list_spotify_entries(url)
+        
+        # Extraction à plat, partagée avec l'aperçu avant téléchargement
+        info = media_info.get_info(url)
+        
+        entries = []
+        for entry in (info or {}).get('entries') or []:
+            if not entry:
+                continue  # Vidéo supprimée ou privée
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if entry_url and not entry_url.startswith('http') and entry.get('ie_key') == 'Youtube':
+                entry_url = f"https://www.youtube.com/watch?v={entry_url}"
+            if entry_url:
+                entries.append({'url': entry_url, 'title': entry.get('title')})
+        return entries
+    
+    def _list_spotify_entries(self, url: str) -> List[Dict]:
+        """Énumère une playlist ou un album Spotify avec spotDL (métadonnées uniquement)"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            save_file = os.path.join(tmpdir, 'entries.spotdl')
+            # Groupe de processus terminé si la playlist est annulée
+            result = run_cancellable(
+                ['spotdl', 'save', url, '--save-file', save_file],
+                getattr(self._current, 'cancel_event', None), timeout=300
+            )
+            if result.returncode != 0 or not os.path.exists(save_file):
+                raise RuntimeError(f"spotDL: {result.stderr.strip() or result.stdout.strip()}")
+            with open(save_file, 'r', encoding='utf-8') as f:
+                songs = json.load(f)
+        return [{'url': song['url'], 'title': song.get('name')} for song in songs if song.get('url')]
+    
+    def _create_children(self, parent: DownloadTask, entries: List[Dict]) -> List[DownloadTask]:
+        """
+        Crée les tâches des pistes d'une playlist, sans doublons : une entrée
+        répétée, déjà téléchargée ou déjà en file n'est pas reprise.
+        """
+        children = []
+        seen = set()
+        for entry in entries:
+            url = entry['url']
+            key = media_key(url)
+            if key in seen:
+                continue
+            existing = self._find_existing(key)
+            # La playlist elle-même ne compte pas comme un doublon de ses pistes
+            if existing and existing['id'] != parent.id:
+                continue
+            seen.add(key)
+            child = DownloadTask(
+                id=str(uuid.uuid4())[:8],
+                url=url,
+                service=parent.service,
+                user_id=parent.user_id,
+                priority=BATCH,
+                created_at=datetime.now(UTC),
+                parent_id=parent.id,
+                media_key=key
+            )
+            self.store.create(child.to_dict())
+            children.append(child)
+        with self.lock:
+            for child in children:
+                self.tasks[child.id] = child
+        return children
     
     def _download(self, task_id: str, url: str, service: str):
         """Fonction interne pour gérer le téléchargement"""
+        # Réservation atomique : échoue si la tâche a été annulée pendant l'attente
+        if not self.store.claim(task_id):
+            with self.lock:
+                task = self.tasks.pop(task_id, None)
+            # Annulée juste après sa sortie de file : cancel_task ne l'a pas comptée
+            if task and task.parent_id:
+                self._child_finished(task.parent_id, 'cancelled')
+            return
+        
         with self.lock:
             task = self.tasks.get(task_id)
             if not task:
                 return
-            
             task.status = 'downloading'
-            task.start_time = datetime.now()
+            task.attempts += 1
+            task.start_time = datetime.now(UTC)
+            self.cancel_events.setdefault(task_id, threading.Event())
+        self._publish(task, immediate=True)
         
+        try:
+            if self._is_spotify(url, service):
+                self._run_spotdl(task_id, url)
+            else:
+                self._run_ytdlp(task_id, url, service)
+            self._deduplicate_file(task)
+        finally:
+            if task.status == 'cancelled':
+                self._discard_partials(task)
+            self._finish(task_id)
+    
+    def _deduplicate_file(self, task: DownloadTask):
+        """
+        Empreinte du fichier téléchargé : un contenu déjà présent dans la
+        bibliothèque est partagé (lien physique) au lieu d'être stocké deux fois.
+        """
+        with self.lock:
+            path = task.filename if task.status == 'completed' else None
+        if not path or not os.path.isfile(path):
+            return
+        try:
+            digest = content_hash(path)
+        except OSError as e:
+            logger.warning(f"Empreinte impossible pour {path}: {str(e)}")
+            return
+        
+        with self.lock:
+            task.content_hash = digest
+        existing = self.store.find_by_hash(digest, exclude_id=task.id)
+        original = existing and existing['filename']
+        if not original or not os.path.isfile(original) or os.path.samefile(original, path):
+            return
+        
+        try:
+            # Lien vers le fichier existant sous le nom demandé, de manière atomique
+            tmp_path = f"{path}.link"
+            os.link(original, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Liens physiques impossibles (autre système de fichiers) : réutiliser le fichier existant
+            os.remove(path)
+            with self.lock:
+                task.filename = original
+        logger.info(f"Contenu déjà présent ({original}), copie évitée pour {task.url}")
+    
+    def _run_ytdlp(self, task_id: str, url: str, service: str):
+        """Exécute yt-dlp pour une tâche réservée"""
         try:
             # Configuration spécifique au service
             ydl_opts = self.ydl_opts.copy()
             
-            if service == 'spotify':
-                # Pour Spotify, on utilise yt-dlp avec le plugin spotify
-                ydl_opts['extract_flat'] = True
-                ydl_opts['force_generic_extractor'] = True
-            
             # Ajouter un timeout pour éviter les blocages
             ydl_opts['socket_timeout'] = 30
             
+            # Une piste (issue d'une playlist, ou vidéo ouverte depuis une
+            # liste) ne télécharge qu'elle-même
+            with self.lock:
+                task = self.tasks.get(task_id)
+                if task and task.kind == 'track':
+                    ydl_opts['noplaylist'] = True
+            
+            # Hook lié à la tâche : l'ID yt-dlp de la vidéo n'est pas celui de la tâche
+            ydl_opts['progress_hooks'] = [lambda d: self._progress_hook(d, task_id)]
+            ydl_opts['postprocessor_hooks'] = [lambda d: self._postprocessor_hook(d, task_id)]
+            
             # Exécuter le téléchargement
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 # Vérifier si la tâche a été annulée avant de commencer
                 with self.lock:
-                    if self.tasks.get(task_id).status == 'cancelled':
+                    task = self.tasks.get(task_id)
+                    if not task or task.status == 'cancelled':
                         return
                 
                 try:
-                    info = ydl.extract_info(url, download=True)
+                    # Métadonnées récentes d'un aperçu : télécharger sans réextraire
+                    cached = media_info.peek(url, max_age=FORMATS_TTL)
+                    if cached and cached.get('formats') and not cached.get('entries'):
+                        info = ydl.process_ie_result(cached, download=True)
+                    else:
+                        info = ydl.extract_info(url, download=True)
                     
                     with self.lock:
                         task = self.tasks.get(task_id)
                         if task and task.status != 'cancelled':
                             # Vérifier si info est un dictionnaire ou une liste (playlist)
                             if isinstance(info, dict):
-                                task.filename = ydl.prepare_filename(info)
+                                # Chemin final, après extraction audio (et non celui du flux source)
+                                downloads = info.get('requested_downloads') or [{}]
+                                task.filename = downloads[0].get('filepath') or ydl.prepare_filename(info)
                             elif isinstance(info, list) and info:
                                 task.filename = f"Playlist: {len(info)} tracks"
                             
                             task.status = 'completed'
                             task.progress = 100
                             task.end_time = datetime.now()
+                except yt_dlp.utils.DownloadCancelled:
+                    logger.info(f"Téléchargement {task_id} interrompu par une annulation")
                 except yt_dlp.utils.DownloadError as e:
                     logger.error(f'Erreur yt-dlp: {str(e)}')
                     with self.lock:
                         task = self.tasks.get(task_id)
-                        if task:
+                        if task and task.status != 'cancelled':
                             task.status = 'failed'
                             task.error = f'Erreur de téléchargement: {str(e)}'
                             task.end_time = datetime.now()
@@ -225,38 +785,114 @@ class DownloadManager:
             logger.error(f'Erreur lors du téléchargement: {str(e)}')
             with self.lock:
                 task = self.tasks.get(task_id)
-                if task:
+                if task and task.status != 'cancelled':
                     task.status = 'failed'
                     task.error = f'Erreur inattendue: {str(e)}'
                     task.end_time = datetime.now()
     
-    def get_status(self, task_id: str) -> Optional[dict]:
-        """Récupère l'état d'une tâche"""
+    @staticmethod
+    def _is_spotify(url: str, service: str) -> bool:
+        return service == 'spotify' or 'spotify.com' in url or url.startswith('spotify:')
+    
+    def _run_spotdl(self, task_id: str, url: str):
+        """
+        Télécharge une piste Spotify avec spotDL (yt-dlp ne sait pas lire
+        Spotify) ; le processus est terminé si la tâche est annulée
+        """
+        cancel_event = self.cancel_events.get(task_id)
+        error = None
+        try:
+            files = run_spotdl([url], str(self.download_dir), cancel_event).get(url) or []
+            if not files:
+                error = "spotDL n'a produit aucun fichier"
+        except TaskCancelled:
+            logger.info(f"Téléchargement {task_id} interrompu par une annulation")
+            return
+        except Exception as e:
+            error = str(e)
         with self.lock:
             task = self.tasks.get(task_id)
-            return task.to_dict() if task else None
+            if not task or task.status == 'cancelled':
+                return
+            if error:
+                logger.error(f"Erreur spotDL: {error}")
+                task.status = 'failed'
+                task.error = f'Erreur de téléchargement: {error}'
+            else:
+                task.filename = files[0]
+                task.status = 'completed'
+                task.progress = 100
+            task.end_time = datetime.now()
+    
+    def get_status(self, task_id: str) -> Optional[dict]:
+        """Récupère l'état d'une tâche"""
+        task = self.get_task(task_id)
+        return task.to_dict() if task else None
     
-    def get_all_tasks(self) -> list:
-        """Récupère toutes les tâches"""
+    def list_tasks(self, page: int = 1, per_page: int = 50, status: Optional[str] = None,
+                   user_id: Optional[int] = None, parent_id: Optional[str] = None) -> Dict:
+        """
+        Historique paginé des tâches, les tâches vivantes avec leur progression courante.
+        Sans parent_id, seules les tâches de premier niveau (pistes et lots) sont listées.
+        """
+        rows, total = self.store.list(page, per_page, status, user_id, parent_id)
         with self.lock:
-            return [task.to_dict() for task in self.tasks.values()]
+            items = [
+                (self.tasks[row['id']] if row['id'] in self.tasks else DownloadTask.from_row(row)).to_dict()
+                for row in rows
+            ]
+        return {'items': items, 'total': total, 'page': page, 'per_page': per_page}
             
     def cancel_task(self, task_id: str) -> bool:
-        """Annule un téléchargement en cours"""
+        """
+        Annule un téléchargement. Une tâche en cours est interrompue : yt-dlp
+        s'arrête au prochain appel de son hook, la conversion ffmpeg et spotDL
+        sont tués, et le worker est libéré.
+        """
+        reason = 'Téléchargement annulé par l\'utilisateur'
         with self.lock:
             task = self.tasks.get(task_id)
-            if not task:
-                return False
-                
-            if task.status in ['pending', 'downloading', 'converting']:
-                task.status = 'cancelled'
-                task.error = 'Téléchargement annulé par l\'utilisateur'
-                task.end_time = datetime.now()
-                return True
+            if not task or task.status not in ACTIVE_STATUSES:
+                return self.store.cancel(task_id, reason)
             
-            return False
+            # Annuler aussi les pistes d'une playlist
+            targets = [task] + [t for t in self.tasks.values()
+                                if t.parent_id == task_id and t.status in ACTIVE_STATUSES]
+            running_files = []
+            dequeued = False
+            for target in targets:
+                target.status = 'cancelled'
+                target.error = reason
+                target.end_time = datetime.now()
+                # Une tâche encore en file ne prendra jamais de worker
+                if self.scheduler.cancel(target.id):
+                    self.tasks.pop(target.id, None)
+                    dequeued = dequeued or target is task
+                else:
+                    self.cancel_events.setdefault(target.id, threading.Event()).set()
+                    running_files.extend(self.partials.get(target.id, ()))
+            # Un lot déjà développé n'a plus de worker qui le terminera
+            if task.kind == 'playlist' and task.total_tracks:
+                self.tasks.pop(task_id, None)
+        
+        # Conversion en cours : aucun hook n'est appelé pendant ffmpeg
+        for path in running_files:
+            kill_children(path)
+        for target in targets:
+            self._publish(target, immediate=True)
+        if task.kind == 'playlist':
+            self.store.cancel_children(task_id, reason)
+        cancelled = self.store.cancel(task_id, reason)
+        # Piste retirée de la file : aucun worker ne la comptera dans son lot
+        if dequeued and task.parent_id:
+            self._child_finished(task.parent_id, 'cancelled')
+        return cancelled
             
     def get_task(self, task_id: str) -> Optional[DownloadTask]:
-        """Récupère une tâche par son ID"""
+        """Récupère une tâche par son ID (en mémoire si vivante, sinon en base)"""
         with self.lock:
-            return self.tasks.get(task_id)
+            task = self.tasks.get(task_id)
+        if task:
+            return task
+        row = self.store.get(task_id)
+        return DownloadTask.from_row(row) if row else None
@@ -0,0 +1,177 @@
+"""
+Redimensionnement des images à la demande (/img/<source>/<nom>?w=&h=&fmt=).
+
+Les images envoyées (pochettes de playlists) sont conservées en pleine
+résolution ; les grilles n'en demandent que des vignettes. Chaque variante
+(taille, format) est dérivée une fois avec Pillow, en décodant les JPEG
+directement à l'échelle réduite (mode draft), puis gardée dans un cache
+disque borné en octets (LRU). Le nombre de décodages simultanés est
+limité : une image de 5 Mo décodée occupe vite plusieurs dizaines de Mo.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+from werkzeug.utils import secure_filename
+
+from .preview import PreviewCache
+from .cover_store import cover_store
+from ..utils.exceptions import ServiceError, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Formats de sortie : (format Pillow, options, type MIME)
+OUTPUT_FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'progressive': True, 'optimize': True}, 'image/jpeg'),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}, 'image/webp'),
+    'png': ('PNG', {'optimize': True}, 'image/png')
+}
+# Côté maximal d'une variante (pixels)
+MAX_DIMENSION = 2048
+# Décodages simultanés, et attente maximale d'un créneau (secondes)
+DEFAULT_CONCURRENCY = 2
+DECODE_TIMEOUT = 10.0
+
+
+def clamp_dimension(value: Optional[int]) -> Optional[int]:
+    """Dimension demandée, bornée à MAX_DIMENSION (None : libre)"""
+    if not value:
+        return None
+    if value < 0:
+        raise ValidationError("Dimension invalide")
+    return min(value, MAX_DIMENSION)
+
+
+def resize_image(source: str, output: str, width: Optional[int], height: Optional[int], fmt: str):
+    """Écrit une variante réduite (jamais agrandie) de source, de manière atomique"""
+    format_name, options, _ = OUTPUT_FORMATS[fmt]
+    box = (width or MAX_DIMENSION, height or MAX_DIMENSION)
+    with Image.open(source) as image:
+        # JPEG : décodage à 1/2, 1/4 ou 1/8 de la taille, sans passer par la pleine résolution
+        image.draft('RGB', box)
+        keep_alpha = fmt != 'jpg' and (image.mode in ('RGBA', 'LA') or 'transparency' in image.info)
+        image = image.convert('RGBA' if keep_alpha else 'RGB')
+    image.thumbnail(box, Image.LANCZOS)
+    tmp_path = f'{output}.tmp'
+    image.save(tmp_path, format_name, **options)
+    os.replace(tmp_path, output)
+
+
+class ImageResizer:
+    """Variantes d'images dérivées à la demande, avec cache disque et décodages bornés"""
+
+    def __init__(self, root: str = 'static/uploads/derived', max_bytes: int = 256 * 1024 * 1024,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.folders: Dict[str, str] = {}
+        self.decode_slots = threading.BoundedSemaphore(concurrency)
+        self._cache = None
+        self.pending: Dict[str, threading.Event] = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'generated': 0, 'failed': 0, 'rejected': 0}
+
+    def configure(self, root: Optional[str] = None, max_bytes: Optional[int] = None,
+                  concurrency: Optional[int] = None, folders: Optional[Dict[str, str]] = None):
+        if root:
+            self.root = str(root)
+            self._cache = None
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+            self._cache = None
+        if concurrency is not None:
+            self.decode_slots = threading.BoundedSemaphore(max(int(concurrency), 1))
+        if folders is not None:
+            self.folders = {name: str(path) for name, path in folders.items()}
+
+    @property
+    def cache(self) -> PreviewCache:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._cache is None:
+            self._cache = PreviewCache(self.root, self.max_bytes, suffix='')
+        return self._cache
+
+    def source_path(self, source: str, name: str) -> Optional[str]:
+        """
+        Fichier d'origine : une pochette du stockage (par clé) ou une image
+        d'un dossier d'envoi connu (playlists...)
+        """
+        if source == 'covers':
+            return cover_store.get(name, cover_store.sizes[-1], 'jpg')
+        folder = self.folders.get(source)
+        if folder is None or not name or secure_filename(name) != name:
+            return None
+        path = os.path.join(folder, name)
+        return path if os.path.isfile(path) else None
+
+    def get(self, source: str, name: str, width: Optional[int] = None,
+            height: Optional[int] = None, fmt: str = 'jpg') -> Optional[Tuple[str, str]]:
+        """
+        Variante demandée, dérivée au besoin.
+
+        Returns:
+            (chemin de la variante, clé), ou None si l'image n'existe pas
+
+        Raises:
+            ValidationError: Format ou dimensions invalides
+            ServiceError: Trop de décodages en cours, ou image illisible
+        """
+        if fmt not in OUTPUT_FORMATS:
+            raise ValidationError(f"Format non pris en charge: {fmt}")
+        width, height = clamp_dimension(width), clamp_dimension(height)
+        path = self.source_path(source, name)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        raw = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{width}x{height}"
+        key = f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]}.{fmt}"
+
+        while True:
+            cached = self.cache.get(key)
+            if cached:
+                with self.lock:
+                    self.stats['hits'] += 1
+                return cached, key
+            with self.lock:
+                event = self.pending.get(key)
+                if event is None:
+                    event = self.pending[key] = threading.Event()
+                    break
+            # Même variante en cours de génération : attendre son résultat
+            if not event.wait(DECODE_TIMEOUT):
+                raise ServiceError("Génération de l'image trop longue")
+
+        try:
+            if not self.decode_slots.acquire(timeout=DECODE_TIMEOUT):
+                with self.lock:
+                    self.stats['rejected'] += 1
+                raise ServiceError("Trop d'images en cours de redimensionnement")
+            try:
+                resize_image(path, self.cache.path_for(key), width, height, fmt)
+            finally:
+                self.decode_slots.release()
+            self.cache.add(key)
+            with self.lock:
+                self.stats['generated'] += 1
+            return self.cache.path_for(key), key
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            with self.lock:
+                self.stats['failed'] += 1
+            logger.warning(f"Redimensionnement de {path} impossible: {str(e)}")
+            raise ServiceError("Image illisible")
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+            event.set()
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {**self.stats, **self.cache.get_stats()}
+
+
+# Instance globale du redimensionnement des images
+image_resizer = ImageResizer()
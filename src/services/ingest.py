@@ -0,0 +1,470 @@
+"""
+Intégration des fichiers téléchargés dans la bibliothèque (table tracks).
+
+Chaque fichier traverse une chaîne d'étapes : analyse (durée, débit,
+fréquence) → transcodage éventuel → balises → pochette → enregistrement
+en base. Les téléchargements passent par le gestionnaire de
+téléchargements (ordonnanceur, bande passante, dédoublonnage), qui confie
+ensuite le fichier obtenu à la chaîne. Les étapes sont reliées par des files bornées
+(un producteur trop rapide attend au lieu d'accumuler du travail en
+mémoire) et chacune a son propre pool de threads, dimensionné selon son
+coût : le transcodage monopolise un cœur, l'analyse se contente de lire
+des en-têtes. Les pistes sont enregistrées par lots, en une seule
+transaction tous les N fichiers ou toutes les T secondes.
+"""
+
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import ffmpeg
+import mutagen
+
+from ..utils.process_control import run_cancellable
+from .tag_reader import tag_reader
+from .cover_store import cover_store
+from .tag_editor import unshare
+from .preview import preview_service
+from .waveform import waveform_jobs
+from ..utils.exceptions import ServiceError, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Étapes exécutées avant l'enregistrement en base, dans l'ordre
+STAGES = ('probe', 'transcode', 'tag', 'cover')
+
+# Threads par étape
+DEFAULT_WORKERS = {'probe': 2, 'transcode': 1, 'tag': 2, 'cover': 1}
+# Capacité de chaque file entre deux étapes
+QUEUE_SIZE = 32
+# Enregistrement en base : tous les N fichiers ou toutes les T secondes
+COMMIT_BATCH_SIZE = 50
+COMMIT_INTERVAL = 2.0
+# Éléments terminés conservés pour la consultation de leur état
+HISTORY_SIZE = 500
+# Marque des fichiers temporaires du transcodage (<nom>.ingest.<format>)
+TEMP_MARKER = '.ingest'
+
+# Paramètres d'encodage par format cible
+TRANSCODE_OPTIONS = {
+    'mp3': ['-codec:a', 'libmp3lame', '-q:a', '2'],
+    'ogg': ['-codec:a', 'libvorbis', '-q:a', '6'],
+    'opus': ['-codec:a', 'libopus', '-b:a', '160k'],
+    'm4a': ['-codec:a', 'aac', '-b:a', '256k'],
+    'flac': ['-codec:a', 'flac']
+}
+
+# Balises reprises dans la table tracks
+TAG_FIELDS = ('title', 'artist', 'album')
+
+
+@dataclass
+class IngestItem:
+    """Fichier en cours d'intégration"""
+    id: str
+    path: str
+    transcode_to: Optional[str] = None
+    tags: Dict[str, str] = field(default_factory=dict)
+    info: Dict[str, Any] = field(default_factory=dict)
+    cover_key: Optional[str] = None
+    status: str = 'queued'  # queued, <étape>, saving, completed, failed
+    error: Optional[str] = None
+    track_id: Optional[int] = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'path': self.path,
+            'status': self.status,
+            'error': self.error,
+            'track_id': self.track_id,
+            'tags': dict(self.tags),
+            'info': dict(self.info),
+            'cover_key': self.cover_key
+        }
+
+
+def probe_audio(path: str) -> Dict[str, Any]:
+    """
+    Durée (s), débit (kbps) et fréquence d'échantillonnage (Hz) d'un fichier.
+
+    Les en-têtes sont lus par mutagen ; ffprobe prend le relais pour les
+    conteneurs que mutagen ne connaît pas (webm).
+    """
+    info = {'file_size': os.path.getsize(path)}
+    record = tag_reader.read(path)
+    if record is not None and record.duration:
+        info['duration'] = float(record.duration)
+        info['bitrate'] = record.bitrate
+        info['sample_rate'] = record.sample_rate
+        return info
+
+    try:
+        probe = ffmpeg.probe(path)
+    except (ffmpeg.Error, FileNotFoundError) as e:
+        raise ServiceError(f"Format audio non reconnu: {os.path.basename(path)}") from e
+    stream = next((s for s in probe.get('streams', []) if s.get('codec_type') == 'audio'), None)
+    if stream is None:
+        raise ServiceError(f"Aucune piste audio dans {os.path.basename(path)}")
+    container = probe.get('format', {})
+    duration = stream.get('duration') or container.get('duration')
+    bitrate = stream.get('bit_rate') or container.get('bit_rate')
+    info['duration'] = float(duration) if duration else None
+    info['bitrate'] = int(bitrate) // 1000 if bitrate else None
+    info['sample_rate'] = int(stream['sample_rate']) if stream.get('sample_rate') else None
+    return info
+
+
+def is_temp_file(name: str) -> bool:
+    """Fichier temporaire écrit par le transcodage de la chaîne"""
+    return os.path.splitext(os.path.splitext(name)[0])[1] == TEMP_MARKER
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def schedule_analysis(paths: List[str]):
+    """Planifie les pics de forme d'onde et les extraits des pistes enregistrées"""
+    for path in paths:
+        waveform_jobs.enqueue(path)
+    preview_service.submit_batch(paths)
+
+
+class IngestPipeline:
+    """Chaîne d'intégration à étapes, chacune avec son pool de threads"""
+
+    def __init__(self, workers: Optional[Dict[str, int]] = None, queue_size: int = QUEUE_SIZE,
+                 batch_size: int = COMMIT_BATCH_SIZE, flush_interval: float = COMMIT_INTERVAL,
+                 analyze: bool = False):
+        self.workers = {**DEFAULT_WORKERS, **(workers or {})}
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Pics et extraits calculés dès l'enregistrement des pistes
+        self.analyze = analyze
+        self.app = None
+        self.queues: List[queue.Queue] = []
+        self.threads: Dict[str, List[threading.Thread]] = {}
+        self.items: 'OrderedDict[str, IngestItem]' = OrderedDict()
+        # (taille, mtime) des fichiers tels que la chaîne les a laissés
+        self.written: 'OrderedDict[str, Tuple[int, int]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'ingested': 0, 'failed': 0, 'commits': 0}
+
+    def configure(self, workers: Optional[Dict[str, int]] = None, queue_size: Optional[int] = None,
+                  batch_size: Optional[int] = None, flush_interval: Optional[float] = None,
+                  analyze: Optional[bool] = None):
+        """Dimensionne les pools et les lots (pris en compte au prochain démarrage)"""
+        if workers:
+            self.workers.update({name: max(int(count), 1) for name, count in workers.items()})
+        if queue_size is not None:
+            self.queue_size = max(int(queue_size), 1)
+        if batch_size is not None:
+            self.batch_size = max(int(batch_size), 1)
+        if flush_interval is not None:
+            self.flush_interval = float(flush_interval)
+        if analyze is not None:
+            self.analyze = bool(analyze)
+
+    @property
+    def running(self) -> bool:
+        return bool(self.threads)
+
+    def start(self, app=None):
+        """
+        Lance les threads de chaque étape et celui de l'enregistrement.
+
+        Args:
+            app: Application Flask dont le contexte sert aux écritures en base
+        """
+        if self.running:
+            return
+        self.app = app
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        handlers = {
+            'probe': self._probe,
+            'transcode': self._transcode,
+            'tag': self._tag,
+            'cover': self._extract_cover
+        }
+        for index, name in enumerate(STAGES):
+            self.threads[name] = [
+                threading.Thread(
+                    target=self._stage_loop,
+                    args=(name, handlers[name], self.queues[index], self.queues[index + 1]),
+                    name=f'ingest-{name}-{n}', daemon=True
+                )
+                for n in range(self.workers[name])
+            ]
+        self.threads['save'] = [threading.Thread(
+            target=self._writer_loop, args=(self.queues[-1],), name='ingest-save', daemon=True
+        )]
+        for threads in self.threads.values():
+            for thread in threads:
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Vide la chaîne étape par étape puis arrête ses threads"""
+        for index, name in enumerate((*STAGES, 'save')):
+            threads = self.threads.get(name, [])
+            for _ in threads:
+                self.queues[index].put(None)
+            for thread in threads:
+                thread.join(timeout)
+        self.threads = {}
+
+    def submit(self, path: str, transcode_to: Optional[str] = None,
+               tags: Optional[Dict[str, str]] = None, block: bool = True) -> IngestItem:
+        """
+        Confie un fichier à la chaîne.
+
+        Bloque tant que la première file est pleine, sauf avec block=False.
+
+        Args:
+            path: Fichier présent sur le serveur (téléchargé, envoyé ou copié)
+            transcode_to: Format final (mp3, ogg, opus, m4a, flac)
+            tags: Titre, artiste, album connus par ailleurs
+
+        Raises:
+            ValidationError: Fichier manquant, ou format cible inconnu
+            queue.Full: File pleine avec block=False
+        """
+        if not path:
+            raise ValidationError("Fichier requis")
+        if transcode_to and transcode_to not in TRANSCODE_OPTIONS:
+            raise ValidationError(f"Format non supporté: {transcode_to}")
+        if not self.running:
+            raise ServiceError("La chaîne d'intégration n'est pas démarrée")
+
+        item = IngestItem(
+            id=str(uuid.uuid4()), path=path, transcode_to=transcode_to,
+            tags={key: value for key, value in (tags or {}).items() if value}
+        )
+        # Enregistré avant la mise en file (un worker peut le prendre aussitôt),
+        # retiré si la file est pleine
+        with self.lock:
+            self.items[item.id] = item
+            self.stats['submitted'] += 1
+        try:
+            self.queues[0].put(item, block=block)
+        except queue.Full:
+            with self.lock:
+                del self.items[item.id]
+                self.stats['submitted'] -= 1
+            raise
+        return item
+
+    def get(self, item_id: str) -> Optional[IngestItem]:
+        with self.lock:
+            return self.items.get(item_id)
+
+    def owns(self, path: str) -> bool:
+        """
+        Le fichier est-il en cours d'intégration, ou inchangé depuis que la
+        chaîne l'a écrit ? (la surveillance ignore alors ses événements)
+        """
+        with self.lock:
+            if any(item.path == path and not item.done.is_set() for item in self.items.values()):
+                return True
+            written = self.written.get(path)
+        return written is not None and written == file_signature(path)
+
+    def _stage_loop(self, name: str, handler: Callable[[IngestItem], None],
+                    inbox: queue.Queue, outbox: queue.Queue):
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            item.status = name
+            try:
+                handler(item)
+            except Exception as e:
+                logger.warning(f"Intégration de {item.path} ({name}): {str(e)}")
+                self._settle(item, 'failed', str(e))
+                continue
+            # File suivante pleine : l'étape attend (contre-pression)
+            outbox.put(item)
+
+    def _settle(self, item: IngestItem, status: str, error: Optional[str] = None):
+        item.status = status
+        item.error = error
+        signature = file_signature(item.path)
+        with self.lock:
+            if signature is not None:
+                self.written[item.path] = signature
+                self.written.move_to_end(item.path)
+                while len(self.written) > HISTORY_SIZE:
+                    self.written.popitem(last=False)
+            self.stats['ingested' if status == 'completed' else 'failed'] += 1
+            self.items.move_to_end(item.id)
+            while len(self.items) > HISTORY_SIZE:
+                oldest = next(iter(self.items.values()))
+                if not oldest.done.is_set():
+                    break
+                self.items.popitem(last=False)
+        item.done.set()
+
+    def _probe(self, item: IngestItem):
+        item.info = probe_audio(item.path)
+
+    def _transcode(self, item: IngestItem):
+        """Convertit au format demandé, si le fichier n'y est pas déjà"""
+        target_format = item.transcode_to
+        base, extension = os.path.splitext(item.path)
+        if not target_format or extension.lstrip('.').lower() == target_format:
+            return
+        target = f"{base}.{target_format}"
+        tmp_path = f"{base}{TEMP_MARKER}.{target_format}"
+        cmd = [
+            'ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-i', item.path,
+            '-vn', '-map_metadata', '0', *TRANSCODE_OPTIONS[target_format], tmp_path
+        ]
+        try:
+            result = run_cancellable(cmd)
+        except FileNotFoundError:
+            raise ServiceError("ffmpeg introuvable")
+        if result.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ServiceError(f"Transcodage impossible: {result.stderr.strip()}")
+        os.replace(tmp_path, target)
+        os.remove(item.path)
+        item.path = target
+        item.info = probe_audio(target)
+
+    def _tag(self, item: IngestItem):
+        """
+        Complète les balises : celles du fichier priment, les informations
+        connues par ailleurs comblent les manques et sont écrites dans le fichier.
+        """
+        try:
+            audio = mutagen.File(item.path, easy=True)
+        except mutagen.MutagenError:
+            audio = None
+        if audio is None:
+            return
+        if audio.tags is None:
+            try:
+                audio.add_tags()
+            except (mutagen.MutagenError, NotImplementedError):
+                return
+
+        missing = {}
+        for key in TAG_FIELDS:
+            try:
+                current = audio.tags.get(key)
+            except (KeyError, ValueError):
+                current = None
+            if current:
+                item.tags[key] = str(current[0]) if isinstance(current, list) else str(current)
+            elif item.tags.get(key):
+                missing[key] = item.tags[key]
+        if not missing:
+            return
+        try:
+            for key, value in missing.items():
+                audio[key] = value
+            unshare(item.path)
+            audio.save()
+        except Exception as e:
+            # Balises non modifiables dans ce format (WAV...) : la base les gardera
+            logger.debug(f"Balises non écrites dans {item.path}: {str(e)}")
+
+    def _extract_cover(self, item: IngestItem):
+        """Enregistre la pochette dans le stockage partagé (une fois par image)"""
+        item.cover_key = cover_store.add_file(item.path)
+
+    def _writer_loop(self, inbox: queue.Queue):
+        """Enregistre les pistes par lots (N éléments ou T secondes)"""
+        pending: List[IngestItem] = []
+        deadline = 0.0
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if pending else None
+            try:
+                item = inbox.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                if pending:
+                    self._save(pending)
+                break
+            if item:
+                item.status = 'saving'
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._save(pending)
+                pending = []
+
+    def _save(self, items: List[IngestItem]):
+        """Insère ou met à jour les pistes d'un lot en une transaction"""
+        from ..database import db
+        from ..models.track import Track
+
+        context = self.app.app_context() if self.app is not None else nullcontext()
+        with context:
+            try:
+                paths = list({item.path for item in items})
+                tracks = {
+                    track.file_path: track
+                    for track in Track.query.filter(Track.file_path.in_(paths)).all()
+                }
+                for item in items:
+                    track = tracks.get(item.path)
+                    if track is None:
+                        track = tracks[item.path] = Track(file_path=item.path)
+                        db.session.add(track)
+                    track.title = item.tags.get('title') or Path(item.path).stem
+                    track.artist = item.tags.get('artist') or track.artist
+                    track.album = item.tags.get('album') or track.album
+                    track.duration = item.info.get('duration')
+                    track.file_size = item.info.get('file_size')
+                    track.bitrate = item.info.get('bitrate')
+                    track.sample_rate = item.info.get('sample_rate')
+                db.session.commit()
+                for item in items:
+                    item.track_id = tracks[item.path].id
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Enregistrement de {len(items)} pistes impossible: {str(e)}")
+                for item in items:
+                    self._settle(item, 'failed', str(e))
+                return
+            finally:
+                if self.app is not None:
+                    db.session.remove()
+        with self.lock:
+            self.stats['commits'] += 1
+        if self.analyze:
+            schedule_analysis(list({item.path for item in items}))
+        for item in items:
+            self._settle(item, 'completed')
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats['queues'] = {
+            name: self.queues[index].qsize()
+            for index, name in enumerate((*STAGES, 'save'))
+        } if self.queues else {}
+        stats['workers'] = dict(self.workers)
+        return stats
+
+
+# Instance globale de la chaîne d'intégration
+ingest_pipeline = IngestPipeline()
@@ -0,0 +1,385 @@
+"""
+Service de relais IPTV.
+Récupère une seule fois chaque playlist HLS et chaque segment amont, conserve
+une fenêtre glissante de segments en mémoire et redistribue le tout à autant
+de clients locaux que nécessaire.
+"""
+
+import re
+import time
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from ..utils.exceptions import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Attribut URI="..." présent dans EXT-X-KEY, EXT-X-MAP, EXT-X-MEDIA, etc.
+_URI_ATTR = re.compile(r'URI="([^"]+)"')
+
+# Balises dont l'attribut URI désigne une playlist et non un segment
+_PLAYLIST_URI_TAGS = ('#EXT-X-MEDIA', '#EXT-X-I-FRAME-STREAM-INF')
+
+# Redirections amont suivies au plus
+MAX_REDIRECTS = 5
+
+
+def _resource_key(url: str) -> str:
+    """Clé courte et stable pour une URL amont"""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def is_public_url(url: str) -> bool:
+    """
+    URL http(s) dont l'hôte ne résout que vers des adresses publiques : le
+    relais ne doit pas servir de rebond vers le réseau local du serveur
+    """
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:
+        return False
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(infos) and all(
+        ipaddress.ip_address(info[4][0].split('%', 1)[0]).is_global for info in infos
+    )
+
+
+class RelayChannel:
+    """État d'une chaîne relayée (playlists, segments, statistiques)"""
+
+    def __init__(self, channel_id: str, url: str):
+        self.id = channel_id
+        self.url = url
+        self.entry_key = _resource_key(url)
+        self.resources: Dict[str, str] = {self.entry_key: url}  # clé -> URL amont
+        self.references: Dict[str, Set[str]] = {}  # playlist -> clés qu'elle référence
+        self.playlists: Dict[str, Tuple[str, float, float]] = {}  # clé -> (texte, date, ttl)
+        self.segments: 'OrderedDict[str, Tuple[bytes, str]]' = OrderedDict()
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.stats = {
+            'upstream_requests': 0,
+            'upstream_bytes': 0,
+            'served_bytes': 0,
+            'hits': 0,
+            'misses': 0
+        }
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """Verrou par ressource : un seul fetch amont à la fois par clé"""
+        with self.lock:
+            lock = self.key_locks.get(key)
+            if lock is None:
+                lock = self.key_locks[key] = threading.Lock()
+            return lock
+
+
+class IPTVRelay:
+    """Relais HLS avec fan-out local et cache de segments glissant"""
+
+    def __init__(self, url_prefix: str = '/api/iptv/relay', window: int = 12,
+                 idle_timeout: float = 60.0,
+                 fetcher: Optional[Callable[[str], Tuple[bytes, str]]] = None):
+        """
+        Args:
+            url_prefix: Préfixe des URLs locales réécrites dans les playlists
+            window: Nombre de segments conservés par chaîne
+            idle_timeout: Durée (s) sans client avant éviction d'une chaîne
+            fetcher: Fonction url -> (contenu, content-type), injectable pour les tests
+        """
+        self.url_prefix = url_prefix.rstrip('/')
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.channels: Dict[str, RelayChannel] = {}
+        self.lock = threading.Lock()
+        self._session = None
+        self._fetcher = fetcher or self._http_fetch
+        self._janitor = None
+
+    # ------------------------------------------------------------------
+    # Gestion des chaînes
+    # ------------------------------------------------------------------
+
+    def open_channel(self, url: str) -> str:
+        """
+        Ouvre (ou réutilise) le relais d'une URL amont.
+
+        Deux clients qui demandent la même URL partagent la même chaîne.
+
+        Returns:
+            Identifiant de la chaîne
+        """
+        channel_id = _resource_key(url)[:12]
+        with self.lock:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                channel = self.channels[channel_id] = RelayChannel(channel_id, url)
+                logger.info(f"Relais IPTV ouvert: {channel_id} -> {url}")
+            channel.touch()
+        self._ensure_janitor()
+        return channel_id
+
+    def playlist_url(self, channel_id: str) -> Optional[str]:
+        """URL locale de la playlist d'entrée d'une chaîne"""
+        channel = self.channels.get(channel_id)
+        if not channel:
+            return None
+        return f"{self.url_prefix}/{channel.id}/p/{channel.entry_key}.m3u8"
+
+    def close_channel(self, channel_id: str) -> bool:
+        """Ferme une chaîne et libère ses segments"""
+        with self.lock:
+            channel = self.channels.pop(channel_id, None)
+        if channel:
+            logger.info(f"Relais IPTV fermé: {channel_id}")
+        return channel is not None
+
+    def evict_idle(self) -> int:
+        """Évince les chaînes sans client depuis plus de idle_timeout secondes"""
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                cid for cid, channel in self.channels.items()
+                if now - channel.last_access > self.idle_timeout
+            ]
+            for cid in idle:
+                del self.channels[cid]
+        for cid in idle:
+            logger.info(f"Relais IPTV inactif évincé: {cid}")
+        return len(idle)
+
+    def _ensure_janitor(self):
+        """Démarre le thread d'éviction au premier besoin"""
+        if self._janitor and self._janitor.is_alive():
+            return
+        self._janitor = threading.Thread(target=self._run_janitor, daemon=True)
+        self._janitor.start()
+
+    def _run_janitor(self):
+        while self.channels:
+            threading.Event().wait(max(self.idle_timeout / 2, 1.0))
+            self.evict_idle()
+
+    # ------------------------------------------------------------------
+    # Playlists et segments
+    # ------------------------------------------------------------------
+
+    def get_playlist(self, channel_id: str, key: str) -> str:
+        """
+        Retourne une playlist réécrite vers les URLs locales.
+
+        La playlist amont n'est récupérée qu'une fois par demi-durée de
+        segment, quel que soit le nombre de clients.
+        """
+        channel = self._get_channel(channel_id)
+        url = channel.resources.get(key)
+        if not url:
+            raise KeyError(key)
+
+        cached = channel.playlists.get(key)
+        if cached and time.monotonic() - cached[1] < cached[2]:
+            channel.stats['hits'] += 1
+            return cached[0]
+
+        with channel.key_lock(key):
+            # Un autre client a peut-être rafraîchi la playlist entre-temps
+            cached = channel.playlists.get(key)
+            if cached and time.monotonic() - cached[1] < cached[2]:
+                channel.stats['hits'] += 1
+                return cached[0]
+
+            channel.stats['misses'] += 1
+            content, _ = self._fetch(channel, url)
+            text = content.decode('utf-8', errors='replace')
+            rewritten, referenced = self._rewrite_playlist(channel, text, url)
+            channel.playlists[key] = (rewritten, time.monotonic(), self._playlist_ttl(text))
+            self._prune_resources(channel, key, referenced)
+            return rewritten
+
+    def _prune_resources(self, channel: RelayChannel, key: str, referenced: Set[str]):
+        """
+        Oublie les ressources sorties de la fenêtre d'une playlist en direct :
+        chaque rafraîchissement référence de nouveaux segments
+        """
+        with channel.lock:
+            stale = channel.references.get(key, set()) - referenced
+            channel.references[key] = referenced
+            if not stale:
+                return
+            in_use = set(channel.references).union(*channel.references.values())
+            for old_key in stale - in_use:
+                if old_key != channel.entry_key:
+                    channel.resources.pop(old_key, None)
+
+    def get_segment(self, channel_id: str, key: str) -> Tuple[bytes, str]:
+        """
+        Retourne un segment (contenu, content-type) depuis la fenêtre glissante,
+        en le récupérant une seule fois en amont.
+        """
+        channel = self._get_channel(channel_id)
+        # Un segment tout juste sorti de la playlist reste servi depuis la fenêtre
+        with channel.lock:
+            segment = channel.segments.get(key)
+            if segment is not None:
+                channel.segments.move_to_end(key)
+            url = channel.resources.get(key)
+        if segment is not None:
+            channel.stats['hits'] += 1
+            channel.stats['served_bytes'] += len(segment[0])
+            return segment
+        if not url:
+            raise KeyError(key)
+
+        with channel.key_lock(key):
+            with channel.lock:
+                segment = channel.segments.get(key)
+            if segment is None:
+                channel.stats['misses'] += 1
+                segment = self._fetch(channel, url)
+                with channel.lock:
+                    channel.segments[key] = segment
+                    while len(channel.segments) > self.window:
+                        old_key, _ = channel.segments.popitem(last=False)
+                        channel.key_locks.pop(old_key, None)
+            else:
+                channel.stats['hits'] += 1
+
+        channel.stats['served_bytes'] += len(segment[0])
+        return segment
+
+    def _get_channel(self, channel_id: str) -> RelayChannel:
+        channel = self.channels.get(channel_id)
+        if not channel:
+            raise KeyError(channel_id)
+        channel.touch()
+        return channel
+
+    def _fetch(self, channel: RelayChannel, url: str) -> Tuple[bytes, str]:
+        try:
+            content, content_type = self._fetcher(url)
+        except Exception as e:
+            logger.error(f"Erreur du relais IPTV pour {url}: {str(e)}")
+            raise ServiceError(f"Flux amont indisponible: {str(e)}")
+        channel.stats['upstream_requests'] += 1
+        channel.stats['upstream_bytes'] += len(content)
+        return content, content_type
+
+    def _http_fetch(self, url: str) -> Tuple[bytes, str]:
+        """
+        Récupère une ressource amont en réutilisant les connexions.
+
+        Chaque URL, y compris celles des playlists et des redirections, doit
+        désigner un hôte public.
+        """
+        if self._session is None:
+            self._session = requests.Session()
+        for _ in range(MAX_REDIRECTS + 1):
+            if not is_public_url(url):
+                raise ServiceError(f"Hôte amont non autorisé: {url}")
+            response = self._session.get(url, timeout=10, allow_redirects=False)
+            if not response.is_redirect:
+                response.raise_for_status()
+                return response.content, response.headers.get('content-type', 'application/octet-stream')
+            url = urljoin(url, response.headers['location'])
+        raise ServiceError("Trop de redirections amont")
+
+    # ------------------------------------------------------------------
+    # Réécriture
+    # ------------------------------------------------------------------
+
+    def _rewrite_playlist(self, channel: RelayChannel, text: str, base_url: str) -> Tuple[str, Set[str]]:
+        """
+        Remplace toutes les URIs d'une playlist par des URLs locales.
+
+        Returns:
+            (playlist réécrite, clés des ressources référencées)
+        """
+        is_master = '#EXT-X-STREAM-INF' in text
+        lines = []
+        referenced: Set[str] = set()
+        for line in text.splitlines():
+            stripped = line.strip()
+            if not stripped:
+                lines.append(line)
+            elif stripped.startswith('#'):
+                if 'URI="' in stripped:
+                    is_playlist = stripped.startswith(_PLAYLIST_URI_TAGS)
+                    stripped = _URI_ATTR.sub(
+                        lambda m: 'URI="%s"' % self._local_url(
+                            channel, urljoin(base_url, m.group(1)), is_playlist, referenced
+                        ),
+                        stripped
+                    )
+                lines.append(stripped)
+            else:
+                absolute = urljoin(base_url, stripped)
+                is_playlist = is_master or urlparse(absolute).path.endswith(('.m3u8', '.m3u'))
+                lines.append(self._local_url(channel, absolute, is_playlist, referenced))
+        return '\n'.join(lines) + '\n', referenced
+
+    def _local_url(self, channel: RelayChannel, url: str, is_playlist: bool,
+                   referenced: Set[str]) -> str:
+        key = _resource_key(url)
+        with channel.lock:
+            channel.resources[key] = url
+        referenced.add(key)
+        if is_playlist:
+            return f"{self.url_prefix}/{channel.id}/p/{key}.m3u8"
+        # Conserver l'extension : certains lecteurs s'en servent pour détecter le format
+        path = urlparse(url).path
+        ext = path[path.rfind('.'):] if '.' in path.rsplit('/', 1)[-1] else ''
+        return f"{self.url_prefix}/{channel.id}/s/{key}{ext}"
+
+    def _playlist_ttl(self, text: str) -> float:
+        """Durée de validité d'une playlist en cache"""
+        if '#EXT-X-STREAM-INF' in text or '#EXT-X-ENDLIST' in text:
+            # Playlist maître ou VOD : le contenu ne change pas
+            return 300.0
+        match = re.search(r'#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)', text)
+        target = float(match.group(1)) if match else 6.0
+        return max(target / 2, 1.0)
+
+    # ------------------------------------------------------------------
+    # Statistiques
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict:
+        """Statistiques par chaîne relayée"""
+        now = time.monotonic()
+        return {
+            'channels': [
+                {
+                    'id': channel.id,
+                    'url': channel.url,
+                    'segments_cached': len(channel.segments),
+                    'idle_seconds': round(now - channel.last_access, 1),
+                    **channel.stats
+                }
+                for channel in list(self.channels.values())
+            ],
+            'window': self.window,
+            'idle_timeout': self.idle_timeout
+        }
+
+
+# Instance globale du relais IPTV
+iptv_relay = IPTVRelay()
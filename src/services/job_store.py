@@ -0,0 +1,282 @@
+"""
+Stockage persistant des tâches de téléchargement.
+
+Les tâches sont conservées dans une table SQLite : une tâche en file ou en
+cours survit à un redémarrage, et l'historique complet reste consultable
+par pages. Les workers réservent une tâche par une mise à jour conditionnelle,
+ce qui garantit qu'une tâche n'est exécutée qu'une fois.
+"""
+
+import sqlite3
+import logging
+import threading
+from datetime import datetime, UTC
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Statuts d'une tâche encore vivante
+ACTIVE_STATUSES = ('pending', 'downloading', 'converting')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    service TEXT NOT NULL,
+    user_id INTEGER,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress REAL NOT NULL DEFAULT 0,
+    downloaded_bytes INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER,
+    filename TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    start_time TEXT,
+    end_time TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_download_jobs_status ON download_jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_created ON download_jobs (created_at);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_user ON download_jobs (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_parent ON download_jobs (parent_id);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_media_key ON download_jobs (media_key, status);
+CREATE INDEX IF NOT EXISTS idx_download_jobs_hash ON download_jobs (content_hash);
+"""
+
+# Colonnes ajoutées après la création de la table, avec leur définition
+MIGRATIONS = {
+    'kind': "TEXT NOT NULL DEFAULT 'track'",
+    'parent_id': 'TEXT',
+    'total_tracks': 'INTEGER NOT NULL DEFAULT 0',
+    'completed_tracks': 'INTEGER NOT NULL DEFAULT 0',
+    'failed_tracks': 'INTEGER NOT NULL DEFAULT 0',
+    'media_key': 'TEXT',
+    'content_hash': 'TEXT'
+}
+
+# Colonnes modifiables via update()
+COLUMNS = (
+    'url', 'service', 'user_id', 'priority', 'status', 'attempts', 'progress',
+    'downloaded_bytes', 'total_bytes', 'filename', 'error', 'created_at',
+    'start_time', 'end_time'
+) + tuple(MIGRATIONS)
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+class JobStore:
+    """Table SQLite des tâches de téléchargement"""
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        """
+        Args:
+            db_path: Chemin du fichier SQLite
+            max_attempts: Nombre de tentatives avant d'abandonner une tâche interrompue
+        """
+        self.db_path = str(db_path)
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Une connexion partagée, sérialisée par le verrou (écritures courtes)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.conn.executescript(INDEXES)
+        self.conn.commit()
+
+    def _migrate(self):
+        """Ajoute les colonnes manquantes d'une table créée par une version antérieure"""
+        existing = {row['name'] for row in self.conn.execute('PRAGMA table_info(download_jobs)')}
+        for column, definition in MIGRATIONS.items():
+            if column not in existing:
+                self.conn.execute(f'ALTER TABLE download_jobs ADD COLUMN {column} {definition}')
+
+    def create(self, job: Dict):
+        """Enregistre une nouvelle tâche"""
+        values = {key: job.get(key) for key in COLUMNS}
+        values['id'] = job['id']
+        values['status'] = values['status'] or 'pending'
+        values['priority'] = values['priority'] or 0
+        values['attempts'] = values['attempts'] or 0
+        values['progress'] = values['progress'] or 0
+        values['downloaded_bytes'] = values['downloaded_bytes'] or 0
+        values['kind'] = values['kind'] or 'track'
+        for column in ('total_tracks', 'completed_tracks', 'failed_tracks'):
+            values[column] = values[column] or 0
+        values['created_at'] = values['created_at'] or _now()
+        values['updated_at'] = _now()
+        columns = ', '.join(values)
+        placeholders = ', '.join(f':{key}' for key in values)
+        with self.lock:
+            self.conn.execute(f'INSERT INTO download_jobs ({columns}) VALUES ({placeholders})', values)
+            self.conn.commit()
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Réserve atomiquement une tâche en attente pour un worker.
+
+        Returns:
+            False si la tâche a été annulée ou réservée entre-temps
+        """
+        now = _now()
+        with self.lock:
+            cursor = self.conn.execute(
+                """UPDATE download_jobs
+                   SET status = 'downloading', attempts = attempts + 1,
+                       start_time = ?, updated_at = ?
+                   WHERE id = ? AND status = 'pending'""",
+                (now, now, job_id)
+            )
+            self.conn.commit()
+            return cursor.rowcount == 1
+
+    def update(self, job_id: str, only_if_active: bool = False, **fields) -> bool:
+        """
+        Met à jour les champs d'une tâche.
+
+        Args:
+            only_if_active: Ne rien modifier si la tâche est déjà terminée
+                (évite qu'une fin de téléchargement écrase une annulation)
+        """
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Colonnes inconnues: {', '.join(sorted(unknown))}")
+        fields['updated_at'] = _now()
+        assignments = ', '.join(f'{key} = :{key}' for key in fields)
+        query = f'UPDATE download_jobs SET {assignments} WHERE id = :id'
+        if only_if_active:
+            query += " AND status IN ('pending', 'downloading', 'converting')"
+        with self.lock:
+            cursor = self.conn.execute(query, {**fields, 'id': job_id})
+            self.conn.commit()
+            return cursor.rowcount == 1
+
+    def cancel(self, job_id: str, reason: str) -> bool:
+        """Annule une tâche encore vivante"""
+        return self.update(job_id, only_if_active=True, status='cancelled',
+                           error=reason, end_time=_now())
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM download_jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_key(self, media_key: str, include_completed: bool = True) -> Optional[Dict]:
+        """
+        Tâche vivante (ou terminée avec succès) pour ce média, quelle que soit
+        l'URL employée (dédoublonnage).
+        """
+        statuses = ACTIVE_STATUSES + (('completed',) if include_completed else ())
+        placeholders = ', '.join('?' for _ in statuses)
+        with self.lock:
+            row = self.conn.execute(
+                f"""SELECT * FROM download_jobs
+                    WHERE media_key = ? AND status IN ({placeholders})
+                    ORDER BY status = 'completed', created_at DESC LIMIT 1""",
+                (media_key, *statuses)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, content_hash: str, exclude_id: Optional[str] = None) -> Optional[Dict]:
+        """Tâche terminée dont le fichier a exactement ce contenu"""
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT * FROM download_jobs
+                   WHERE content_hash = ? AND status = 'completed' AND id != ?
+                   ORDER BY created_at LIMIT 1""",
+                (content_hash, exclude_id or '')
+            ).fetchone()
+        return dict(row) if row else None
+
+    def count_children(self, parent_id: str) -> Dict[str, int]:
+        """Nombre de pistes d'un lot par statut"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT status, COUNT(*) FROM download_jobs WHERE parent_id = ? GROUP BY status',
+                (parent_id,)
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+    def cancel_children(self, parent_id: str, reason: str) -> int:
+        """Annule les pistes encore vivantes d'un lot"""
+        now = _now()
+        with self.lock:
+            cursor = self.conn.execute(
+                """UPDATE download_jobs SET status = 'cancelled', error = ?, end_time = ?, updated_at = ?
+                   WHERE parent_id = ? AND status IN ('pending', 'downloading', 'converting')""",
+                (reason, now, now, parent_id)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def list(self, page: int = 1, per_page: int = 50, status: Optional[str] = None,
+             user_id: Optional[int] = None, parent_id: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """
+        Historique paginé, du plus récent au plus ancien.
+
+        Args:
+            parent_id: Pistes d'un lot ; sans valeur, tâches de premier niveau
+
+        Returns:
+            (tâches de la page, nombre total de tâches correspondantes)
+        """
+        conditions, params = [], []
+        if parent_id:
+            conditions.append('parent_id = ?')
+            params.append(parent_id)
+        else:
+            conditions.append('parent_id IS NULL')
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        page = max(page, 1)
+        with self.lock:
+            total = self.conn.execute(f'SELECT COUNT(*) FROM download_jobs {where}', params).fetchone()[0]
+            rows = self.conn.execute(
+                f'SELECT * FROM download_jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                params + [per_page, (page - 1) * per_page]
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def recover(self) -> List[Dict]:
+        """
+        Remet en file les tâches interrompues par un arrêt du serveur.
+
+        Les tâches ayant épuisé leurs tentatives passent en échec.
+
+        Returns:
+            Tâches en attente à replanifier, des plus anciennes aux plus récentes
+        """
+        now = _now()
+        with self.lock:
+            failed = self.conn.execute(
+                """UPDATE download_jobs
+                   SET status = 'failed', error = 'Interrompu trop de fois', end_time = ?, updated_at = ?
+                   WHERE status IN ('downloading', 'converting') AND attempts >= ?""",
+                (now, now, self.max_attempts)
+            ).rowcount
+            resumed = self.conn.execute(
+                """UPDATE download_jobs SET status = 'pending', updated_at = ?
+                   WHERE status IN ('downloading', 'converting')""",
+                (now,)
+            ).rowcount
+            self.conn.commit()
+            rows = self.conn.execute(
+                "SELECT * FROM download_jobs WHERE status = 'pending' ORDER BY created_at"
+            ).fetchall()
+        if failed or resumed:
+            logger.info(f"Tâches de téléchargement reprises: {resumed}, abandonnées: {failed}")
+        return [dict(row) for row in rows]
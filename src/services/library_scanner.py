@@ -0,0 +1,308 @@
+"""
+Analyse incrémentale de la bibliothèque musicale (MUSIC_FOLDER).
+
+Les fichiers copiés à la main dans le dossier de musique sont découverts
+par un parcours os.scandir. Une table scan_index mémorise (taille, mtime,
+inode) de chaque fichier déjà analysé : un fichier inchangé est ignoré sans
+être ouvert, si bien qu'une nouvelle analyse d'une bibliothèque stable se
+limite au parcours des répertoires. Les balises des fichiers nouveaux ou
+modifiés sont lues dans un pool de processus (tag_reader) et les pistes
+sont insérées ou mises à jour par lots (executemany) dans de grandes
+transactions.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, UTC
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .tag_reader import AudioMetadata, read_batch
+from .ingest import schedule_analysis
+
+logger = logging.getLogger(__name__)
+
+# Extensions prises en compte
+AUDIO_EXTENSIONS = {'.mp3', '.flac', '.ogg', '.opus', '.m4a', '.aac', '.wav', '.wma'}
+# Fichiers enregistrés par transaction
+SCAN_BATCH_SIZE = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_index (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+)
+"""
+
+# Colonnes de tracks renseignées par l'analyse
+TRACK_FIELDS = ('title', 'artist', 'album', 'duration', 'file_size', 'bitrate', 'sample_rate')
+
+Signature = Tuple[int, int, int]
+
+
+def walk_audio_files(root: str) -> Iterator[Tuple[str, Signature]]:
+    """
+    Parcourt root (sans suivre les liens) et produit (chemin, (taille, mtime, inode)).
+
+    Les dossiers cachés (.spotdl-*, covers...) sont ignorés.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logger.warning(f"Dossier illisible {directory}: {str(e)}")
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in AUDIO_EXTENSIONS:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                yield entry.path, (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def track_row(record: AudioMetadata) -> Dict:
+    """Colonnes de la table tracks pour un fichier lu"""
+    return {
+        'file_path': record.path,
+        'title': record.title or os.path.splitext(os.path.basename(record.path))[0],
+        'artist': record.artist,
+        'album': record.album,
+        'duration': record.duration,
+        'file_size': record.size,
+        'bitrate': record.bitrate,
+        'sample_rate': record.sample_rate
+    }
+
+
+class LibraryScanner:
+    """Analyse de la bibliothèque, en ligne de commande ou en tâche d'administration"""
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = SCAN_BATCH_SIZE,
+                 analyze: bool = False):
+        self.workers = workers
+        self.batch_size = batch_size
+        # Pics et extraits planifiés pour les pistes nouvelles ou modifiées
+        self.analyze = analyze
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.status: Dict = {'state': 'idle'}
+
+    def configure(self, workers: Optional[int] = None, batch_size: Optional[int] = None,
+                  analyze: Optional[bool] = None):
+        if workers is not None:
+            self.workers = max(int(workers), 1)
+        if batch_size is not None:
+            self.batch_size = max(int(batch_size), 1)
+        if analyze is not None:
+            self.analyze = bool(analyze)
+
+    def scan(self, root: str, engine, prune: bool = False) -> Dict:
+        """
+        Analyse root et met à jour la table tracks.
+
+        Args:
+            root: Dossier de musique
+            engine: Moteur SQLAlchemy de la base de la bibliothèque
+            prune: Supprimer les pistes dont le fichier a disparu
+
+        Returns:
+            Compteurs : fichiers vus, inchangés, analysés, illisibles, supprimés
+        """
+        started = time.monotonic()
+        root = os.path.abspath(root)
+        stats = {'seen': 0, 'unchanged': 0, 'parsed': 0, 'failed': 0, 'removed': 0}
+        self._update_status(state='running', root=root, **stats)
+
+        with engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+            known: Dict[str, Signature] = {
+                row[0]: (row[1], row[2], row[3])
+                for row in conn.execute(text('SELECT path, size, mtime_ns, inode FROM scan_index'))
+            }
+
+        seen = set()
+        changed: List[Tuple[str, Signature]] = []
+        for path, signature in walk_audio_files(root):
+            seen.add(path)
+            stats['seen'] += 1
+            if known.get(path) == signature:
+                stats['unchanged'] += 1
+            else:
+                changed.append((path, signature))
+        self._update_status(**stats)
+
+        if changed:
+            paths = [path for path, _ in changed]
+            batch = []
+            for (path, signature), record in zip(changed, read_batch(paths, self.workers)):
+                result = track_row(record) if record else None
+                batch.append((path, signature, result))
+                if result is None:
+                    stats['failed'] += 1
+                else:
+                    stats['parsed'] += 1
+                if len(batch) >= self.batch_size:
+                    self._save(engine, batch)
+                    batch = []
+                    self._update_status(**stats)
+            if batch:
+                self._save(engine, batch)
+
+        missing = [path for path in known
+                   if path not in seen and (path == root or path.startswith(root + os.sep))]
+        if missing:
+            stats['removed'] = self.forget(engine, missing, prune)
+
+        stats['elapsed'] = round(time.monotonic() - started, 3)
+        self._update_status(state='completed', **stats)
+        logger.info(f"Analyse de {root}: {stats}")
+        return stats
+
+    def _save(self, engine, batch: List[Tuple[str, Signature, Optional[Dict]]]):
+        """Enregistre un lot de fichiers en une transaction (executemany)"""
+        from ..models.track import Track
+
+        now = datetime.now(UTC)
+        tracks = [{**result, 'updated_at': now} for _, _, result in batch if result]
+        index_rows = [
+            {'path': path, 'size': signature[0], 'mtime_ns': signature[1], 'inode': signature[2],
+             'ok': int(result is not None), 'scanned_at': time.time()}
+            for path, signature, result in batch
+        ]
+        with engine.begin() as conn:
+            if tracks:
+                table = Track.__table__
+                statement = sqlite_insert(table)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.file_path],
+                    set_={name: statement.excluded[name] for name in (*TRACK_FIELDS, 'updated_at')}
+                )
+                conn.execute(statement, tracks)
+            conn.execute(text(
+                'INSERT OR REPLACE INTO scan_index (path, size, mtime_ns, inode, ok, scanned_at) '
+                'VALUES (:path, :size, :mtime_ns, :inode, :ok, :scanned_at)'
+            ), index_rows)
+        if self.analyze and tracks:
+            schedule_analysis([row['file_path'] for row in tracks])
+
+    def forget(self, engine, paths: List[str], prune: bool = True) -> int:
+        """Oublie des fichiers disparus (et leurs pistes si prune)"""
+        if not paths:
+            return 0
+        rows = [{'path': path} for path in paths]
+        with engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+            conn.execute(text('DELETE FROM scan_index WHERE path = :path'), rows)
+            if prune:
+                conn.execute(text(
+                    'DELETE FROM playlist_tracks WHERE track_id IN '
+                    '(SELECT id FROM tracks WHERE file_path = :path)'
+                ), rows)
+                conn.execute(text('DELETE FROM tracks WHERE file_path = :path'), rows)
+        return len(paths)
+
+    def forget_tree(self, engine, directory: str) -> int:
+        """Oublie tout un dossier disparu et ses pistes"""
+        prefix = os.path.join(directory, '')
+        params = {'prefix': prefix, 'length': len(prefix)}
+        with engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+            conn.execute(text('DELETE FROM scan_index WHERE substr(path, 1, :length) = :prefix'), params)
+            conn.execute(text(
+                'DELETE FROM playlist_tracks WHERE track_id IN '
+                '(SELECT id FROM tracks WHERE substr(file_path, 1, :length) = :prefix)'
+            ), params)
+            return conn.execute(
+                text('DELETE FROM tracks WHERE substr(file_path, 1, :length) = :prefix'), params
+            ).rowcount
+
+    def rename(self, engine, old: str, new: str, directory: bool = False) -> int:
+        """
+        Reporte un déplacement sur les pistes et l'index : une piste déplacée
+        garde son identifiant (et sa place dans les playlists).
+
+        Returns:
+            Nombre de pistes déplacées
+        """
+        with engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+            if directory:
+                old_prefix, new_prefix = os.path.join(old, ''), os.path.join(new, '')
+                params = {'old': old_prefix, 'new': new_prefix, 'length': len(old_prefix)}
+                conn.execute(text(
+                    'UPDATE scan_index SET path = :new || substr(path, :length + 1) '
+                    'WHERE substr(path, 1, :length) = :old'
+                ), params)
+                return conn.execute(text(
+                    'UPDATE tracks SET file_path = :new || substr(file_path, :length + 1) '
+                    'WHERE substr(file_path, 1, :length) = :old'
+                ), params).rowcount
+            params = {'old': old, 'new': new}
+            # Un fichier remplacé par le déplacement cède sa place
+            conn.execute(text('DELETE FROM scan_index WHERE path = :new'), params)
+            conn.execute(text(
+                'DELETE FROM playlist_tracks WHERE track_id IN '
+                '(SELECT id FROM tracks WHERE file_path = :new)'
+            ), params)
+            conn.execute(text('DELETE FROM tracks WHERE file_path = :new'), params)
+            conn.execute(text('UPDATE scan_index SET path = :new WHERE path = :old'), params)
+            return conn.execute(
+                text('UPDATE tracks SET file_path = :new WHERE file_path = :old'), params
+            ).rowcount
+
+    def _update_status(self, **fields):
+        with self.lock:
+            self.status.update(fields)
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return dict(self.status)
+
+    def start(self, app, root: Optional[str] = None, prune: bool = False) -> bool:
+        """
+        Lance une analyse en arrière-plan (une seule à la fois).
+
+        Returns:
+            False si une analyse est déjà en cours
+        """
+        from ..database import db
+
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return False
+            self.status = {'state': 'queued'}
+            root = root or app.config['MUSIC_FOLDER']
+
+            def run():
+                with app.app_context():
+                    try:
+                        self.scan(root, db.engine, prune=prune)
+                    except Exception as e:
+                        logger.error(f"Analyse de la bibliothèque impossible: {str(e)}")
+                        self._update_status(state='failed', error=str(e))
+
+            self.thread = threading.Thread(target=run, name='library-scan', daemon=True)
+            self.thread.start()
+        return True
+
+
+# Instance globale de l'analyseur de bibliothèque
+library_scanner = LibraryScanner()
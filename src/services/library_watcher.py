@@ -0,0 +1,353 @@
+"""
+Surveillance en direct des dossiers de musique et de téléchargements (inotify).
+
+Plutôt que de réanalyser périodiquement toute la bibliothèque (coûteux sur
+une carte SD), les événements du noyau sont regroupés : tant que des
+événements arrivent, rien n'est fait ; après un court silence, chaque
+chemin touché est traité une seule fois selon son état final (présent :
+intégré par la chaîne d'ingestion, absent : retiré de la bibliothèque).
+Un déplacement conserve l'identifiant de la piste. Une avalanche
+d'événements dans un même dossier, ou un débordement de la file du noyau,
+est remplacée par une analyse incrémentale du dossier concerné.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import ctypes
+import struct
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from .ingest import ingest_pipeline, is_temp_file
+from .library_scanner import library_scanner, AUDIO_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Masques inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+_EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+# Silence attendu avant de traiter les événements (secondes)
+DEBOUNCE = 2.0
+# Délai maximal de report sous un flot continu d'événements
+MAX_DELAY = 15.0
+# Au-delà de ce nombre d'événements dans un dossier, il est réanalysé
+STORM_THRESHOLD = 200
+
+
+def inotify_available() -> bool:
+    return sys.platform.startswith('linux')
+
+
+class Inotify:
+    """Accès minimal à inotify via la libc"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> List[Tuple[int, int, int, str]]:
+        """Événements disponibles : (descripteur, masque, cookie, nom)"""
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LibraryWatcher:
+    """Surveillance des dossiers de la bibliothèque et mise à jour incrémentale"""
+
+    def __init__(self, debounce: float = DEBOUNCE, storm_threshold: int = STORM_THRESHOLD):
+        self.debounce = debounce
+        self.storm_threshold = storm_threshold
+        self.roots: List[str] = []
+        self.engine = None
+        self.inotify: Optional[Inotify] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.watches: Dict[int, str] = {}
+        self.stats = Counter()
+        self._reset()
+
+    def _reset(self):
+        # Chemins touchés : traités selon leur état final
+        self.touched: Set[str] = set()
+        self.moves: List[Tuple[str, str, bool]] = []  # (ancien, nouveau, dossier)
+        self.cookies: Dict[int, Tuple[str, bool]] = {}  # déplacements sans destination connue
+        self.deleted_dirs: Set[str] = set()
+        self.rescans: Set[str] = set()
+        self.per_dir = Counter()
+        self.overflowed = False
+        self.first_event = self.last_event = None
+
+    def configure(self, debounce: Optional[float] = None, storm_threshold: Optional[int] = None):
+        if debounce is not None:
+            self.debounce = float(debounce)
+        if storm_threshold is not None:
+            self.storm_threshold = max(int(storm_threshold), 1)
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, app, roots: List[str]) -> bool:
+        """
+        Surveille roots (récursivement).
+
+        Returns:
+            False si inotify n'est pas disponible sur ce système
+        """
+        from ..database import db
+
+        if self.running:
+            return True
+        if not inotify_available():
+            logger.info("inotify indisponible : surveillance de la bibliothèque désactivée")
+            return False
+        with app.app_context():
+            self.engine = db.engine
+        self.roots = [os.path.abspath(root) for root in roots if root]
+        self.inotify = Inotify()
+        for root in self.roots:
+            os.makedirs(root, exist_ok=True)
+            self._watch_tree(root)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name='library-watcher', daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+        self.watches.clear()
+
+    def _watch_tree(self, root: str):
+        """Ajoute une surveillance sur root et ses sous-dossiers (hors dossiers cachés)"""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                self.watches[self.inotify.add_watch(directory)] = directory
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    logger.warning("Limite fs.inotify.max_user_watches atteinte : surveillance partielle")
+                    return
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self.inotify.fd, select.POLLIN)
+        while not self.stopping.is_set():
+            wait = 1.0
+            if self.last_event is not None:
+                wait = max(self.last_event + self.debounce - time.monotonic(), 0)
+            if poller.poll(wait * 1000):
+                for event in self.inotify.read():
+                    self._handle(*event)
+            if self.last_event is None:
+                continue
+            now = time.monotonic()
+            if now - self.last_event >= self.debounce or now - self.first_event >= MAX_DELAY:
+                try:
+                    self._flush()
+                except Exception as e:
+                    logger.error(f"Mise à jour de la bibliothèque impossible: {str(e)}")
+
+    def _handle(self, wd: int, mask: int, cookie: int, name: str):
+        now = time.monotonic()
+        self.last_event = now
+        if self.first_event is None:
+            self.first_event = now
+        self.stats['events'] += 1
+
+        if mask & IN_Q_OVERFLOW:
+            self.overflowed = True
+            return
+        directory = self.watches.get(wd)
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if directory is None or not name or name.startswith('.'):
+            return
+        path = os.path.join(directory, name)
+        self.per_dir[directory] += 1
+
+        if mask & IN_ISDIR:
+            if mask & IN_CREATE:
+                # Des fichiers ont pu y être écrits avant la surveillance
+                self._watch_tree(path)
+                self.rescans.add(path)
+            elif mask & IN_MOVED_FROM:
+                self.cookies[cookie] = (path, True)
+            elif mask & IN_MOVED_TO:
+                source = self.cookies.pop(cookie, None)
+                if source:
+                    self.moves.append((source[0], path, True))
+                    self._rename_watches(source[0], path)
+                else:
+                    self._watch_tree(path)
+                    self.rescans.add(path)
+            elif mask & IN_DELETE:
+                self.deleted_dirs.add(path)
+            return
+
+        if os.path.splitext(name)[1].lower() not in AUDIO_EXTENSIONS or is_temp_file(name):
+            return
+        if mask & IN_MOVED_FROM:
+            self.cookies[cookie] = (path, False)
+        elif mask & IN_MOVED_TO:
+            source = self.cookies.pop(cookie, None)
+            if source and source[0] not in self.touched:
+                self.moves.append((source[0], path, False))
+            else:
+                # Arrivée de l'extérieur, ou fichier pas encore intégré
+                self.touched.add(path)
+                if source:
+                    self.touched.add(source[0])
+        else:
+            self.touched.add(path)
+
+    def _rename_watches(self, old: str, new: str):
+        """Les surveillances suivent un dossier déplacé : mettre leurs chemins à jour"""
+        prefix = os.path.join(old, '')
+        for wd, path in list(self.watches.items()):
+            if path == old or path.startswith(prefix):
+                self.watches[wd] = new + path[len(old):]
+
+    def _unwatch(self, directory: str):
+        """Cesse de surveiller un dossier sorti de la bibliothèque"""
+        prefix = os.path.join(directory, '')
+        for wd, path in list(self.watches.items()):
+            if path == directory or path.startswith(prefix):
+                self.inotify.rm_watch(wd)
+                self.watches.pop(wd, None)
+
+    def _flush(self):
+        """Traite les événements regroupés depuis le dernier silence"""
+        touched, moves, cookies = self.touched, self.moves, self.cookies
+        deleted_dirs, rescans, per_dir, overflowed = self.deleted_dirs, self.rescans, self.per_dir, self.overflowed
+        self._reset()
+
+        if overflowed:
+            # Événements perdus : seule une analyse des dossiers surveillés est sûre
+            logger.warning("File inotify débordée : analyse des dossiers surveillés")
+            for root in self.roots:
+                self._rescan(root)
+            return
+
+        # Avalanche dans un dossier : une analyse ciblée plutôt qu'un traitement par fichier
+        storms = {directory for directory, count in per_dir.items() if count >= self.storm_threshold}
+        rescans |= storms
+
+        def covered(path: str) -> bool:
+            return any(path == d or path.startswith(os.path.join(d, '')) for d in rescans)
+
+        for old, new, is_dir in moves:
+            if covered(old) and covered(new):
+                continue
+            if is_dir:
+                self.stats['moved'] += library_scanner.rename(self.engine, old, new, directory=True)
+            elif library_scanner.rename(self.engine, old, new):
+                self.stats['moved'] += 1
+            else:
+                touched.add(new)
+        # Départ vers un dossier non surveillé : équivaut à une suppression
+        for path, is_dir in cookies.values():
+            if is_dir:
+                self._unwatch(path)
+                deleted_dirs.add(path)
+            else:
+                touched.add(path)
+        for directory in deleted_dirs:
+            self.stats['deleted'] += library_scanner.forget_tree(self.engine, directory)
+
+        gone = []
+        for path in touched:
+            if covered(path):
+                continue
+            if os.path.isfile(path):
+                self._ingest(path)
+            else:
+                gone.append(path)
+        if gone:
+            self.stats['deleted'] += library_scanner.forget(self.engine, gone)
+
+        for directory in rescans:
+            if os.path.isdir(directory):
+                self._rescan(directory)
+
+    def _ingest(self, path: str):
+        # Écritures de la chaîne elle-même (transcodage, balises) ou fichier
+        # déjà confié par le gestionnaire de téléchargements
+        if ingest_pipeline.owns(path):
+            self.stats['skipped'] += 1
+            return
+        try:
+            ingest_pipeline.submit(path=path)
+            self.stats['ingested'] += 1
+        except Exception as e:
+            logger.warning(f"Intégration de {path} impossible: {str(e)}")
+
+    def _rescan(self, directory: str):
+        self.stats['rescans'] += 1
+        library_scanner.scan(directory, self.engine, prune=True)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'watches': len(self.watches), 'roots': list(self.roots)}
+
+
+# Instance globale de la surveillance de la bibliothèque
+library_watcher = LibraryWatcher()
@@ -0,0 +1,296 @@
+"""
+Cache des métadonnées yt-dlp et réutilisation des extracteurs.
+
+Construire un YoutubeDL et initialiser ses extracteurs coûte plusieurs
+secondes sur ARM, et chaque aperçu avant téléchargement réextrayait les
+mêmes métadonnées. Les instances préchauffées sont conservées dans un pool
+et les résultats sont gardés dans une table SQLite, par URL canonique et
+avec une durée de validité : un aperçu répété répond en quelques
+millisecondes.
+"""
+
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import yt_dlp
+
+from ..utils.media_ids import media_key
+from ..utils.exceptions import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Extraction à plat : les entrées d'une playlist ne sont pas résolues une à
+# une, une vidéo seule est extraite complètement (formats compris)
+EXTRACT_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',
+    'skip_download': True,
+    'socket_timeout': 30
+}
+
+# Durée de validité des métadonnées (titres, durées, entrées de playlist)
+DEFAULT_TTL = 6 * 3600
+# Les URL de flux expirent : au-delà, un téléchargement réextrait
+FORMATS_TTL = 30 * 60
+
+# Extracteurs initialisés au démarrage
+WARM_EXTRACTORS = ('Youtube', 'YoutubeTab', 'Soundcloud', 'SoundcloudPlaylist', 'SoundcloudSet')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_info (
+    key TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_info_fetched ON media_info (fetched_at);
+"""
+
+
+def summarize(info: Dict) -> Dict:
+    """Champs utiles à l'aperçu avant téléchargement"""
+    summary = {
+        'title': info.get('title'),
+        'uploader': info.get('uploader') or info.get('channel'),
+        'duration': info.get('duration'),
+        'thumbnail': info.get('thumbnail'),
+        'url': info.get('webpage_url') or info.get('url'),
+        'extractor': info.get('extractor_key') or info.get('ie_key')
+    }
+    if info.get('entries') is not None:
+        summary['entries'] = [
+            {'title': entry.get('title'), 'duration': entry.get('duration'),
+             'url': entry.get('webpage_url') or entry.get('url')}
+            for entry in info['entries']
+        ]
+        summary['track_count'] = len(summary['entries'])
+    return summary
+
+
+class MetadataCache:
+    """Table SQLite des métadonnées extraites, avec expiration"""
+
+    def __init__(self, db_path: str, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """
+        Métadonnées encore valides, ou None.
+
+        Args:
+            max_age: Âge maximal accepté en secondes (par défaut la durée de validité)
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT info, fetched_at FROM media_info WHERE key = ?', (key,)
+            ).fetchone()
+        limit = self.ttl if max_age is None else min(max_age, self.ttl)
+        if not row or time.time() - row[1] > limit:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: str, info: Dict):
+        payload = json.dumps(info)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO media_info (key, info, fetched_at) VALUES (?, ?, ?)',
+                (key, payload, time.time())
+            )
+            self.conn.commit()
+
+    def purge(self) -> int:
+        """Supprime les entrées expirées"""
+        with self.lock:
+            removed = self.conn.execute(
+                'DELETE FROM media_info WHERE fetched_at < ?', (time.time() - self.ttl,)
+            ).rowcount
+            self.conn.commit()
+        return removed
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM media_info').fetchone()[0]
+
+
+class ExtractorPool:
+    """
+    Instances YoutubeDL préchauffées, prêtées à un thread à la fois
+    (une instance n'est pas partagée entre threads).
+    """
+
+    def __init__(self, size: int = 2):
+        self.size = size
+        self.idle: 'queue.LifoQueue[yt_dlp.YoutubeDL]' = queue.LifoQueue()
+        self.stats = {'created': 0, 'reused': 0}
+        self.lock = threading.Lock()
+
+    def _create(self) -> 'yt_dlp.YoutubeDL':
+        ydl = yt_dlp.YoutubeDL({**EXTRACT_OPTIONS, 'logger': logger})
+        for name in WARM_EXTRACTORS:
+            try:
+                # Instancie l'extracteur une fois pour toutes dans cette instance
+                ydl.get_info_extractor(name)
+            except Exception:
+                pass
+        with self.lock:
+            self.stats['created'] += 1
+        return ydl
+
+    @contextmanager
+    def acquire(self) -> Iterator['yt_dlp.YoutubeDL']:
+        try:
+            ydl = self.idle.get_nowait()
+            with self.lock:
+                self.stats['reused'] += 1
+        except queue.Empty:
+            ydl = self._create()
+        try:
+            yield ydl
+        finally:
+            # Au-delà de la taille du pool, l'instance est abandonnée
+            if self.idle.qsize() < self.size:
+                self.idle.put(ydl)
+
+    def warm_up(self):
+        """Prépare les instances du pool (appelé au démarrage, hors requête)"""
+        while self.idle.qsize() < self.size:
+            self.idle.put(self._create())
+
+
+class MediaInfoService:
+    """Extraction des métadonnées avec cache persistant et requêtes fusionnées"""
+
+    def __init__(self, db_path: Optional[str] = None, workers: int = 2, ttl: float = DEFAULT_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.workers = workers
+        self._cache = None
+        self.pool = ExtractorPool(workers)
+        self.executor = None
+        # Extractions en cours : une seule par média, partagée par les demandeurs
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def configure(self, db_path: str, workers: Optional[int] = None, ttl: Optional[float] = None):
+        """(Re)configure l'emplacement et la durée de validité du cache"""
+        self.db_path = str(db_path)
+        if ttl is not None:
+            self.ttl = ttl
+        if workers is not None:
+            self.workers = self.pool.size = max(int(workers), 1)
+        self._cache = None
+
+    @property
+    def cache(self) -> Optional[MetadataCache]:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._cache is None and self.db_path:
+            self._cache = MetadataCache(self.db_path, self.ttl)
+        return self._cache
+
+    def peek(self, url: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Métadonnées en cache uniquement, sans extraction"""
+        return self.cache.get(media_key(url), max_age) if self.cache else None
+
+    def get_info(self, url: str, refresh: bool = False) -> Dict:
+        """
+        Métadonnées d'une URL (vidéo, piste ou playlist), depuis le cache si possible.
+
+        Args:
+            refresh: Ignorer le cache
+        """
+        key = media_key(url)
+        if not refresh and self.cache:
+            info = self.cache.get(key)
+            if info is not None:
+                with self.lock:
+                    self.stats['hits'] += 1
+                return info
+
+        with self.lock:
+            self.stats['misses'] += 1
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.pending[key] = future
+
+        if owner:
+            try:
+                future.set_result(self._extract(url, key))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.pending.pop(key, None)
+        return future.result()
+
+    def get_many(self, urls: List[str]) -> Dict[str, Dict]:
+        """
+        Aperçu d'une liste d'URL : les absentes du cache sont extraites en
+        parallèle par les instances du pool.
+
+        Returns:
+            URL -> métadonnées, ou {'error': ...} pour une URL en échec
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media-info')
+        futures = {url: self.executor.submit(self.get_info, url) for url in dict.fromkeys(urls)}
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                results[url] = {'error': str(e)}
+        return results
+
+    def _extract(self, url: str, key: str) -> Dict:
+        with self.pool.acquire() as ydl:
+            try:
+                info = ydl.extract_info(url, download=False)
+            except yt_dlp.utils.DownloadError as e:
+                raise ServiceError(f"Extraction impossible: {str(e)}")
+            if info is None:
+                raise ServiceError("Aucune information disponible pour cette URL")
+            # Ne garder que des données sérialisables en JSON
+            info = ydl.sanitize_info(info)
+        if 'entries' in info and info['entries'] is not None:
+            info['entries'] = [entry for entry in info['entries'] if entry]
+        if self.cache:
+            self.cache.put(key, info)
+        return info
+
+    def warm_up(self):
+        """Préchauffe les extracteurs et purge le cache expiré"""
+        try:
+            self.pool.warm_up()
+            if self.cache:
+                self.cache.purge()
+        except Exception as e:
+            logger.warning(f"Préchauffage de yt-dlp impossible: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            **self.pool.stats,
+            'entries': self.cache.count() if self.cache else 0
+        }
+
+
+# Instance globale du service de métadonnées
+media_info = MediaInfoService()
@@ -5,8 +5,9 @@ from pathlib import Path
 import mutagen
 from mutagen.easyid3 import EasyID3
 from mutagen.id3 import ID3, APIC, TPE1, TIT2, TALB
-from PIL import Image
-import io
+
+from .tag_reader import tag_reader
+from .cover_store import cover_store, cover_url
 
 logger = logging.getLogger(__name__)
 
@@ -20,33 +21,11 @@ class MetadataExtractor:
         EasyID3.valid_keys['trkn'] = 'TRCK'     # Piste
         
     def extract(self, filepath: Path) -> Dict[str, Any]:
-        """Extrait les métadonnées d'un fichier audio"""
-        try:
-            audio = self._get_audio_metadata(filepath)
-            if not audio:
-                return {}
-                
-            metadata = {
-                'title': self._get_tag(audio, 'title') or filepath.stem,
-                'artist': self._get_tag(audio, 'artist') or 'Artiste inconnu',
-                'album': self._get_tag(audio, 'album') or 'Album inconnu',
-                'year': self._get_tag(audio, 'date') or '',
-                'track': self._get_tag(audio, 'tracknumber') or '0',
-                'duration': self._get_duration(audio),
-                'bitrate': getattr(audio.info, 'bitrate', 0) // 1000 if hasattr(audio.info, 'bitrate') else 0,
-                'sample_rate': getattr(audio.info, 'sample_rate', 0) if hasattr(audio.info, 'sample_rate') else 0,
-                'channels': getattr(audio.info, 'channels', 0) if hasattr(audio.info, 'channels') else 0,
-            }
-            
-            # Essayer d'extraire la pochette d'album
-            cover = self._extract_cover(audio, filepath)
-            if cover:
-                metadata['cover_art'] = cover
-                
-            return metadata
-            
-        except Exception as e:
-            logger.error(f'Erreur lors de l\'extraction des métadonnées pour {filepath}: {str(e)}')
+        """Extrait les métadonnées d'un fichier audio (une lecture, mise en cache)"""
+        filepath = Path(filepath)
+        record = tag_reader.read(str(filepath))
+        if record is None:
+            logger.error(f'Métadonnées illisibles pour {filepath}')
             return {
                 'title': filepath.stem,
                 'artist': 'Artiste inconnu',
@@ -58,6 +37,25 @@ class MetadataExtractor:
                 'sample_rate': 0,
                 'channels': 0,
             }
+            
+        metadata = {
+            'title': record.title or filepath.stem,
+            'artist': record.artist or 'Artiste inconnu',
+            'album': record.album or 'Album inconnu',
+            'year': str(record.year or ''),
+            'track': str(record.track_number or 0),
+            'duration': int(record.duration or 0),
+            'bitrate': record.bitrate or 0,
+            'sample_rate': record.sample_rate or 0,
+            'channels': record.channels or 0,
+        }
+        
+        # Pochette partagée entre les pistes d'un album, générée une seule fois
+        cover = self._extract_cover(filepath)
+        if cover:
+            metadata['cover_art'] = cover
+                
+        return metadata
     
     def _get_audio_metadata(self, filepath: Path):
         """Obtient les métadonnées audio en utilisant mutagen"""
@@ -93,48 +91,7 @@ class MetadataExtractor:
             return 0
         return int(audio.info.length)
     
-    def _extract_cover(self, audio, filepath: Path) -> Optional[str]:
-        """Extrait et enregistre la pochette d'album"""
-        try:
-            # Essayer d'abord avec les tags ID3
-            if hasattr(audio, 'tags') and 'APIC:' in audio.tags:
-                pic = audio.tags['APIC:'].data
-                return self._save_cover(pic, filepath)
-                
-            # Essayer avec les tags mutagens
-            if hasattr(audio, 'pictures') and audio.pictures:
-                return self._save_cover(audio.pictures[0].data, filepath)
-                
-            # Essayer avec les fichiers externes
-            for ext in ['.jpg', '.jpeg', '.png']:
-                cover_path = filepath.with_suffix(ext)
-                if cover_path.exists():
-                    return f'/static/music/{cover_path.name}'
-                    
-            return None
-            
-        except Exception as e:
-            logger.warning(f'Impossible d\'extraire la pochette pour {filepath}: {str(e)}')
-            return None
-    
-    def _save_cover(self, image_data: bytes, filepath: Path) -> str:
-        """Enregistre la pochette et retourne le chemin relatif"""
-        try:
-            # Créer le dossier des pochettes s'il n'existe pas
-            covers_dir = filepath.parent / 'covers'
-            covers_dir.mkdir(exist_ok=True)
-            
-            # Générer un nom de fichier unique
-            cover_path = covers_dir / f'{filepath.stem}_cover.jpg'
-            
-            # Redimensionner et enregistrer l'image
-            img = Image.open(io.BytesIO(image_data))
-            img.thumbnail((300, 300))  # Redimensionner pour économiser de l'espace
-            img = img.convert('RGB')  # Convertir en RGB pour le format JPEG
-            img.save(cover_path, 'JPEG', quality=85)
-            
-            return f'/static/music/covers/{cover_path.name}'
-            
-        except Exception as e:
-            logger.error(f'Erreur lors de l\'enregistrement de la pochette: {str(e)}')
-            return ''
+    def _extract_cover(self, filepath: Path) -> Optional[str]:
+        """Adresse de la pochette d'album (intégrée ou image voisine)"""
+        key = cover_store.add_file(str(filepath))
+        return cover_url(key, cover_store.fit_size(300)) if key else None
@@ -0,0 +1,246 @@
+"""
+Service de génération des extraits de prévisualisation.
+
+Pour chaque piste, un extrait de 20 à 30 secondes est choisi là où l'énergie
+RMS est la plus forte (souvent le refrain), encodé à bas débit et conservé
+dans un cache borné. La génération se fait par lots dans un pool de workers,
+au moment de l'ingestion.
+"""
+
+import os
+import hashlib
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.audio_analysis import iter_pcm_chunks
+from ..utils.exceptions import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Fréquence de décodage pour l'analyse : l'énergie n'a pas besoin de plus
+ANALYSIS_SAMPLE_RATE = 8000
+
+
+def find_excerpt_start(chunks: Iterable[np.ndarray], sample_rate: int = ANALYSIS_SAMPLE_RATE,
+                       clip_seconds: float = 25.0, window_seconds: float = 1.0) -> float:
+    """
+    Trouve le début de l'extrait le plus énergique.
+
+    L'énergie est accumulée par fenêtre d'une seconde au fil des morceaux,
+    puis une somme glissante sur la durée de l'extrait désigne le meilleur
+    départ.
+
+    Returns:
+        Position de départ en secondes
+    """
+    window = max(int(sample_rate * window_seconds), 1)
+    energies: List[float] = []
+    current = 0.0
+    filled = 0
+
+    for chunk in chunks:
+        samples = chunk.astype(np.float64)
+        position = 0
+        while position < len(samples):
+            take = min(window - filled, len(samples) - position)
+            part = samples[position:position + take]
+            current += float(np.dot(part, part))
+            filled += take
+            position += take
+            if filled == window:
+                energies.append(current)
+                current = 0.0
+                filled = 0
+    if filled:
+        energies.append(current * window / filled)
+
+    clip_windows = max(int(clip_seconds / window_seconds), 1)
+    if len(energies) <= clip_windows:
+        return 0.0
+
+    # RMS par fenêtre, puis somme glissante sur la durée de l'extrait
+    rms = np.sqrt(np.asarray(energies) / window)
+    sums = np.convolve(rms, np.ones(clip_windows), mode='valid')
+    return float(np.argmax(sums)) * window_seconds
+
+
+def encode_preview(input_path: str, output_path: str, start: float,
+                   duration: float = 25.0, bitrate: str = '64k'):
+    """Encode un extrait mono à bas débit (MP3), de manière atomique"""
+    tmp_path = f"{output_path}.tmp.mp3"
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin', '-y',
+        '-ss', f"{start:.2f}", '-t', f"{duration:.2f}", '-i', str(input_path),
+        '-vn', '-ac', '1', '-codec:a', 'libmp3lame', '-b:a', bitrate,
+        '-af', 'afade=t=in:d=1,areverse,afade=t=in:d=1,areverse',
+        tmp_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise ServiceError("ffmpeg introuvable")
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise ServiceError(f"Échec de l'encodage de l'extrait: {result.stderr.strip()}")
+    os.replace(tmp_path, output_path)
+
+
+class PreviewCache:
+    """Cache disque de fichiers dérivés (extraits, images), borné en octets avec éviction LRU"""
+
+    def __init__(self, root: str, max_bytes: int, suffix: str = '.mp3'):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, int]' = OrderedDict()  # clé -> taille
+        self.total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Reconstruit l'index depuis le disque, du moins au plus récemment utilisé"""
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.endswith(self.suffix) and '.tmp' not in entry.name:
+                stat = entry.stat()
+                key = entry.name[:len(entry.name) - len(self.suffix)]
+                files.append((stat.st_atime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Retourne le chemin de l'extrait s'il est en cache"""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        return self.path_for(key)
+
+    def add(self, key: str):
+        """Enregistre un extrait écrit sur le disque et applique le budget"""
+        size = os.path.getsize(self.path_for(key))
+        evicted = []
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path_for(old_key))
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+class PreviewService:
+    """Génération par lots des extraits dans un pool de workers"""
+
+    def __init__(self, root: str = 'static/uploads/previews', max_bytes: int = 512 * 1024 * 1024,
+                 workers: int = 2, clip_seconds: float = 25.0, bitrate: str = '64k'):
+        self.clip_seconds = clip_seconds
+        self.bitrate = bitrate
+        self.workers = workers
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._cache = None
+        self.executor = None
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, root: str, max_bytes: int):
+        """(Re)configure l'emplacement et le budget du cache"""
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._cache = None
+
+    @property
+    def cache(self) -> PreviewCache:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._cache is None:
+            self._cache = PreviewCache(self.root, self.max_bytes)
+        return self._cache
+
+    @staticmethod
+    def cache_key(path: str) -> str:
+        """Clé de cache liée au contenu courant du fichier (chemin, taille, date)"""
+        stat = os.stat(path)
+        raw = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+    def get(self, path: str) -> Optional[Tuple[str, str]]:
+        """Retourne (chemin de l'extrait, clé) s'il est prêt"""
+        try:
+            key = self.cache_key(path)
+        except OSError:
+            return None
+        cached = self.cache.get(key)
+        return (cached, key) if cached else None
+
+    def submit_batch(self, paths: List[str]) -> int:
+        """
+        Planifie la génération des extraits manquants.
+
+        Returns:
+            Nombre d'extraits effectivement planifiés
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='preview')
+
+        scheduled = 0
+        for path in paths:
+            try:
+                key = self.cache_key(path)
+            except OSError:
+                continue
+            with self.lock:
+                if key in self.pending or self.cache.get(key):
+                    continue
+                self.pending[key] = self.executor.submit(self._generate, path, key)
+                scheduled += 1
+        return scheduled
+
+    def _generate(self, path: str, key: str):
+        try:
+            start = find_excerpt_start(
+                iter_pcm_chunks(path, ANALYSIS_SAMPLE_RATE),
+                ANALYSIS_SAMPLE_RATE,
+                self.clip_seconds
+            )
+            encode_preview(path, self.cache.path_for(key), start, self.clip_seconds, self.bitrate)
+            self.cache.add(key)
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération de l'extrait de {path}: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            pending = len(self.pending)
+        return {**self.cache.get_stats(), 'pending': pending}
+
+
+# Instance globale du service d'extraits
+preview_service = PreviewService()
@@ -0,0 +1,234 @@
+"""
+Ordonnanceur unique des téléchargements.
+
+Un pool fixe de workers exécute les tâches de tous les gestionnaires de
+téléchargement. Les tâches interactives (une piste demandée par un
+utilisateur) passent avant les lots, chaque source a un plafond de
+téléchargements simultanés et, à priorité égale, les utilisateurs sont
+servis à tour de rôle pour qu'un lot de 200 liens ne bloque pas les autres.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Classes de priorité (la plus petite valeur passe en premier)
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+# Plafonds par défaut de téléchargements simultanés par source
+DEFAULT_SOURCE_LIMITS = {'youtube': 2, 'soundcloud': 2, 'spotify': 1}
+
+# Nombre de temps d'attente conservés pour les métriques
+WAIT_SAMPLES = 500
+
+
+@dataclass
+class ScheduledJob:
+    """Tâche en attente ou en cours d'exécution dans l'ordonnanceur"""
+    id: str
+    func: Callable
+    args: Tuple = ()
+    priority: int = BATCH
+    source: str = 'default'
+    user_id: Optional[Any] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+
+
+class DownloadScheduler:
+    """Pool borné de workers avec priorités, plafonds par source et équité"""
+
+    def __init__(self, workers: int = 3, source_limits: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            workers: Nombre de téléchargements simultanés au total
+            source_limits: Plafond de téléchargements simultanés par source
+        """
+        self.workers = workers
+        self.source_limits = dict(DEFAULT_SOURCE_LIMITS if source_limits is None else source_limits)
+        self.condition = threading.Condition()
+        # priorité -> utilisateur -> tâches, et ordre de passage des utilisateurs
+        self.queues: Dict[int, Dict[Any, Deque[ScheduledJob]]] = {INTERACTIVE: {}, BATCH: {}}
+        self.rotation: Dict[int, Deque[Any]] = {INTERACTIVE: deque(), BATCH: deque()}
+        self.queued: Dict[str, ScheduledJob] = {}
+        self.running: Dict[str, ScheduledJob] = {}
+        self.running_by_source: Dict[str, int] = {}
+        self.threads: List[threading.Thread] = []
+        self.waits: Dict[int, Deque[float]] = {INTERACTIVE: deque(maxlen=WAIT_SAMPLES),
+                                               BATCH: deque(maxlen=WAIT_SAMPLES)}
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def configure(self, workers: Optional[int] = None,
+                  source_limits: Optional[Dict[str, int]] = None):
+        """Modifie la taille du pool et les plafonds par source"""
+        with self.condition:
+            if workers is not None:
+                self.workers = max(int(workers), 1)
+            if source_limits is not None:
+                self.source_limits = dict(source_limits)
+            if self.threads:
+                self._start_workers()
+            self.condition.notify_all()
+
+    def submit(self, job_id: str, func: Callable, *args, priority: int = BATCH,
+               source: str = 'default', user_id: Optional[Any] = None) -> str:
+        """
+        Planifie une tâche. Les coroutines sont exécutées dans la boucle
+        d'événements propre au worker.
+
+        Returns:
+            Identifiant de la tâche
+        """
+        job = ScheduledJob(job_id, func, args, priority, source or 'default', user_id)
+        with self.condition:
+            if not self.threads:
+                self._start_workers()
+            users = self.queues[priority]
+            if user_id not in users:
+                users[user_id] = deque()
+                self.rotation[priority].append(user_id)
+            users[user_id].append(job)
+            self.queued[job_id] = job
+            self.stats['submitted'] += 1
+            self.condition.notify()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Retire une tâche encore en attente.
+
+        Returns:
+            False si la tâche a déjà démarré ou n'existe pas
+        """
+        with self.condition:
+            job = self.queued.pop(job_id, None)
+            if not job:
+                return False
+            self.queues[job.priority][job.user_id].remove(job)
+            self.stats['cancelled'] += 1
+            return True
+
+    def get_metrics(self) -> Dict:
+        """Profondeur des files et temps d'attente avant démarrage"""
+        now = time.monotonic()
+        with self.condition:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            oldest = {name: 0.0 for name in PRIORITY_NAMES.values()}
+            queued_by_source: Dict[str, int] = {}
+            for job in self.queued.values():
+                name = PRIORITY_NAMES[job.priority]
+                depth[name] += 1
+                oldest[name] = max(oldest[name], now - job.enqueued_at)
+                queued_by_source[job.source] = queued_by_source.get(job.source, 0) + 1
+
+            waits = {}
+            for priority, samples in self.waits.items():
+                ordered = sorted(samples)
+                waits[PRIORITY_NAMES[priority]] = {
+                    'samples': len(ordered),
+                    'avg': round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+                    'p95': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3) if ordered else 0.0,
+                    'max': round(ordered[-1], 3) if ordered else 0.0,
+                    'oldest_queued': round(oldest[PRIORITY_NAMES[priority]], 3)
+                }
+
+            return {
+                'workers': self.workers,
+                'running': len(self.running),
+                'queue_depth': depth,
+                'queued_by_source': queued_by_source,
+                'running_by_source': dict(self.running_by_source),
+                'source_limits': dict(self.source_limits),
+                'queued_users': len({job.user_id for job in self.queued.values()}),
+                'wait_seconds': waits,
+                **self.stats
+            }
+
+    def _start_workers(self):
+        """Démarre les workers manquants (appelé sous le verrou)"""
+        self.threads = [t for t in self.threads if t.is_alive()]
+        for index in range(len(self.threads), self.workers):
+            thread = threading.Thread(target=self._worker, args=(index,),
+                                      name=f'download-{index}', daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def _next_job(self) -> Optional[ScheduledJob]:
+        """
+        Choisit la prochaine tâche (appelé sous le verrou) : la classe la plus
+        prioritaire d'abord, les utilisateurs à tour de rôle, en sautant les
+        sources qui ont atteint leur plafond.
+        """
+        for priority in sorted(self.queues):
+            users = self.queues[priority]
+            rotation = self.rotation[priority]
+            for _ in range(len(rotation)):
+                if not rotation:
+                    break
+                user_id = rotation[0]
+                rotation.rotate(-1)
+                jobs = users[user_id]
+                for job in jobs:
+                    limit = self.source_limits.get(job.source)
+                    if limit is None or self.running_by_source.get(job.source, 0) < limit:
+                        jobs.remove(job)
+                        if not jobs:
+                            del users[user_id]
+                            rotation.remove(user_id)
+                        return job
+                if not jobs:
+                    del users[user_id]
+                    rotation.remove(user_id)
+        return None
+
+    def _worker(self, index: int):
+        # Boucle propre au worker, conservée d'une tâche à l'autre : les
+        # ressources asynchrones (sessions HTTP) peuvent y être réutilisées
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            with self.condition:
+                job = None
+                while job is None:
+                    # Pool réduit par configure() : ce worker s'arrête
+                    if index >= self.workers:
+                        loop.close()
+                        return
+                    job = self._next_job()
+                    if job is None:
+                        self.condition.wait()
+                del self.queued[job.id]
+                job.started_at = time.monotonic()
+                self.waits[job.priority].append(job.started_at - job.enqueued_at)
+                self.running[job.id] = job
+                self.running_by_source[job.source] = self.running_by_source.get(job.source, 0) + 1
+
+            outcome = 'completed'
+            try:
+                result = job.func(*job.args)
+                if asyncio.iscoroutine(result):
+                    loop.run_until_complete(result)
+            except Exception as e:
+                outcome = 'failed'
+                logger.error(f"Erreur dans la tâche de téléchargement {job.id}: {str(e)}")
+            finally:
+                with self.condition:
+                    self.running.pop(job.id, None)
+                    self.running_by_source[job.source] -= 1
+                    if not self.running_by_source[job.source]:
+                        del self.running_by_source[job.source]
+                    self.stats[outcome] += 1
+                    # Un slot de source s'est libéré : d'autres tâches peuvent partir
+                    self.condition.notify_all()
+
+
+# Instance globale de l'ordonnanceur de téléchargements
+download_scheduler = DownloadScheduler()
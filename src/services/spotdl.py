@@ -0,0 +1,114 @@
+"""
+Téléchargements Spotify via spotDL.
+
+Chaque exécution écrit dans un répertoire qui lui est propre, avec un nom
+de fichier dérivé de l'identifiant Spotify de la piste : les fichiers
+produits sont connus exactement, sans parcourir la bibliothèque ni
+confondre deux téléchargements simultanés. Les métadonnées (titre,
+artistes) viennent du fichier de sauvegarde JSON de spotDL. Plusieurs
+pistes peuvent être confiées à un seul processus pour amortir son
+démarrage.
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from ..utils.media_ids import canonicalize_url
+from ..utils.process_control import run_cancellable
+from ..utils.exceptions import ServiceError
+
+logger = logging.getLogger(__name__)
+
+# Nom de sortie dans le répertoire de l'exécution : unique par piste
+OUTPUT_TEMPLATE = '{track-id}.{output-ext}'
+# Nombre maximal de pistes confiées à un même processus spotDL
+SPOTDL_BATCH_SIZE = 20
+
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def spotify_track_id(url: str) -> Optional[str]:
+    """Identifiant d'une piste Spotify (None pour un album ou une playlist)"""
+    extractor, media_id = canonicalize_url(url)
+    return media_id if extractor == 'spotify:track' else None
+
+
+def _final_path(output_dir: str, song: Dict, extension: str) -> str:
+    """Nom lisible « Artistes - Titre.ext », sans écraser un fichier existant"""
+    artists = ', '.join(song.get('artists') or []) or song.get('artist') or 'Inconnu'
+    name = _UNSAFE_CHARS.sub('_', f"{artists} - {song.get('name') or song.get('song_id')}").strip(' .')
+    path = os.path.join(output_dir, f"{name}.{extension}")
+    index = 2
+    while os.path.exists(path):
+        path = os.path.join(output_dir, f"{name} ({index}).{extension}")
+        index += 1
+    return path
+
+
+def run_spotdl(urls: List[str], output_dir: str, cancel_event: Optional[threading.Event] = None,
+               audio_format: str = 'mp3', timeout: Optional[float] = None) -> Dict[str, List[str]]:
+    """
+    Télécharge une ou plusieurs URL Spotify en un seul processus spotDL.
+
+    Args:
+        urls: Pistes (plusieurs à la fois) ou un album / une playlist
+        output_dir: Répertoire final des fichiers
+        cancel_event: Annulation : le groupe de processus est terminé
+
+    Returns:
+        URL demandée -> chemins des fichiers produits (vide si la piste a échoué)
+
+    Raises:
+        TaskCancelled: Exécution annulée (les fichiers partiels sont supprimés)
+        ServiceError: spotDL a échoué sans produire aucun fichier
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    job_dir = tempfile.mkdtemp(prefix='.spotdl-', dir=output_dir)
+    save_file = os.path.join(job_dir, 'songs.spotdl')
+    cmd = [
+        'spotdl', 'download', *urls,
+        '--output', os.path.join(job_dir, OUTPUT_TEMPLATE),
+        '--format', audio_format,
+        '--save-file', save_file
+    ]
+    try:
+        try:
+            result = run_cancellable(cmd, cancel_event, timeout=timeout)
+        except FileNotFoundError:
+            raise ServiceError("spotDL introuvable")
+        try:
+            with open(save_file, 'r', encoding='utf-8') as f:
+                songs = json.load(f)
+        except (OSError, ValueError):
+            songs = []
+
+        # Fichiers produits, par identifiant de piste
+        produced: Dict[str, str] = {}
+        for song in songs:
+            song_id = song.get('song_id') or spotify_track_id(song.get('url', ''))
+            path = os.path.join(job_dir, f"{song_id}.{audio_format}")
+            if song_id and os.path.exists(path):
+                final = _final_path(output_dir, song, audio_format)
+                os.replace(path, final)
+                produced[song_id] = final
+
+        if not produced and result.returncode != 0:
+            raise ServiceError(f"spotDL: {result.stderr.strip() or result.stdout.strip()}")
+
+        files: Dict[str, List[str]] = {}
+        for url in urls:
+            track_id = spotify_track_id(url)
+            files[url] = [produced.pop(track_id)] if track_id in produced else []
+        # Pistes d'un album ou d'une playlist : rattachées à l'URL de la collection
+        collections = [url for url in urls if spotify_track_id(url) is None]
+        if collections:
+            files[collections[0]].extend(produced.values())
+        return files
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
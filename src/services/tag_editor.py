@@ -0,0 +1,243 @@
+"""
+Modification des balises des pistes de la bibliothèque, sur place.
+
+Les fichiers sont déjà sur le serveur : inutile de les renvoyer pour
+changer un titre. Les balises d'un lot de pistes sont écrites en
+parallèle, puis les lignes de tracks sont mises à jour en une seule
+transaction. Si cette transaction échoue, les balises précédentes sont
+rétablies : fichiers et base restent cohérents, sans garder le verrou
+d'écriture SQLite pendant les écritures de fichiers.
+"""
+
+import os
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import mutagen
+
+from .tag_reader import tag_reader
+from ..utils.exceptions import ServiceError, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Champs modifiables et clés mutagen « easy » correspondantes
+EDITABLE_FIELDS = {
+    'title': 'title',
+    'artist': 'artist',
+    'album': 'album',
+    'genre': 'genre',
+    'year': 'date',
+    'track_number': 'tracknumber'
+}
+# Champs recopiés dans la table tracks
+TRACK_COLUMNS = ('title', 'artist', 'album')
+NUMERIC_FIELDS = ('year', 'track_number')
+# Écritures de fichiers simultanées
+DEFAULT_WORKERS = 4
+# Pistes modifiables par requête
+MAX_BATCH = 500
+
+
+def validate_changes(changes: Dict) -> Dict[str, Optional[str]]:
+    """
+    Vérifie et normalise des modifications ({champ: valeur}, None pour effacer).
+
+    Raises:
+        ValidationError: Champ inconnu, titre vide ou valeur non numérique
+    """
+    if not isinstance(changes, dict) or not changes:
+        raise ValidationError("Aucune modification demandée")
+    unknown = set(changes) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise ValidationError(f"Champs non modifiables: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    for field, value in changes.items():
+        value = None if value is None else str(value).strip() or None
+        if field == 'title' and value is None:
+            raise ValidationError("Le titre ne peut pas être vide")
+        if field in NUMERIC_FIELDS and value is not None and not value.split('/')[0].isdigit():
+            raise ValidationError(f"Valeur numérique attendue pour {field}")
+        normalized[field] = value
+    return normalized
+
+
+def unshare(path: str):
+    """
+    Donne sa propre copie à un fichier partagé par lien physique (doublon
+    dédoublonné au téléchargement) : écrire ses balises sur place
+    modifierait aussi les autres noms du même contenu.
+    """
+    if os.stat(path).st_nlink <= 1:
+        return
+    tmp_path = f"{path}.unshare"
+    try:
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_tags(path: str, changes: Dict[str, Optional[str]]) -> Dict[str, Optional[List[str]]]:
+    """
+    Écrit des balises dans un fichier.
+
+    Returns:
+        Valeurs précédentes des clés modifiées (pour restore_tags)
+    """
+    audio = mutagen.File(path, easy=True)
+    if audio is None:
+        raise ServiceError("Format audio non reconnu")
+    if audio.tags is None:
+        audio.add_tags()
+
+    previous = {}
+    try:
+        for field, value in changes.items():
+            key = EDITABLE_FIELDS[field]
+            previous[key] = list(audio[key]) if key in audio else None
+            if value is None:
+                if key in audio:
+                    del audio[key]
+            else:
+                audio[key] = [value]
+    except (KeyError, TypeError, ValueError) as e:
+        # Balises sans interface simplifiée (WAV, AIFF...)
+        raise ServiceError(f"Balises non modifiables pour ce format: {str(e)}")
+    unshare(path)
+    audio.save()
+    return previous
+
+
+def restore_tags(path: str, previous: Dict[str, Optional[List[str]]]):
+    """Rétablit les valeurs renvoyées par write_tags"""
+    audio = mutagen.File(path, easy=True)
+    for key, values in previous.items():
+        if values is None:
+            if key in audio:
+                del audio[key]
+        else:
+            audio[key] = values
+    audio.save()
+
+
+class TagEditor:
+    """Modification des balises et des pistes correspondantes"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = workers
+
+    def configure(self, workers: Optional[int] = None):
+        if workers is not None:
+            self.workers = max(int(workers), 1)
+
+    def edit(self, track_id: int, changes: Dict) -> Dict:
+        """
+        Modifie une piste.
+
+        Returns:
+            Piste mise à jour (to_dict)
+
+        Raises:
+            ValidationError: Modification invalide, ou autre piste désignée
+            ServiceError: Écriture impossible
+        """
+        # La piste est celle de l'adresse : un identifiant différent dans le corps est refusé
+        if 'id' in changes and str(changes['id']) != str(track_id):
+            raise ValidationError("L'identifiant ne correspond pas à la piste modifiée")
+        result = self.edit_many([{**changes, 'id': track_id}])
+        if track_id in result['errors']:
+            raise ServiceError(result['errors'][track_id])
+        return result['updated'][0]
+
+    def edit_many(self, edits: List[Dict]) -> Dict:
+        """
+        Modifie un lot de pistes ([{'id': 1, 'title': ...}, ...]).
+
+        Les balises sont écrites en parallèle ; les pistes dont l'écriture a
+        réussi sont mises à jour en une transaction.
+
+        Returns:
+            {'updated': [pistes], 'errors': {id: message}}
+
+        Raises:
+            ValidationError: Lot vide, trop grand ou modification invalide
+            ServiceError: Échec de la transaction (balises rétablies)
+        """
+        from ..database import db
+        from ..models.track import Track
+        from ..utils.db_optimizations import query_cache
+
+        if not edits:
+            raise ValidationError("La liste des pistes est vide")
+        if len(edits) > MAX_BATCH:
+            raise ValidationError(f"Au plus {MAX_BATCH} pistes par requête")
+
+        # Une seule écriture par piste : la dernière modification l'emporte
+        changes: Dict[int, Dict] = {}
+        for edit in edits:
+            edit = dict(edit)
+            try:
+                track_id = int(edit.pop('id'))
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError("Identifiant de piste manquant ou invalide")
+            changes.setdefault(track_id, {}).update(edit)
+        changes = {track_id: validate_changes(fields) for track_id, fields in changes.items()}
+
+        errors: Dict[int, str] = {}
+        tracks = {track.id: track for track in Track.query.filter(Track.id.in_(list(changes))).all()}
+        jobs = []
+        for track_id in changes:
+            track = tracks.get(track_id)
+            if track is None:
+                errors[track_id] = "Piste introuvable"
+            elif not os.path.isfile(track.file_path):
+                errors[track_id] = "Fichier introuvable"
+            else:
+                jobs.append(track)
+
+        written: Dict[int, Tuple[str, Dict]] = {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs) or 1)) as executor:
+            futures = {
+                track.id: executor.submit(write_tags, track.file_path, changes[track.id])
+                for track in jobs
+            }
+            for track_id, future in futures.items():
+                try:
+                    written[track_id] = (tracks[track_id].file_path, future.result())
+                except Exception as e:
+                    logger.warning(f"Écriture des balises de la piste {track_id} impossible: {str(e)}")
+                    errors[track_id] = str(e)
+
+        updated = []
+        try:
+            for track_id, (path, _) in written.items():
+                track = tracks[track_id]
+                for field in TRACK_COLUMNS:
+                    if field in changes[track_id]:
+                        setattr(track, field, changes[track_id][field])
+                track.file_size = os.path.getsize(path)
+                updated.append(track)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # Compensation : les fichiers reprennent leurs balises d'origine
+            for path, previous in written.values():
+                try:
+                    restore_tags(path, previous)
+                except Exception as restore_error:
+                    logger.error(f"Balises de {path} non rétablies: {str(restore_error)}")
+            raise ServiceError(f"Mise à jour des pistes impossible: {str(e)}")
+        finally:
+            tag_reader.invalidate(path for path, _ in written.values())
+
+        if updated:
+            query_cache.clear()
+        return {'updated': [track.to_dict() for track in updated], 'errors': errors}
+
+
+# Instance globale de l'éditeur de balises
+tag_editor = TagEditor()
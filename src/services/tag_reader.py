@@ -0,0 +1,330 @@
+"""
+Lecture des balises et des propriétés audio en une seule passe, avec cache.
+
+Un seul appel à mutagen par fichier : seules les zones de balises (ID3,
+commentaires Vorbis, atomes MP4) et les en-têtes de flux sont lus, jamais
+les données audio. Le résultat est un enregistrement compact et typé,
+sérialisable vers un processus du pool ou vers le cache. Le cache est
+indexé par (chemin, taille, mtime) : un fichier modifié est relu, un
+fichier inchangé ne l'est jamais deux fois.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import mutagen
+
+logger = logging.getLogger(__name__)
+
+# En deçà, lire dans le processus courant : démarrer un pool coûterait plus cher
+INLINE_LIMIT = 2000
+# Fichiers confiés à un processus du pool à la fois
+CHUNK_SIZE = 256
+# Enregistrements gardés en mémoire
+MEMORY_CACHE_SIZE = 20000
+
+# Clés des champs selon le format : ID3, Vorbis/FLAC/Opus, MP4, ASF (WMA)
+FIELD_KEYS = {
+    'title': ('TIT2', 'title', '\xa9nam', 'Title'),
+    'artist': ('TPE1', 'artist', '\xa9ART', 'Author'),
+    'album': ('TALB', 'album', '\xa9alb', 'WM/AlbumTitle'),
+    'genre': ('TCON', 'genre', '\xa9gen', 'WM/Genre'),
+    'year': ('TDRC', 'date', '\xa9day', 'WM/Year'),
+    'track_number': ('TRCK', 'tracknumber', 'trkn', 'WM/TrackNumber')
+}
+COVER_KEYS = ('covr', 'metadata_block_picture', 'WM/Picture')
+# Paroles non synchronisées : Vorbis/FLAC/Opus, MP4 (ID3 : cadres USLT)
+LYRICS_KEYS = ('lyrics', 'unsyncedlyrics', '\xa9lyr')
+
+_LEADING_INT = re.compile(r'\d+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tag_cache (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+"""
+
+
+class AudioMetadata(NamedTuple):
+    """Balises et propriétés d'un fichier audio"""
+    path: str
+    size: int
+    mtime_ns: int
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    genre: Optional[str] = None
+    year: Optional[int] = None
+    track_number: Optional[int] = None
+    duration: Optional[float] = None
+    bitrate: Optional[int] = None  # kbps
+    sample_rate: Optional[int] = None  # Hz
+    channels: Optional[int] = None
+    has_cover: bool = False
+    lyrics: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if hasattr(value, 'text'):
+        # Cadre ID3 : liste de textes
+        value = value.text
+    if isinstance(value, list):
+        if not value:
+            return None
+        value = value[0]
+    if isinstance(value, tuple):
+        # MP4 trkn : (numéro, total)
+        value = value[0]
+    text = str(value).strip()
+    return text or None
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    match = _LEADING_INT.search(value) if value else None
+    return int(match.group()) if match else None
+
+
+def _has_cover(audio) -> bool:
+    if getattr(audio, 'pictures', None):
+        return True
+    tags = audio.tags
+    if tags is None:
+        return False
+    if hasattr(tags, 'getall'):
+        return bool(tags.getall('APIC'))
+    return any(key in tags for key in COVER_KEYS)
+
+
+def _lyrics(tags) -> Optional[str]:
+    if hasattr(tags, 'getall'):
+        frames = tags.getall('USLT')
+        return (frames[0].text or None) if frames else None
+    for key in LYRICS_KEYS:
+        try:
+            value = tags.get(key)
+        except (KeyError, ValueError, TypeError):
+            value = None
+        if value:
+            return str(value[0]) if isinstance(value, list) else str(value)
+    return None
+
+
+def read_metadata(path: str, stat: Optional[os.stat_result] = None) -> Optional[AudioMetadata]:
+    """
+    Lit un fichier en une passe (balises et en-têtes uniquement).
+
+    Returns:
+        Enregistrement, ou None pour un fichier illisible ou non audio
+    """
+    try:
+        stat = stat or os.stat(path)
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    if audio is None:
+        return None
+
+    fields = {}
+    tags = audio.tags
+    if tags is not None:
+        for name, keys in FIELD_KEYS.items():
+            for key in keys:
+                try:
+                    value = _text(tags.get(key))
+                except (KeyError, ValueError, TypeError):
+                    value = None
+                if value:
+                    fields[name] = value
+                    break
+    info = audio.info
+    bitrate = getattr(info, 'bitrate', 0) or 0
+    return AudioMetadata(
+        path=path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        title=fields.get('title'),
+        artist=fields.get('artist'),
+        album=fields.get('album'),
+        genre=fields.get('genre'),
+        year=_int(fields.get('year')),
+        track_number=_int(fields.get('track_number')),
+        duration=getattr(info, 'length', None),
+        bitrate=bitrate // 1000 or None,
+        sample_rate=getattr(info, 'sample_rate', None),
+        channels=getattr(info, 'channels', None),
+        has_cover=_has_cover(audio),
+        lyrics=_lyrics(tags) if tags is not None else None
+    )
+
+
+def read_batch(paths: List[str], workers: Optional[int] = None) -> Iterator[Optional[AudioMetadata]]:
+    """
+    Lit une liste de fichiers, dans un pool de processus au-delà de quelques
+    fichiers. Les résultats suivent l'ordre de paths.
+    """
+    if len(paths) <= INLINE_LIMIT:
+        yield from map(read_metadata, paths)
+        return
+    # spawn : pas de fork d'un serveur multithreadé
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=context) as executor:
+        yield from executor.map(read_metadata, paths, chunksize=CHUNK_SIZE)
+
+
+class TagCache:
+    """Table SQLite des enregistrements, valables tant que taille et mtime sont inchangées"""
+
+    def __init__(self, db_path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[AudioMetadata]:
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT record FROM tag_cache WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (path, size, mtime_ns)
+            ).fetchone()
+        if not row:
+            return None
+        record = json.loads(row[0])
+        # Enregistrement d'une version antérieure (champs manquants) : relire
+        if len(record) != len(AudioMetadata._fields):
+            return None
+        return AudioMetadata(*record)
+
+    def put_many(self, records: Iterable[AudioMetadata]):
+        rows = [(r.path, r.size, r.mtime_ns, json.dumps(list(r))) for r in records]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO tag_cache (path, size, mtime_ns, record) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self.conn.commit()
+
+    def delete_many(self, paths: Iterable[str]):
+        rows = [(path,) for path in paths]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany('DELETE FROM tag_cache WHERE path = ?', rows)
+            self.conn.commit()
+
+
+class TagReader:
+    """Lecture des métadonnées avec cache mémoire et cache persistant"""
+
+    def __init__(self, db_path: Optional[str] = None, workers: Optional[int] = None,
+                 memory_size: int = MEMORY_CACHE_SIZE):
+        self.db_path = db_path
+        self.workers = workers
+        self.memory_size = memory_size
+        self.memory: 'OrderedDict[str, AudioMetadata]' = OrderedDict()
+        self._cache = None
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def configure(self, db_path: Optional[str] = None, workers: Optional[int] = None):
+        if db_path:
+            self.db_path = str(db_path)
+            self._cache = None
+        if workers is not None:
+            self.workers = max(int(workers), 1)
+
+    @property
+    def cache(self) -> Optional[TagCache]:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._cache is None and self.db_path:
+            self._cache = TagCache(self.db_path)
+        return self._cache
+
+    def _lookup(self, path: str, stat: os.stat_result) -> Optional[AudioMetadata]:
+        with self.lock:
+            record = self.memory.get(path)
+            if record is not None and (record.size, record.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                self.memory.move_to_end(path)
+                self.stats['hits'] += 1
+                return record
+        record = self.cache.get(path, stat.st_size, stat.st_mtime_ns) if self.cache else None
+        with self.lock:
+            self.stats['hits' if record else 'misses'] += 1
+        if record:
+            self._remember([record])
+        return record
+
+    def _remember(self, records: List[AudioMetadata]):
+        with self.lock:
+            for record in records:
+                self.memory[record.path] = record
+                self.memory.move_to_end(record.path)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def read(self, path: str) -> Optional[AudioMetadata]:
+        """Métadonnées d'un fichier (None s'il est illisible)"""
+        return self.read_many([path]).get(path)
+
+    def read_many(self, paths: Iterable[str]) -> Dict[str, Optional[AudioMetadata]]:
+        """
+        Métadonnées d'un lot de fichiers : les absents du cache sont lus en
+        parallèle et enregistrés en une transaction.
+        """
+        results: Dict[str, Optional[AudioMetadata]] = {}
+        misses = []
+        for path in dict.fromkeys(str(p) for p in paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                results[path] = None
+                continue
+            record = self._lookup(path, stat)
+            if record is None:
+                misses.append(path)
+            results[path] = record
+
+        fresh = [record for record in read_batch(misses, self.workers) if record]
+        for record in fresh:
+            results[record.path] = record
+        if fresh:
+            self._remember(fresh)
+            if self.cache:
+                self.cache.put_many(fresh)
+        return results
+
+    def invalidate(self, paths: Iterable[str]):
+        """Oublie les enregistrements de fichiers réécrits"""
+        paths = [str(p) for p in paths]
+        with self.lock:
+            for path in paths:
+                self.memory.pop(path, None)
+        if self.cache:
+            self.cache.delete_many(paths)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {**self.stats, 'memory_entries': len(self.memory)}
+
+
+# Instance globale du lecteur de métadonnées
+tag_reader = TagReader()
@@ -0,0 +1,237 @@
+"""
+Service de calcul des pics de forme d'onde.
+
+Chaque piste est décodée une seule fois avec ffmpeg ; les pics min/max sont
+calculés en flux avec NumPy à plusieurs résolutions, puis enregistrés dans
+un petit fichier binaire à côté de la piste ({piste}.peaks).
+
+Format du fichier (little-endian) :
+    en-tête  : magic 'CPK1', sample_rate (u32), nombre de niveaux (u16)
+    niveaux  : samples_per_peak (u32), count (u32) pour chaque niveau
+    données  : pour chaque niveau, count paires (min, max) int16 entrelacées
+"""
+
+import os
+import queue
+import struct
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.audio_analysis import iter_pcm_chunks
+
+logger = logging.getLogger(__name__)
+
+PEAKS_MAGIC = b'CPK1'
+PEAKS_SUFFIX = '.peaks'
+_HEADER = struct.Struct('<4sIH')
+_LEVEL = struct.Struct('<II')
+
+
+@dataclass
+class PeakLevel:
+    """Un niveau de résolution : pics min/max par groupe d'échantillons"""
+    samples_per_peak: int
+    mins: np.ndarray
+    maxs: np.ndarray
+
+    @property
+    def count(self) -> int:
+        return len(self.mins)
+
+
+@dataclass
+class PeakData:
+    """Pics multi-résolution d'une piste, du plus fin au plus grossier"""
+    sample_rate: int
+    levels: List[PeakLevel]
+
+    def select(self, resolution: int) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Retourne exactement `resolution` pics (ou moins si la piste est courte).
+
+        Le niveau le plus grossier couvrant la résolution demandée est réduit,
+        ce qui évite de parcourir les données les plus fines.
+
+        Returns:
+            (mins, maxs, échantillons par pic)
+        """
+        level = self.levels[0]
+        for candidate in self.levels:
+            if candidate.count >= resolution:
+                level = candidate
+        if level.count <= resolution:
+            return level.mins, level.maxs, float(level.samples_per_peak)
+
+        bounds = np.linspace(0, level.count, resolution, endpoint=False).astype(np.int64)
+        mins = np.minimum.reduceat(level.mins, bounds)
+        maxs = np.maximum.reduceat(level.maxs, bounds)
+        return mins, maxs, level.samples_per_peak * level.count / resolution
+
+
+class PeakBuilder:
+    """Calcule les pics au fil des morceaux PCM, sans tamponner le fichier"""
+
+    def __init__(self, sample_rate: int, samples_per_peak: int = 256):
+        self.sample_rate = sample_rate
+        self.samples_per_peak = samples_per_peak
+        self.leftover = np.empty(0, dtype=np.int16)
+        self.mins: List[np.ndarray] = []
+        self.maxs: List[np.ndarray] = []
+
+    def feed(self, chunk: np.ndarray):
+        """Ajoute un morceau d'échantillons int16 mono"""
+        if len(self.leftover):
+            chunk = np.concatenate((self.leftover, chunk))
+        full = len(chunk) // self.samples_per_peak * self.samples_per_peak
+        if full:
+            blocks = chunk[:full].reshape(-1, self.samples_per_peak)
+            self.mins.append(blocks.min(axis=1))
+            self.maxs.append(blocks.max(axis=1))
+        self.leftover = chunk[full:].copy()
+
+    def finish(self, levels: int = 6, factor: int = 4) -> PeakData:
+        """Termine le calcul et dérive les niveaux plus grossiers"""
+        if len(self.leftover):
+            self.mins.append(np.array([self.leftover.min()], dtype=np.int16))
+            self.maxs.append(np.array([self.leftover.max()], dtype=np.int16))
+            self.leftover = np.empty(0, dtype=np.int16)
+
+        mins = np.concatenate(self.mins) if self.mins else np.empty(0, dtype=np.int16)
+        maxs = np.concatenate(self.maxs) if self.maxs else np.empty(0, dtype=np.int16)
+        result = [PeakLevel(self.samples_per_peak, mins, maxs)]
+
+        for _ in range(levels - 1):
+            previous = result[-1]
+            if previous.count <= 1:
+                break
+            bounds = np.arange(0, previous.count, factor)
+            result.append(PeakLevel(
+                previous.samples_per_peak * factor,
+                np.minimum.reduceat(previous.mins, bounds),
+                np.maximum.reduceat(previous.maxs, bounds)
+            ))
+
+        return PeakData(self.sample_rate, result)
+
+
+def compute_peaks(path: str, sample_rate: int = 22050, samples_per_peak: int = 256,
+                  chunks: Optional[Iterable[np.ndarray]] = None) -> PeakData:
+    """
+    Décode une piste et calcule ses pics multi-résolution.
+
+    Args:
+        path: Chemin de la piste
+        sample_rate: Fréquence de décodage (la forme d'onde n'a pas besoin de plus)
+        samples_per_peak: Échantillons par pic au niveau le plus fin
+        chunks: Morceaux PCM déjà décodés (tests), sinon décodage ffmpeg
+    """
+    builder = PeakBuilder(sample_rate, samples_per_peak)
+    for chunk in chunks if chunks is not None else iter_pcm_chunks(path, sample_rate):
+        builder.feed(chunk)
+    return builder.finish()
+
+
+def peaks_path_for(track_path: str) -> str:
+    """Chemin du fichier de pics à côté de la piste"""
+    return f"{track_path}{PEAKS_SUFFIX}"
+
+
+def write_peaks(path: str, peaks: PeakData):
+    """Écrit les pics de manière atomique"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(PEAKS_MAGIC, peaks.sample_rate, len(peaks.levels)))
+        for level in peaks.levels:
+            f.write(_LEVEL.pack(level.samples_per_peak, level.count))
+        for level in peaks.levels:
+            pairs = np.empty(level.count * 2, dtype='<i2')
+            pairs[0::2] = level.mins
+            pairs[1::2] = level.maxs
+            f.write(pairs.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_peaks(path: str) -> PeakData:
+    """Lit un fichier de pics"""
+    with open(path, 'rb') as f:
+        magic, sample_rate, level_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != PEAKS_MAGIC:
+            raise ValueError(f"Fichier de pics invalide: {path}")
+        specs = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(level_count)]
+        levels = []
+        for samples_per_peak, count in specs:
+            pairs = np.frombuffer(f.read(count * 4), dtype='<i2')
+            levels.append(PeakLevel(samples_per_peak, pairs[0::2], pairs[1::2]))
+    return PeakData(sample_rate, levels)
+
+
+def peaks_are_fresh(track_path: str) -> bool:
+    """Vérifie que le fichier de pics existe et n'est pas plus ancien que la piste"""
+    try:
+        return os.path.getmtime(peaks_path_for(track_path)) >= os.path.getmtime(track_path)
+    except OSError:
+        return False
+
+
+class WaveformJobQueue:
+    """File de calcul des pics en arrière-plan (un seul décodage par piste)"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.errors: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.worker = None
+
+    def enqueue(self, track_path: str) -> bool:
+        """
+        Planifie le calcul des pics d'une piste.
+
+        Returns:
+            False si la piste est déjà en file d'attente
+        """
+        with self.lock:
+            if track_path in self.pending:
+                return False
+            self.pending.add(track_path)
+            self.errors.pop(track_path, None)
+            if not self.worker or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._process_queue, daemon=True)
+                self.worker.start()
+        self.queue.put(track_path)
+        return True
+
+    def get_status(self, track_path: str) -> str:
+        """Statut du calcul : ready, pending, failed ou missing"""
+        if peaks_are_fresh(track_path):
+            return 'ready'
+        with self.lock:
+            if track_path in self.pending:
+                return 'pending'
+            if track_path in self.errors:
+                return 'failed'
+        return 'missing'
+
+    def _process_queue(self):
+        while True:
+            track_path = self.queue.get()
+            try:
+                if not peaks_are_fresh(track_path):
+                    write_peaks(peaks_path_for(track_path), compute_peaks(track_path))
+            except Exception as e:
+                self.logger.error(f"Erreur lors du calcul des pics de {track_path}: {str(e)}")
+                with self.lock:
+                    self.errors[track_path] = str(e)
+            finally:
+                with self.lock:
+                    self.pending.discard(track_path)
+                self.queue.task_done()
+
+
+# Instance globale de la file de calcul des pics
+waveform_jobs = WaveformJobQueue()
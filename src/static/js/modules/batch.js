@@ -6,6 +6,10 @@
  */
 // Importer les utilitaires DOM pour une gestion sécurisée des éléments
 import { getElement, getElementValue, setElementText, setElementVisibility } from '/static/js/dom-utils.js';
+import { subscribe } from './events.js';
+import { startDownload, getDownloadStatus } from './downloader.js';
+
+const FINISHED = ['completed', 'failed', 'cancelled'];
 
 export function initBatchDownloader() {
     const batchForm = getElement('batch-form');
@@ -48,33 +52,38 @@ export function initBatchDownloader() {
                 batchProgress.max = batchList.length;
             }
             
-            // Démarrer le batch
-            const result = await startBatch(batchList);
-            
-            // Mettre à jour le statut de manière sécurisée
-            setElementText('batch-status', `Batch démarré: ${result.batchId}`);
+            // Démarrer le batch : une tâche par URL
+            const tasks = await startBatch(batchList);
+            setElementText('batch-status', `Batch démarré: ${tasks.length} téléchargement(s)`);
             
-            // Suivre la progression
-            const interval = setInterval(async () => {
-                try {
-                    const status = await getBatchStatus(result.batchId);
-                    
-                    if (batchProgress) {
-                        batchProgress.value = status.completed;
-                    }
-                    
-                    setElementText('batch-status', `Progression: ${status.completed}/${status.total}`);
-                    
-                    if (status.completed === status.total) {
-                        clearInterval(interval);
-                        setElementText('batch-status', 'Batch terminé!');
-                    }
-                } catch (error) {
-                    console.error('Erreur lors du suivi du batch:', error);
-                    setElementText('batch-status', `Erreur: ${error.message}`);
-                    clearInterval(interval);
+            // Suivre la progression poussée par le serveur, tâche par tâche
+            const outcomes = new Map();
+            const unsubscribers = [];
+            const settle = (taskId, status) => {
+                if (!FINISHED.includes(status) || outcomes.has(taskId)) return;
+                outcomes.set(taskId, status);
+                if (batchProgress) batchProgress.value = outcomes.size;
+                setElementText('batch-status', `Progression: ${outcomes.size}/${tasks.length}`);
+                if (outcomes.size === tasks.length) {
+                    unsubscribers.forEach(unsubscribe => unsubscribe());
+                    const failed = [...outcomes.values()].filter(s => s !== 'completed').length;
+                    setElementText('batch-status', failed
+                        ? `Batch terminé: ${failed} échec(s)`
+                        : 'Batch terminé!');
                 }
-            }, 2000);
+            };
+            tasks.forEach(task => {
+                unsubscribers.push(subscribe('downloads', task.task_id, (status) => {
+                    settle(task.task_id, status.status);
+                }));
+            });
+            // Déjà téléchargées, ou terminées avant l'abonnement
+            await Promise.all(tasks.map(async task => {
+                const status = task.status === 'completed'
+                    ? task
+                    : await getDownloadStatus(task.task_id).catch(() => ({}));
+                settle(task.task_id, status.status);
+            }));
             
         } catch (error) {
             console.error('Erreur lors du démarrage du batch:', error);
@@ -83,20 +92,9 @@ export function initBatchDownloader() {
     });
 }
 
-export async function startBatch(batchList) {
-    const resp = await fetch('/api/download/batch', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ batch: batchList })
-    });
-    if (!resp.ok) throw new Error('Erreur lors du démarrage du batch');
-    return await resp.json();
-}
-
-export async function getBatchStatus(batchId) {
-    const resp = await fetch(`/api/download/batch/status/${batchId}`);
-    if (!resp.ok) throw new Error('Erreur lors du suivi du batch');
-    return await resp.json();
+export async function startBatch(batchList, service = 'youtube') {
+    // Le gestionnaire met les tâches en file et les dédoublonne (même média)
+    return await Promise.all(batchList.map(url => startDownload(url.trim(), service)));
 }
 
 // Utilitaire pour parser des fichiers de batch (txt, csv, etc.)
@@ -4,6 +4,7 @@
 // Importer les utilitaires DOM pour une gestion sécurisée des éléments
 import { getElement, getElementValue, setElementText, setElementVisibility } from '/static/js/dom-utils.js';
 import { showNotification } from './notifications.js';
+import { subscribe } from './events.js';
 
 /**
  * Initialise le gestionnaire de téléchargements
@@ -37,17 +38,21 @@ export function initDownloader(config) {
             
             const result = await startDownload(url, service);
             
-            // Afficher le résultat
-            setElementText('downloadStatus', 'Téléchargement terminé!');
-            setTimeout(() => {
-                setElementVisibility('downloadStatus', false);
-            }, 3000);
-            
-            showNotification('Téléchargement terminé avec succès!', 'success');
-            
             // Réinitialiser le formulaire
             downloadForm.reset();
             
+            if (result.status === 'completed') {
+                // Média déjà présent dans la bibliothèque
+                setElementText('downloadStatus', 'Déjà téléchargé');
+                setTimeout(() => {
+                    setElementVisibility('downloadStatus', false);
+                }, 3000);
+                showNotification('Ce média est déjà téléchargé', 'info');
+            } else {
+                // Suivre la progression poussée par le serveur
+                watchDownload(result.task_id);
+            }
+            
         } catch (error) {
             console.error('Erreur de téléchargement:', error);
             
@@ -61,8 +66,39 @@ export function initDownloader(config) {
     });
 }
 
+/**
+ * Affiche la progression d'un téléchargement jusqu'à sa fin
+ * @param {string} taskId - Identifiant de la tâche
+ */
+export function watchDownload(taskId) {
+    const unsubscribe = subscribe('downloads', taskId, (status) => {
+        if (status.progress !== undefined) {
+            setElementText('downloadStatus', `Téléchargement en cours... ${Math.round(status.progress)}%`);
+        }
+
+        if (status.status === 'completed') {
+            unsubscribe();
+            setElementText('downloadStatus', 'Téléchargement terminé!');
+            setTimeout(() => {
+                setElementVisibility('downloadStatus', false);
+            }, 3000);
+            showNotification('Téléchargement terminé avec succès!', 'success');
+        } else if (status.status === 'failed' || status.status === 'cancelled') {
+            unsubscribe();
+            const message = status.error || (status.status === 'cancelled' ? 'annulé' : 'échec');
+            setElementText('downloadStatus', `Erreur: ${message}`);
+            setTimeout(() => {
+                setElementVisibility('downloadStatus', false);
+            }, 5000);
+            showNotification(`Erreur de téléchargement: ${message}`, 'error');
+        }
+    });
+    return unsubscribe;
+}
+
 export async function startDownload(url, service) {
-    const resp = await fetch('/api/download', {
+    // Gestionnaire de téléchargements : renvoie task_id, suivi sur le canal downloads
+    const resp = await fetch('/api/downloads', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ url, service })
@@ -72,7 +108,7 @@ export async function startDownload(url, service) {
 }
 
 export async function getDownloadStatus(downloadId) {
-    const resp = await fetch(`/api/download/status/${downloadId}`);
+    const resp = await fetch(`/api/downloads/${downloadId}`);
     if (!resp.ok) throw new Error('Erreur lors de la récupération du statut');
     return await resp.json();
 }
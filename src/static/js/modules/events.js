@@ -0,0 +1,74 @@
+/**
+ * Module Events - Flux unique de progression poussé par le serveur (SSE)
+ *
+ * Une seule connexion /api/events par page remplace l'interrogation
+ * périodique de chaque tâche. Le navigateur se reconnecte seul en cas
+ * de coupure.
+ */
+
+const CHANNELS = ['downloads', 'conversions', 'streams'];
+
+let source = null;
+// canal -> identifiant de tâche (ou '*') -> callbacks
+const listeners = new Map();
+
+function connect() {
+    if (source) return source;
+    source = new EventSource('/api/events');
+    CHANNELS.forEach(channel => {
+        source.addEventListener(channel, (event) => dispatch(channel, event));
+    });
+    source.onerror = () => {
+        console.warn('Flux de progression interrompu, reconnexion...');
+    };
+    return source;
+}
+
+function dispatch(channel, event) {
+    let data;
+    try {
+        data = JSON.parse(event.data);
+    } catch (error) {
+        console.error('Événement de progression invalide:', error);
+        return;
+    }
+    const byId = listeners.get(channel);
+    if (!byId) return;
+    [data.id, '*'].forEach(key => {
+        (byId.get(key) || []).slice().forEach(callback => callback(data));
+    });
+}
+
+/**
+ * S'abonne à la progression d'une tâche
+ * @param {string} channel - downloads, conversions ou streams
+ * @param {string} id - Identifiant de la tâche ('*' pour toutes)
+ * @param {Function} callback - Reçoit l'état fusionné de la tâche
+ * @returns {Function} Fonction de désabonnement
+ */
+export function subscribe(channel, id, callback) {
+    connect();
+    if (!listeners.has(channel)) listeners.set(channel, new Map());
+    const byId = listeners.get(channel);
+    const key = String(id);
+    if (!byId.has(key)) byId.set(key, []);
+    byId.get(key).push(callback);
+
+    return () => {
+        const callbacks = byId.get(key) || [];
+        const index = callbacks.indexOf(callback);
+        if (index !== -1) callbacks.splice(index, 1);
+        if (!callbacks.length) byId.delete(key);
+    };
+}
+
+/**
+ * Ferme le flux (plus aucun abonné)
+ */
+export function closeEvents() {
+    if (source) {
+        source.close();
+        source = null;
+    }
+    listeners.clear();
+}
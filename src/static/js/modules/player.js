@@ -11,6 +11,7 @@ let tracks = [];
 let isShuffled = false;
 let originalTracks = [];
 let repeatMode = 'none'; // 'none', 'all', 'one'
+const PREFETCH_AHEAD = 3; // Pistes suivantes préchargées côté serveur
 
 // Initialisation du lecteur audio
 export function initPlayer(config) {
@@ -239,6 +240,31 @@ function playTrack(index) {
         console.error('Erreur lors de la lecture:', error);
         showNotification('Impossible de lire la piste', 'error');
     });
+    
+    sendQueueHint(index);
+}
+
+// Indiquer au serveur les prochaines pistes pour qu'il les précharge
+function sendQueueHint(index) {
+    const track = tracks[index];
+    if (!track || track.id === undefined) return;
+    
+    const next = [];
+    for (let i = 1; i <= PREFETCH_AHEAD && i < tracks.length; i++) {
+        const upcoming = tracks[(index + i) % tracks.length];
+        if (upcoming && upcoming.id !== undefined) {
+            next.push(upcoming.id);
+        }
+    }
+    if (next.length === 0) return;
+    
+    fetch(`/api/tracks/${track.id}/queue-hint`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ next })
+    }).catch(error => {
+        console.debug('Indication de file ignorée:', error);
+    });
 }
 
 // Jouer une piste par données
@@ -129,8 +129,8 @@ function createPlaylistElement(playlist, index) {
     playlistCard.dataset.playlistId = playlist.id;
     playlistCard.style.animationDelay = `${index * 0.1}s`;
     
-    if (playlist.cover_image) {
-        playlistCover.style.backgroundImage = `url('${playlist.cover_image}')`;
+    if (playlist.cover_url) {
+        playlistCover.style.backgroundImage = `url('${playlist.cover_url}')`;
     } else {
         playlistCover.innerHTML = '<i class="fas fa-music"></i>';
     }
@@ -153,8 +153,8 @@ export function openEditModal(playlist) {
     nameInput.value = playlist.name || '';
     descInput.value = playlist.description || '';
     
-    if (playlist.cover_image) {
-        preview.style.backgroundImage = `url('${playlist.cover_image}')`;
+    if (playlist.cover_url) {
+        preview.style.backgroundImage = `url('${playlist.cover_url}')`;
     } else {
         preview.style.backgroundImage = '';
     }
@@ -155,8 +155,8 @@ export function updatePlaylistView(playlist) {
     }
     
     if (playlistCover) {
-        if (playlist.cover_image) {
-            playlistCover.style.backgroundImage = `url('${playlist.cover_image}')`;
+        if (playlist.cover_url) {
+            playlistCover.style.backgroundImage = `url('${playlist.cover_url}')`;
             playlistCover.innerHTML = '';
         } else {
             playlistCover.style.backgroundImage = '';
@@ -35,14 +35,19 @@ class PreviewPlayer {
             this.stopPreview();
         }
         
+        // Les pistes de la bibliothèque ont un extrait généré côté serveur
+        const previewUrl = track.previewUrl || (
+            Number.isInteger(Number(track.id)) ? `/api/tracks/${track.id}/preview` : null
+        );
+        
         // Vérifier si la piste a une URL de prévisualisation
-        if (!track.previewUrl) {
+        if (!previewUrl) {
             showNotification('Pas de prévisualisation disponible', 'info');
             return;
         }
         
         // Mettre à jour l'élément audio
-        this.audio.src = track.previewUrl;
+        this.audio.src = previewUrl;
         this.currentPreview = track;
         
         // Lancer la lecture
@@ -139,6 +144,12 @@ export function initPreviews() {
         }
     });
     
+    // Préparer les extraits des pistes déjà affichées
+    const ids = Array.from(document.querySelectorAll('[data-preview-id]'))
+        .map(button => Number(button.dataset.previewId))
+        .filter(Number.isInteger);
+    warmPreviews(ids);
+    
     // Ajouter le contrôle du volume si présent
     const volumeControl = document.getElementById('previewVolume');
     if (volumeControl) {
@@ -149,5 +160,20 @@ export function initPreviews() {
     }
 }
 
+/**
+ * Demande au serveur de générer par lot les extraits de pistes affichées
+ */
+export function warmPreviews(trackIds) {
+    if (!trackIds || trackIds.length === 0) return;
+    
+    fetch('/api/tracks/previews', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids: trackIds })
+    }).catch(error => {
+        console.debug('Préparation des extraits ignorée:', error);
+    });
+}
+
 // Exposer le lecteur de prévisualisation
 export const preview = previewPlayer;
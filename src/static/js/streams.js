@@ -6,6 +6,18 @@ class StreamManager {
     constructor() {
         this.activeStreams = new Map();
         this.videoPlayer = document.getElementById('video-player');
+        // Flux de progression poussé par le serveur, ouvert au premier torrent
+        this.events = null;
+    }
+
+    /**
+     * Ouvre le flux de progression des streams
+     */
+    getEventSource() {
+        if (!this.events) {
+            this.events = new EventSource('/api/events?channels=streams');
+        }
+        return this.events;
     }
 
     /**
@@ -91,29 +103,32 @@ class StreamManager {
     /**
      * Surveille la progression d'un torrent
      */
-    async monitorTorrentProgress(streamId) {
-        while (this.activeStreams.has(streamId)) {
+    monitorTorrentProgress(streamId) {
+        const events = this.getEventSource();
+        const onProgress = (event) => {
+            let status;
             try {
-                const response = await fetch(`/stream/${streamId}/status`);
-                const status = await response.json();
-
-                if (response.ok) {
-                    this.activeStreams.set(streamId, status);
-                    this.updateStreamProgress(streamId, status);
-
-                    if (status.status === 'completed') {
-                        showNotification('Téléchargement terminé', 'success');
-                        break;
-                    }
-                } else {
-                    throw new Error(status.error);
-                }
+                status = JSON.parse(event.data);
             } catch (error) {
                 console.error('Erreur de surveillance:', error);
+                return;
             }
+            if (status.id !== String(streamId)) return;
 
-            await new Promise(resolve => setTimeout(resolve, 1000));
-        }
+            if (!this.activeStreams.has(streamId)) {
+                events.removeEventListener('streams', onProgress);
+                return;
+            }
+            status = { ...this.activeStreams.get(streamId), ...status };
+            this.activeStreams.set(streamId, status);
+            this.updateStreamProgress(streamId, status);
+
+            if (status.status === 'completed') {
+                events.removeEventListener('streams', onProgress);
+                showNotification('Téléchargement terminé', 'success');
+            }
+        };
+        events.addEventListener('streams', onProgress);
     }
 
     /**
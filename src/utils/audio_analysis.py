@@ -0,0 +1,73 @@
+"""
+Utilitaires d'analyse audio : décodage PCM en flux via ffmpeg.
+
+Le décodage se fait par morceaux pour ne jamais garder un fichier complet
+en mémoire, ce qui compte sur un Raspberry Pi.
+"""
+
+import subprocess
+from typing import Iterator, Optional
+
+import numpy as np
+
+from .exceptions import ServiceError
+
+# Nombre d'échantillons lus par morceau (mono, 16 bits)
+DEFAULT_CHUNK_SAMPLES = 64 * 1024
+
+
+def iter_pcm_chunks(path: str, sample_rate: int = 22050,
+                    chunk_samples: int = DEFAULT_CHUNK_SAMPLES,
+                    start: Optional[float] = None,
+                    duration: Optional[float] = None) -> Iterator[np.ndarray]:
+    """
+    Décode un fichier audio en PCM mono 16 bits, morceau par morceau.
+
+    Args:
+        path: Chemin du fichier audio
+        sample_rate: Fréquence d'échantillonnage de sortie
+        chunk_samples: Nombre d'échantillons par morceau
+        start: Position de départ en secondes
+        duration: Durée maximale décodée en secondes
+
+    Yields:
+        Tableaux NumPy int16 d'au plus chunk_samples échantillons
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    if start:
+        cmd += ['-ss', str(start)]
+    cmd += ['-i', str(path)]
+    if duration:
+        cmd += ['-t', str(duration)]
+    cmd += ['-vn', '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-']
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise ServiceError("ffmpeg introuvable")
+
+    chunk_bytes = chunk_samples * 2
+    leftover = b''
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = leftover + data
+            # Un échantillon coupé en deux attend le morceau suivant
+            usable = len(data) - (len(data) % 2)
+            leftover = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype='<i2')
+        stderr = process.stderr.read().decode('utf-8', errors='replace')
+        returncode = process.wait()
+    finally:
+        # Lecture interrompue par l'appelant : arrêter ffmpeg
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+    if returncode != 0:
+        raise ServiceError(f"Échec du décodage de {path}: {stderr.strip()}")
@@ -0,0 +1,203 @@
+"""
+Limitation de bande passante par seau à jetons (token bucket).
+
+Un gouverneur unique est partagé par le streaming audio, le relais IPTV et
+les téléchargements yt-dlp. Il applique une limite
+globale, une limite par utilisateur et une limite par classe de trafic, la
+lecture interactive restant prioritaire sur les téléchargements en fond.
+"""
+
+import time
+import threading
+from typing import Dict, Iterable, Optional
+
+# Classes de trafic, de la plus prioritaire à la moins prioritaire
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+TRAFFIC_CLASSES = (INTERACTIVE, BACKGROUND)
+
+# Taille maximale d'un morceau envoyé entre deux prises de jetons
+CHUNK_SIZE = 64 * 1024
+
+# Durée (s) pendant laquelle un flux interactif est considéré comme actif
+INTERACTIVE_ACTIVITY_WINDOW = 2.0
+
+
+class TokenBucket:
+    """
+    Seau à jetons avec dette : une demande supérieure aux jetons disponibles
+    est acceptée et renvoie le temps d'attente nécessaire pour la rembourser.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        """
+        Args:
+            rate: Débit en octets/s (None = illimité)
+            burst: Capacité du seau en octets (par défaut une seconde de débit)
+        """
+        self.lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate: Optional[float], burst: Optional[float] = None):
+        """Change le débit ; le seau repart plein"""
+        with self.lock:
+            self.rate = rate if rate and rate > 0 else None
+            self.burst = burst or (self.rate or 0)
+            self.tokens = self.burst
+            self.updated = time.monotonic()
+
+    def reserve(self, nbytes: int) -> float:
+        """
+        Prélève nbytes jetons.
+
+        Returns:
+            Temps d'attente en secondes avant de pouvoir envoyer les données
+        """
+        if self.rate is None:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class ThrottledIterator:
+    """Itérateur de réponse HTTP qui respecte le gouverneur de bande passante"""
+
+    def __init__(self, governor: 'BandwidthGovernor', iterable: Iterable[bytes],
+                 user_id=None, traffic_class: str = INTERACTIVE):
+        self.governor = governor
+        self.iterable = iterable
+        self.user_id = user_id
+        self.traffic_class = traffic_class
+
+    def __iter__(self):
+        for data in self.iterable:
+            for start in range(0, len(data), CHUNK_SIZE):
+                chunk = data[start:start + CHUNK_SIZE]
+                self.governor.throttle(len(chunk), self.user_id, self.traffic_class)
+                yield chunk
+
+    def close(self):
+        # Werkzeug ferme l'itérable de la réponse : propager au fichier sous-jacent
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+class BandwidthGovernor:
+    """Gouverneur de bande passante global, par utilisateur et par classe"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket()
+        self.class_buckets = {name: TokenBucket() for name in TRAFFIC_CLASSES}
+        # Part du débit global laissée au fond quand une lecture est en cours
+        self.background_share = 0.2
+        self.contention_bucket = TokenBucket()
+        self.per_user_rate: Optional[float] = None
+        self.user_buckets: Dict[object, TokenBucket] = {}
+        self.last_interactive = 0.0
+        self.stats = {name: {'bytes': 0, 'throttled_seconds': 0.0} for name in TRAFFIC_CLASSES}
+
+    def configure(self, global_kbps: Optional[int] = ..., per_user_kbps: Optional[int] = ...,
+                  class_kbps: Optional[Dict[str, Optional[int]]] = None,
+                  background_share: Optional[float] = None):
+        """
+        Reconfigure les limites à chaud (en Ko/s, None = illimité).
+        Les paramètres omis conservent leur valeur actuelle.
+        """
+        with self.lock:
+            if global_kbps is not ...:
+                self.global_bucket.configure(self._to_rate(global_kbps))
+            if background_share is not None:
+                self.background_share = min(max(float(background_share), 0.0), 1.0)
+            if self.global_bucket.rate:
+                self.contention_bucket.configure(self.global_bucket.rate * self.background_share)
+            else:
+                self.contention_bucket.configure(None)
+            for name, kbps in (class_kbps or {}).items():
+                if name not in self.class_buckets:
+                    raise ValueError(f"Classe de trafic inconnue: {name}")
+                self.class_buckets[name].configure(self._to_rate(kbps))
+            if per_user_kbps is not ...:
+                self.per_user_rate = self._to_rate(per_user_kbps)
+                for bucket in self.user_buckets.values():
+                    bucket.configure(self.per_user_rate)
+
+    def get_config(self) -> Dict:
+        """Retourne la configuration courante en Ko/s"""
+        return {
+            'global_kbps': self._to_kbps(self.global_bucket.rate),
+            'per_user_kbps': self._to_kbps(self.per_user_rate),
+            'classes': {
+                name: self._to_kbps(bucket.rate)
+                for name, bucket in self.class_buckets.items()
+            },
+            'background_share': self.background_share,
+            'stats': {name: dict(values) for name, values in self.stats.items()}
+        }
+
+    def is_limited(self, user_id=None, traffic_class: str = INTERACTIVE) -> bool:
+        """Indique si un flux serait limité (permet d'éviter l'enveloppe sinon)"""
+        return bool(
+            self.global_bucket.rate
+            or self.class_buckets[traffic_class].rate
+            or (user_id is not None and self.per_user_rate)
+        )
+
+    def reserve(self, nbytes: int, user_id=None, traffic_class: str = INTERACTIVE) -> float:
+        """Prélève nbytes dans tous les seaux concernés et renvoie l'attente"""
+        now = time.monotonic()
+        waits = [
+            self.global_bucket.reserve(nbytes),
+            self.class_buckets[traffic_class].reserve(nbytes)
+        ]
+        if traffic_class == INTERACTIVE:
+            self.last_interactive = now
+        elif now - self.last_interactive < INTERACTIVE_ACTIVITY_WINDOW:
+            # Une lecture est en cours : le fond se contente de sa part
+            waits.append(self.contention_bucket.reserve(nbytes))
+        if user_id is not None and self.per_user_rate:
+            waits.append(self._user_bucket(user_id).reserve(nbytes))
+
+        wait = max(waits)
+        stats = self.stats[traffic_class]
+        stats['bytes'] += nbytes
+        stats['throttled_seconds'] += wait
+        return wait
+
+    def throttle(self, nbytes: int, user_id=None, traffic_class: str = INTERACTIVE):
+        """Bloque le thread appelant le temps nécessaire"""
+        wait = self.reserve(nbytes, user_id, traffic_class)
+        if wait > 0:
+            time.sleep(wait)
+
+    def wrap(self, iterable: Iterable[bytes], user_id=None,
+             traffic_class: str = INTERACTIVE) -> Iterable[bytes]:
+        """Enveloppe le corps d'une réponse si une limite s'applique"""
+        if not self.is_limited(user_id, traffic_class):
+            return iterable
+        return ThrottledIterator(self, iterable, user_id, traffic_class)
+
+    def _user_bucket(self, user_id) -> TokenBucket:
+        with self.lock:
+            bucket = self.user_buckets.get(user_id)
+            if bucket is None:
+                bucket = self.user_buckets[user_id] = TokenBucket(self.per_user_rate)
+            return bucket
+
+    @staticmethod
+    def _to_rate(kbps: Optional[int]) -> Optional[float]:
+        return float(kbps) * 1024 if kbps else None
+
+    @staticmethod
+    def _to_kbps(rate: Optional[float]) -> Optional[int]:
+        return int(rate / 1024) if rate else None
+
+
+# Instance globale du gouverneur de bande passante
+bandwidth_governor = BandwidthGovernor()
@@ -0,0 +1,190 @@
+"""
+Bus d'événements de progression poussés aux clients (Server-Sent Events).
+
+Les gestionnaires (téléchargements, conversions, torrents) publient l'état
+de leurs tâches ; chaque client garde un seul flux /api/events au lieu
+d'interroger chaque tâche. Les mises à jour d'une même tâche sont fusionnées
+et limitées en fréquence ; les changements d'état partent aussitôt.
+"""
+
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Canaux publiés
+DOWNLOADS = 'downloads'
+CONVERSIONS = 'conversions'
+STREAMS = 'streams'
+
+# Intervalle entre deux envois pour une même tâche (secondes)
+DEFAULT_MIN_INTERVAL = 0.5
+# Intervalle des commentaires de maintien de connexion
+HEARTBEAT_INTERVAL = 15.0
+# Nombre de tâches suivies avant de purger les dates d'envoi anciennes
+MAX_TRACKED_JOBS = 1024
+
+
+class Subscription:
+    """File d'événements d'un client"""
+
+    def __init__(self, user_id: Optional[Any] = None, channels: Optional[Set[str]] = None,
+                 maxsize: int = 256):
+        self.user_id = user_id
+        self.channels = channels
+        self.queue: 'queue.Queue[Dict]' = queue.Queue(maxsize=maxsize)
+
+    def accepts(self, event: Dict) -> bool:
+        if self.channels and event['channel'] not in self.channels:
+            return False
+        owner = event.get('user_id')
+        if owner is None or self.user_id is None:
+            return True
+        # Une tâche partagée (demandes dédoublonnées) a plusieurs propriétaires
+        if isinstance(owner, frozenset):
+            return self.user_id in owner
+        return owner == self.user_id
+
+    def push(self, event: Dict):
+        """Ajoute un événement ; un client trop lent perd les plus anciens"""
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Diffusion des progressions avec fusion et limitation par tâche"""
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.subscribers: Set[Subscription] = set()
+        # (canal, tâche) -> état fusionné en attente, et date du dernier envoi
+        self.pending: Dict[Tuple[str, str], Dict] = {}
+        self.last_sent: Dict[Tuple[str, str], float] = {}
+        self.sequence = 0
+        self.flusher = None
+        self.stats = {'published': 0, 'sent': 0, 'coalesced': 0}
+
+    def subscribe(self, user_id: Optional[Any] = None,
+                  channels: Optional[Iterable[str]] = None) -> Subscription:
+        subscription = Subscription(user_id, set(channels) if channels else None)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, channel: str, job_id: Any, data: Dict, user_id: Optional[Any] = None,
+                immediate: bool = False):
+        """
+        Publie l'état d'une tâche.
+
+        Args:
+            channel: Canal (downloads, conversions, streams)
+            job_id: Identifiant de la tâche dans son canal
+            data: Champs modifiés, fusionnés avec ceux encore en attente
+            user_id: Propriétaire de la tâche, ou frozenset de propriétaires
+                (None : visible par tous)
+            immediate: Changement d'état à envoyer sans attendre
+        """
+        key = (channel, str(job_id))
+        now = time.monotonic()
+        with self.lock:
+            self.stats['published'] += 1
+            if not self.subscribers:
+                return
+            pending = self.pending.get(key)
+            if pending:
+                pending['data'].update(data)
+                pending['immediate'] = pending['immediate'] or immediate
+                self.stats['coalesced'] += 1
+            else:
+                pending = {'user_id': user_id, 'data': dict(data), 'immediate': immediate}
+                self.pending[key] = pending
+
+            if pending['immediate'] or now - self.last_sent.get(key, 0) >= self.min_interval:
+                self._send(key, now)
+            elif self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self.flusher.start()
+
+    def _send(self, key: Tuple[str, str], now: float):
+        """Diffuse l'état en attente d'une tâche (appelé sous le verrou)"""
+        pending = self.pending.pop(key)
+        self.last_sent[key] = now
+        if len(self.last_sent) > MAX_TRACKED_JOBS:
+            # Oublier les tâches silencieuses depuis longtemps
+            horizon = now - self.min_interval * 10
+            self.last_sent = {k: t for k, t in self.last_sent.items() if t >= horizon}
+        self.sequence += 1
+        event = {
+            'seq': self.sequence,
+            'channel': key[0],
+            'id': key[1],
+            'user_id': pending['user_id'],
+            'data': pending['data']
+        }
+        for subscription in self.subscribers:
+            if subscription.accepts(event):
+                subscription.push(event)
+                self.stats['sent'] += 1
+
+    def _flush_loop(self):
+        """Envoie les mises à jour retenues dès que leur intervalle est écoulé"""
+        while True:
+            time.sleep(self.min_interval / 2)
+            now = time.monotonic()
+            with self.lock:
+                for key in list(self.pending):
+                    if now - self.last_sent.get(key, 0) >= self.min_interval:
+                        self._send(key, now)
+                if not self.pending:
+                    self.flusher = None
+                    return
+
+    def stream(self, subscription: Subscription,
+               heartbeat: float = HEARTBEAT_INTERVAL) -> Iterator[str]:
+        """Générateur du flux text/event-stream d'un client"""
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                    yield ': ping\n\n'
+                    continue
+                payload = json.dumps({'id': event['id'], **event['data']})
+                yield f"id: {event['seq']}\nevent: {event['channel']}\ndata: {payload}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                **self.stats,
+                'subscribers': len(self.subscribers),
+                'pending': len(self.pending)
+            }
+
+
+# Instance globale du bus d'événements
+event_bus = EventBus()
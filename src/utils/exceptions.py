@@ -17,3 +17,7 @@ class AuthenticationError(Exception):
 class ValidationError(Exception):
     """Exception levée lors d'une erreur de validation"""
     pass
+
+class TaskCancelled(Exception):
+    """Exception levée lorsqu'une tâche est annulée en cours d'exécution"""
+    pass
@@ -97,13 +97,14 @@ def delete_image(filename, folder):
         current_app.logger.error(f"Erreur lors de la suppression de l'image: {str(e)}")
         return False
 
-def get_image_url(filename, folder):
+def get_image_url(filename, folder, width=None):
     """
     Retourne l'URL d'une image
     
     Args:
         filename: Nom du fichier
         folder: Dossier contenant l'image
+        width: Largeur souhaitée (variante réduite servie par /img)
     
     Returns:
         str: URL de l'image ou None si erreur
@@ -112,6 +113,8 @@ def get_image_url(filename, folder):
         if not filename:
             return None
 
+        if width:
+            return f"/img/{folder}/{filename}?w={int(width)}"
         return f"/uploads/{folder}/{filename}"
 
     except Exception as e:
@@ -0,0 +1,96 @@
+"""
+Identifiants canoniques des médias et empreintes de contenu.
+
+Une même vidéo peut être demandée sous plusieurs URL (youtu.be,
+youtube.com/watch, music.youtube.com, paramètres de suivi...). Les URL sont
+ramenées à un couple (extracteur, identifiant) pour détecter les doublons
+avant le téléchargement ; l'empreinte du fichier détecte ceux qui restent
+après.
+"""
+
+import re
+import hashlib
+from typing import Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Identifiant YouTube : 11 caractères base64url
+_YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_YOUTUBE_PATH = re.compile(r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})')
+_SPOTIFY_PATH = re.compile(r'^/(?:intl-[a-z]{2}/)?(track|album|playlist|artist)/([A-Za-z0-9]+)')
+_SPOTIFY_URI = re.compile(r'^spotify:(track|album|playlist|artist):([A-Za-z0-9]+)$')
+
+# Paramètres de suivi sans effet sur le média désigné
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'ref', 'pp', 'context', 'in', 'nd'}
+
+# Taille des blocs lus pour l'empreinte
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _host(netloc: str) -> str:
+    host = netloc.lower().split('@')[-1].split(':')[0]
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+
+def canonicalize_url(url: str) -> Tuple[str, str]:
+    """
+    Ramène une URL de média à (extracteur, identifiant).
+
+    Les sources inconnues gardent leur URL, débarrassée des paramètres de
+    suivi, du fragment et de la barre oblique finale.
+
+    Returns:
+        (extracteur, identifiant), par exemple ('youtube', 'dQw4w9WgXcQ')
+    """
+    url = url.strip()
+    match = _SPOTIFY_URI.match(url)
+    if match:
+        return f'spotify:{match.group(1)}', match.group(2)
+
+    parts = urlsplit(url if '://' in url else f'https://{url}')
+    host = _host(parts.netloc)
+    query = dict(parse_qsl(parts.query))
+
+    if host in ('youtube.com', 'youtube-nocookie.com', 'youtu.be'):
+        if host == 'youtu.be':
+            video_id = parts.path.strip('/').split('/')[0]
+        else:
+            path_match = _YOUTUBE_PATH.match(parts.path)
+            video_id = path_match.group(1) if path_match else query.get('v', '')
+        if _YOUTUBE_ID.match(video_id):
+            return 'youtube', video_id
+        if query.get('list'):
+            return 'youtube:playlist', query['list']
+
+    if host == 'open.spotify.com':
+        match = _SPOTIFY_PATH.match(parts.path)
+        if match:
+            return f'spotify:{match.group(1)}', match.group(2)
+
+    if host in ('soundcloud.com', 'on.soundcloud.com'):
+        # Les permaliens SoundCloud sont insensibles à la casse
+        return 'soundcloud', parts.path.rstrip('/').lower()
+
+    kept = [(key, value) for key, value in parse_qsl(parts.query)
+            if key not in TRACKING_PARAMS and not key.startswith('utm_')]
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                             parts.path.rstrip('/') or '/', urlencode(sorted(kept)), ''))
+    return 'generic', normalized
+
+
+def media_key(url: str) -> str:
+    """Clé de dédoublonnage d'une URL, par exemple 'youtube:dQw4w9WgXcQ'"""
+    extractor, media_id = canonicalize_url(url)
+    return f'{extractor}:{media_id}'
+
+
+def content_hash(path: str) -> str:
+    """Empreinte SHA-256 du contenu d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
@@ -2,9 +2,14 @@
 Gestionnaire de traitement média (conversion, sous-titres, etc.)
 """
 
+import os
+import uuid
+import shutil
+import hashlib
+import itertools
 import ffmpeg
-import pysrt
 import schedule
+from collections import Counter, OrderedDict
 from pathlib import Path
 import threading
 import queue
@@ -12,106 +17,433 @@ import json
 from datetime import datetime, timedelta
 import psutil
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
+from .bandwidth import bandwidth_governor
+from .events import event_bus, CONVERSIONS
+from .process_control import run_streaming, remove_partial_files
+from .exceptions import TaskCancelled
+from ..services.scheduler import INTERACTIVE, BATCH, PRIORITY_NAMES
+from ..services.preview import PreviewCache
+
+# Priorités des conversions, par nom (mêmes classes que les téléchargements)
+PRIORITIES = {name: priority for priority, name in PRIORITY_NAMES.items()}
+
+# Au-delà de cette température (°C), seul un worker continue à convertir
+THERMAL_LIMIT = 75.0
+# Pause d'un worker mis en attente par la température (secondes)
+THERMAL_BACKOFF = 5.0
+
+# Lecture des fichiers par blocs pour l'empreinte de contenu
+HASH_CHUNK = 1024 * 1024
+# Empreintes gardées en mémoire, par (chemin, taille, mtime)
+DIGEST_CACHE_SIZE = 1024
+
+_digests: 'OrderedDict[Tuple[str, int, int], str]' = OrderedDict()
+_digests_lock = threading.Lock()
+
+QUALITY_PRESETS = {
+    'low': {'video_bitrate': '1000k', 'audio_bitrate': '128k'},
+    'medium': {'video_bitrate': '2500k', 'audio_bitrate': '192k'},
+    'high': {'video_bitrate': '5000k', 'audio_bitrate': '320k'}
+}
+
+
+def default_workers() -> int:
+    """Un worker par cœur, en laissant un cœur au serveur"""
+    return max((os.cpu_count() or 1) - 1, 1)
+
+
+def cpu_temperature() -> Optional[float]:
+    """Température la plus élevée des capteurs (None si indisponible)"""
+    try:
+        sensors = psutil.sensors_temperatures()
+    except (AttributeError, OSError):
+        return None
+    readings = [entry.current for entries in sensors.values() for entry in entries if entry.current]
+    return max(readings) if readings else None
+
+
+def file_digest(path: Optional[str]) -> str:
+    """
+    Empreinte du contenu d'un fichier ('' sans fichier). Un fichier inchangé
+    (même taille, même mtime) n'est pas relu.
+    """
+    if not path:
+        return ''
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        known = _digests.get(key)
+        if known is not None:
+            _digests.move_to_end(key)
+            return known
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    with _digests_lock:
+        _digests[key] = digest.hexdigest()
+        while len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return digest.hexdigest()
+
+
+def conversion_key(input_path: str, output_format: str, quality: str,
+                   subtitle_path: Optional[str] = None) -> str:
+    """
+    Clé d'un résultat de conversion : contenu de l'entrée, format, préréglage
+    de qualité et contenu des sous-titres (le nom des fichiers n'y entre pas)
+    """
+    raw = ':'.join((file_digest(input_path), output_format, quality, file_digest(subtitle_path)))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def link_or_copy(source: str, destination: str):
+    """Lien physique (aucune copie de données), copie sur un autre système de fichiers"""
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def parse_progress(block: Dict[str, str], duration: Optional[float]) -> Dict:
+    """
+    Progression à partir d'un bloc de ffmpeg -progress (out_time_us, speed...).
+
+    Returns:
+        Position (s), vitesse (x temps réel), pourcentage et temps restant si
+        la durée de l'entrée est connue
+    """
+    update = {}
+    out_time = block.get('out_time_us') or block.get('out_time_ms')
+    if out_time and out_time.lstrip('-').isdigit():
+        # out_time_ms est en microsecondes malgré son nom
+        update['position'] = max(int(out_time), 0) / 1_000_000
+    speed = block.get('speed', '').rstrip('x').strip()
+    try:
+        update['speed'] = float(speed)
+    except ValueError:
+        pass
+    if duration and 'position' in update:
+        update['progress'] = round(min(update['position'] / duration * 100, 99.9), 1)
+        if update.get('speed'):
+            update['eta'] = round(max(duration - update['position'], 0) / update['speed'], 1)
+    return update
+
 
 class MediaProcessor:
-    def __init__(self):
-        self.conversion_queue = queue.Queue()
+    def __init__(self, workers: Optional[int] = None, thermal_limit: Optional[float] = THERMAL_LIMIT,
+                 cache_root: str = 'static/uploads/conversions', cache_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.conversion_queue = queue.PriorityQueue()
         self.active_conversions = {}
+        # Conversions en cours par clé de résultat (les doublons s'y rattachent)
+        self.in_flight: Dict[str, str] = {}
+        self.cache_root = str(cache_root)
+        self.cache_bytes = cache_bytes
+        self._cache = None
+        self.cache_stats = Counter()
+        self.workers = workers or default_workers()
+        self.thermal_limit = thermal_limit
+        self.threads: List[threading.Thread] = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
         self.bandwidth_limit = None  # en KB/s
         self.scheduler = schedule.Scheduler()
         self.logger = logging.getLogger(__name__)
         
-        # Démarrer le thread de conversion
-        self.conversion_thread = threading.Thread(target=self._process_conversion_queue, daemon=True)
-        self.conversion_thread.start()
-        
         # Démarrer le thread du scheduler
         self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.scheduler_thread.start()
 
+    def configure(self, workers: Optional[int] = None, thermal_limit: Optional[float] = None,
+                  cache_root: Optional[str] = None, cache_bytes: Optional[int] = None):
+        """
+        Nombre de workers (pris en compte au premier démarrage), seuil
+        thermique, emplacement et quota du cache des résultats
+        """
+        if workers is not None:
+            self.workers = max(int(workers), 1)
+        if thermal_limit is not None:
+            self.thermal_limit = float(thermal_limit)
+        if cache_root:
+            self.cache_root = str(cache_root)
+            self._cache = None
+        if cache_bytes is not None:
+            self.cache_bytes = cache_bytes
+            self._cache = None
+
+    @property
+    def cache(self) -> PreviewCache:
+        # Création paresseuse : pas d'accès disque à l'import du module
+        if self._cache is None:
+            self._cache = PreviewCache(self.cache_root, self.cache_bytes, suffix='')
+        return self._cache
+
+    def _start_workers(self):
+        # Démarrage paresseux : pas de threads tant qu'aucune conversion n'est demandée
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._process_conversion_queue,
+                    args=(len(self.threads),),
+                    name=f'conversion-{len(self.threads)}',
+                    daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
     def convert_media(self, input_path: str, output_format: str, 
                      subtitle_path: Optional[str] = None,
                      quality: str = 'high',
-                     schedule_time: Optional[datetime] = None) -> str:
+                     schedule_time: Optional[datetime] = None,
+                     priority: int = INTERACTIVE,
+                     user_id: Optional[int] = None) -> str:
         """
-        Convertit un fichier média vers le format spécifié
+        Convertit un fichier média vers le format spécifié (les événements de
+        progression ne sont poussés qu'à l'utilisateur demandeur)
+
+        Returns:
+            Identifiant de la conversion, ou message si elle est programmée
         """
         try:
-            output_path = str(Path(input_path).with_suffix(f'.{output_format}'))
-            
-            # Paramètres de qualité
-            quality_presets = {
-                'low': {'video_bitrate': '1000k', 'audio_bitrate': '128k'},
-                'medium': {'video_bitrate': '2500k', 'audio_bitrate': '192k'},
-                'high': {'video_bitrate': '5000k', 'audio_bitrate': '320k'}
-            }
-            
             conversion_params = {
                 'input_path': input_path,
-                'output_path': output_path,
+                'output_path': str(Path(input_path).with_suffix(f'.{output_format}')),
                 'format': output_format,
                 'subtitle_path': subtitle_path,
-                'quality': quality_presets[quality],
-                'status': 'pending'
+                'quality_preset': quality,
+                'quality': QUALITY_PRESETS[quality],
+                'user_id': user_id
             }
 
             if schedule_time:
-                # Programmer la conversion
+                # Programmer la conversion (une seule fois, en lot)
                 self.scheduler.every().day.at(schedule_time.strftime('%H:%M')).do(
-                    self.conversion_queue.put, conversion_params
+                    self._run_scheduled, conversion_params
                 )
                 return f"Conversion programmée pour {schedule_time}"
-            else:
-                # Conversion immédiate
-                self.conversion_queue.put(conversion_params)
-                return output_path
+            # Conversion immédiate
+            return self._enqueue(conversion_params, priority)
 
         except Exception as e:
             self.logger.error(f"Erreur de conversion: {str(e)}")
             raise
 
-    def _process_conversion_queue(self):
+    def _run_scheduled(self, params: Dict):
+        self._enqueue(dict(params), BATCH)
+        return schedule.CancelJob
+
+    def _enqueue(self, params: Dict, priority: int) -> str:
         """
-        Traite la file d'attente des conversions
+        Planifie une conversion, sauf si son résultat est déjà en cache (la
+        conversion est alors terminée immédiatement) ou en cours de calcul
+        (la demande est rattachée à la conversion en cours).
+        """
+        cache_key = conversion_key(params['input_path'], params['format'],
+                                   params['quality_preset'], params['subtitle_path'])
+        entry = f"{cache_key}.{params['format']}"
+        conversion_id = uuid.uuid4().hex
+        params.update({
+            'id': conversion_id,
+            'cache_key': entry,
+            'status': 'pending',
+            'priority': priority,
+            'progress': 0,
+            'attached': 1,
+            'watchers': set(),
+            'cancel_event': threading.Event(),
+            'created_at': datetime.now().isoformat()
+        })
+
+        with self.lock:
+            running = self.active_conversions.get(self.in_flight.get(entry))
+            if running and running['status'] in ('pending', 'converting'):
+                running['attached'] += 1
+                running['watchers'].add(params['user_id'])
+                self.cache_stats['attached'] += 1
+                return running['id']
+            cached = self.cache.get(entry)
+            if cached is None:
+                self.in_flight[entry] = conversion_id
+            self.active_conversions[conversion_id] = params
+
+        if cached:
+            try:
+                link_or_copy(cached, params['output_path'])
+                params.update(status='completed', progress=100, cached=True)
+                with self.lock:
+                    self.cache_stats['hits'] += 1
+                self._publish(params, {
+                    'status': 'completed',
+                    'input': params['input_path'],
+                    'output': params['output_path'],
+                    'format': params['format'],
+                    'progress': 100
+                }, immediate=True)
+                return conversion_id
+            except OSError as e:
+                # Résultat évincé entre-temps : conversion normale
+                self.logger.warning(f"Résultat en cache inutilisable: {str(e)}")
+                with self.lock:
+                    self.in_flight[entry] = conversion_id
+        with self.lock:
+            self.cache_stats['misses'] += 1
+        self._start_workers()
+        self.conversion_queue.put((priority, next(self.sequence), conversion_id))
+        self._publish(params, {
+            'status': 'pending',
+            'input': params['input_path'],
+            'output': params['output_path'],
+            'format': params['format']
+        }, immediate=True)
+        return conversion_id
+
+    @staticmethod
+    def _publish(params: Dict, data: Dict, immediate: bool = False):
+        """Pousse l'état d'une conversion à ses demandeurs (fusionné par le bus)"""
+        watchers = params['watchers']
+        owners = frozenset({params['user_id'], *watchers}) if watchers else params['user_id']
+        event_bus.publish(CONVERSIONS, params['id'], data, user_id=owners, immediate=immediate)
+
+    def _thermal_headroom(self, index: int) -> bool:
+        """Le worker index peut-il démarrer une conversion ? (le premier toujours)"""
+        if index == 0 or self.thermal_limit is None:
+            return True
+        temperature = cpu_temperature()
+        return temperature is None or temperature < self.thermal_limit
+
+    def _build_command(self, params: Dict) -> List[str]:
+        source = ffmpeg.input(params['input_path'])
+        streams = [source]
+        # Sous-titres incrustés dans la vidéo, piste audio conservée
+        if params['subtitle_path']:
+            streams = [source.video.filter('subtitles', params['subtitle_path']), source.audio]
+        # Les cœurs sont partagés entre les conversions simultanées
+        threads = max((os.cpu_count() or 1) // self.workers, 1)
+        stream = ffmpeg.output(*streams, params['output_path'], **params['quality'],
+                               f=params['format'], threads=threads)
+        stream = stream.global_args('-nostdin', '-nostats', '-progress', 'pipe:1').overwrite_output()
+        return ffmpeg.compile(stream)
+
+    @staticmethod
+    def _probe_duration(path: str) -> Optional[float]:
+        try:
+            duration = ffmpeg.probe(path)['format'].get('duration')
+            return float(duration) if duration else None
+        except (ffmpeg.Error, OSError, KeyError, ValueError):
+            return None
+
+    def _process_conversion_queue(self, index: int = 0):
+        """
+        Worker de conversion : prend la conversion la plus prioritaire (à
+        priorité égale, la plus ancienne)
         """
         while True:
+            if not self._thermal_headroom(index):
+                threading.Event().wait(THERMAL_BACKOFF)
+                continue
+            _, _, conversion_id = self.conversion_queue.get()
+            params = self.active_conversions.get(conversion_id)
             try:
-                params = self.conversion_queue.get()
-                conversion_id = str(len(self.active_conversions))
-                self.active_conversions[conversion_id] = params
-                
-                stream = ffmpeg.input(params['input_path'])
-                
-                # Appliquer les paramètres de qualité
-                stream = ffmpeg.output(stream, params['output_path'],
-                    **params['quality'],
-                    f=params['format']
-                )
-                
-                # Ajouter les sous-titres si présents
-                if params['subtitle_path']:
-                    stream = ffmpeg.filter(stream, 'subtitles', params['subtitle_path'])
-                
-                # Appliquer la limite de bande passante si définie
-                if self.bandwidth_limit:
-                    stream = ffmpeg.filter(stream, 'throttle', 
-                        rate=str(self.bandwidth_limit * 1024))
-                
-                # Lancer la conversion
-                self.active_conversions[conversion_id]['status'] = 'converting'
-                ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
-                self.active_conversions[conversion_id]['status'] = 'completed'
-                
-            except Exception as e:
-                self.logger.error(f"Erreur pendant la conversion: {str(e)}")
-                if conversion_id in self.active_conversions:
-                    self.active_conversions[conversion_id]['status'] = 'failed'
-                    self.active_conversions[conversion_id]['error'] = str(e)
-            
+                if params is None or params['status'] != 'pending':
+                    # Annulée avant son démarrage
+                    continue
+                self._convert(conversion_id, params)
             finally:
+                if params is not None:
+                    with self.lock:
+                        if self.in_flight.get(params['cache_key']) == conversion_id:
+                            del self.in_flight[params['cache_key']]
                 self.conversion_queue.task_done()
 
+    def _convert(self, conversion_id: str, params: Dict):
+        """Exécute une conversion en suivant la progression rapportée par ffmpeg"""
+        try:
+            params['status'] = 'converting'
+            params['started_at'] = datetime.now().isoformat()
+            duration = self._probe_duration(params['input_path'])
+            self._publish(params, {
+                'status': 'converting',
+                'input': params['input_path'],
+                'output': params['output_path'],
+                'format': params['format'],
+                'progress': 0
+            }, immediate=True)
+
+            block: Dict[str, str] = {}
+
+            def on_line(line: str):
+                key, _, value = line.partition('=')
+                if key != 'progress':
+                    block[key.strip()] = value.strip()
+                    return
+                # Fin d'un bloc (progress=continue ou progress=end)
+                update = parse_progress(block, duration)
+                block.clear()
+                if update:
+                    params.update(update)
+                    self._publish(params, update)
+
+            # Nouvelle sortie plutôt que réécriture : un résultat en cache
+            # peut partager ce fichier (lien physique)
+            output = params['output_path']
+            if os.path.exists(output) and not os.path.samefile(output, params['input_path']):
+                os.remove(output)
+            # ffmpeg dans son propre groupe de processus, tué en cas d'annulation
+            result = run_streaming(self._build_command(params), on_line, params['cancel_event'])
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                                   else f"ffmpeg a échoué (code {result.returncode})")
+            params.update(status='completed', progress=100, eta=0)
+            self._store_result(params)
+            self._publish(params, {'status': 'completed', 'progress': 100}, immediate=True)
+
+        except TaskCancelled:
+            params['status'] = 'cancelled'
+            remove_partial_files([params['output_path']])
+            self._publish(params, {'status': 'cancelled'}, immediate=True)
+
+        except Exception as e:
+            self.logger.error(f"Erreur pendant la conversion: {str(e)}")
+            params['status'] = 'failed'
+            params['error'] = str(e)
+            self._publish(params, {'status': 'failed', 'error': str(e)}, immediate=True)
+
+    def _store_result(self, params: Dict):
+        """Conserve le résultat dans le cache (lien physique vers la sortie)"""
+        try:
+            link_or_copy(params['output_path'], self.cache.path_for(params['cache_key']))
+            self.cache.add(params['cache_key'])
+        except OSError as e:
+            self.logger.warning(f"Résultat de conversion non mis en cache: {str(e)}")
+
+    def cancel_conversion(self, conversion_id: str) -> bool:
+        """
+        Annule une conversion : ffmpeg est tué et le fichier de sortie partiel supprimé.
+        Une conversion partagée par plusieurs demandes n'est interrompue qu'à
+        la dernière annulation.
+        
+        Returns:
+            False si la conversion n'existe pas ou est déjà terminée
+        """
+        conversion = self.active_conversions.get(conversion_id)
+        if not conversion or conversion['status'] not in ('pending', 'converting'):
+            return False
+        with self.lock:
+            conversion['attached'] -= 1
+            if conversion['attached'] > 0:
+                return True
+        if conversion['status'] == 'pending':
+            # Pas encore prise par un worker : elle sera ignorée
+            conversion['status'] = 'cancelled'
+            self._publish(conversion, {'status': 'cancelled'}, immediate=True)
+        conversion['cancel_event'].set()
+        return True
+
     def _run_scheduler(self):
         """
         Exécute le planificateur de tâches
@@ -129,35 +461,46 @@ class MediaProcessor:
             
         conversion = self.active_conversions[conversion_id]
         status = {
+            'id': conversion_id,
             'status': conversion['status'],
             'input': conversion['input_path'],
             'output': conversion['output_path'],
-            'format': conversion['format']
+            'format': conversion['format'],
+            'priority': conversion['priority'],
+            'cached': conversion.get('cached', False)
         }
         
-        if conversion['status'] == 'converting':
-            # Calculer la progression
-            try:
-                output_file = Path(conversion['output_path'])
-                if output_file.exists():
-                    progress = (output_file.stat().st_size / 
-                              Path(conversion['input_path']).stat().st_size * 100)
-                    status['progress'] = min(progress, 99.9)
-                else:
-                    status['progress'] = 0
-            except:
-                status['progress'] = 0
-                
+        if conversion['status'] in ('converting', 'completed'):
+            # Progression rapportée par ffmpeg (-progress)
+            for field in ('progress', 'speed', 'eta', 'position'):
+                if field in conversion:
+                    status[field] = conversion[field]
+        elif conversion['status'] == 'pending':
+            status['progress'] = 0
         elif conversion['status'] == 'failed':
             status['error'] = conversion.get('error', 'Erreur inconnue')
             
         return status
 
-    def set_bandwidth_limit(self, limit_kb: int):
+    def get_pool_stats(self) -> Dict:
+        """État du pool de conversion"""
+        statuses = Counter(c['status'] for c in list(self.active_conversions.values()))
+        return {
+            'workers': self.workers,
+            'queued': self.conversion_queue.qsize(),
+            'converting': statuses['converting'],
+            'temperature': cpu_temperature(),
+            'thermal_limit': self.thermal_limit,
+            'cache': {**self.cache_stats, **self.cache.get_stats()}
+        }
+
+    def set_bandwidth_limit(self, limit_kb: Optional[int]):
         """
-        Définit une limite de bande passante en KB/s
+        Définit une limite de bande passante globale en KB/s
+        (appliquée au streaming et aux téléchargements, pas aux conversions locales)
         """
         self.bandwidth_limit = limit_kb
+        bandwidth_governor.configure(global_kbps=limit_kb)
 
     def get_system_stats(self) -> Dict:
         """
@@ -176,7 +519,8 @@ class MediaProcessor:
                 'free': disk.free,
                 'percent': disk.percent
             },
-            'bandwidth_limit': self.bandwidth_limit
+            'bandwidth_limit': self.bandwidth_limit,
+            'conversions': self.get_pool_stats()
         }
 
 # Instance globale du processeur média
@@ -9,13 +9,29 @@ import json
 import shutil
 from typing import Dict, List, Optional
 import logging
-from datetime import datetime
+import uuid
+from datetime import datetime, UTC
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import noload
+from ..database import db
+from ..models.metadata_playlist import MetadataPlaylist, MetadataPlaylistEntry
+from ..services.tag_reader import tag_reader
+from ..services.cover_store import cover_store, cover_url
+
+
+def _parse_date(value) -> Optional[datetime]:
+    """Date ISO des anciens fichiers JSON (None si absente ou invalide)"""
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
 
 class MetadataManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        # Anciennes playlists JSON, importées par migrate_json_playlists
         self.playlists_path = Path("data/playlists")
-        self.playlists_path.mkdir(parents=True, exist_ok=True)
 
     def edit_metadata(self, file_path: str, metadata: Dict) -> bool:
         """
@@ -73,103 +89,79 @@ class MetadataManager:
 
     def extract_metadata(self, file_path: str) -> Dict:
         """
-        Extrait les métadonnées d'un fichier audio
+        Extrait les métadonnées d'un fichier audio (une seule lecture des
+        balises et des en-têtes, résultat mis en cache), ses paroles et
+        l'adresse de sa pochette dans le stockage partagé
         """
-        try:
-            ext = Path(file_path).suffix.lower()
-            metadata = {}
-            
-            if ext in ['.mp3']:
-                audiofile = eyed3.load(file_path)
-                if audiofile and audiofile.tag:
-                    metadata = {
-                        'title': audiofile.tag.title,
-                        'artist': audiofile.tag.artist,
-                        'album': audiofile.tag.album,
-                        'genre': str(audiofile.tag.genre),
-                        'year': audiofile.tag.year,
-                        'track_num': audiofile.tag.track_num,
-                        'duration': audiofile.info.time_secs,
-                        'bitrate': audiofile.info.bit_rate[1],
-                        'sample_rate': audiofile.info.sample_freq
-                    }
-                    
-                    # Extraire les paroles
-                    if audiofile.tag.lyrics:
-                        metadata['lyrics'] = audiofile.tag.lyrics[0].text
-                    
-                    # Extraire la couverture
-                    if audiofile.tag.images:
-                        cover = audiofile.tag.images[0]
-                        cover_path = Path(file_path).parent / f"{Path(file_path).stem}_cover.jpg"
-                        with open(cover_path, 'wb') as img_file:
-                            img_file.write(cover.image_data)
-                        metadata['cover'] = str(cover_path)
-            
-            else:
-                # Utiliser mutagen pour les autres formats
-                audio = File(file_path)
-                if audio:
-                    metadata = dict(audio.tags)
-                    metadata['duration'] = audio.info.length
-                    if hasattr(audio.info, 'bitrate'):
-                        metadata['bitrate'] = audio.info.bitrate
-                    if hasattr(audio.info, 'sample_rate'):
-                        metadata['sample_rate'] = audio.info.sample_rate
-            
-            return metadata
-            
-        except Exception as e:
-            self.logger.error(f"Erreur lors de l'extraction des métadonnées: {str(e)}")
+        record = tag_reader.read(file_path)
+        if record is None:
+            self.logger.error(f"Métadonnées illisibles: {file_path}")
             return {}
+        # Pochette indexée par (chemin, taille, mtime) : extraite une seule fois
+        cover_key = cover_store.add_file(file_path) if record.has_cover else None
+        return {
+            'title': record.title,
+            'artist': record.artist,
+            'album': record.album,
+            'genre': record.genre,
+            'year': record.year,
+            'track_num': record.track_number,
+            'duration': record.duration,
+            'bitrate': record.bitrate,
+            'sample_rate': record.sample_rate,
+            'has_cover': record.has_cover,
+            'cover': cover_url(cover_key, cover_store.fit_size(300)) if cover_key else None,
+            'lyrics': record.lyrics
+        }
 
     def create_playlist(self, name: str, description: str = "") -> str:
         """
         Crée une nouvelle playlist
         """
         try:
-            playlist_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-            playlist_file = self.playlists_path / f"{playlist_id}.json"
-            
-            playlist_data = {
-                'id': playlist_id,
-                'name': name,
-                'description': description,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
-                'tracks': []
-            }
-            
-            with open(playlist_file, 'w', encoding='utf-8') as f:
-                json.dump(playlist_data, f, indent=2)
-            
+            playlist_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+            db.session.add(MetadataPlaylist(id=playlist_id, name=name, description=description))
+            db.session.commit()
             return playlist_id
             
         except Exception as e:
+            db.session.rollback()
             self.logger.error(f"Erreur lors de la création de la playlist: {str(e)}")
             raise
 
     def add_to_playlist(self, playlist_id: str, tracks: List[Dict]) -> bool:
         """
-        Ajoute des pistes à une playlist
+        Ajoute des pistes à une playlist (insertion des seules nouvelles pistes,
+        sans relire ni réécrire les précédentes)
         """
         try:
-            playlist_file = self.playlists_path / f"{playlist_id}.json"
-            if not playlist_file.exists():
+            # Réserver les positions : l'incrément prend le verrou d'écriture
+            # avant la lecture du compteur, deux ajouts ne peuvent se chevaucher
+            table = MetadataPlaylist.__table__
+            reserved = db.session.execute(
+                update(table)
+                .where(table.c.id == playlist_id)
+                .values(track_count=table.c.track_count + len(tracks),
+                        updated_at=datetime.now(UTC))
+            ).rowcount
+            if not reserved:
+                db.session.rollback()
                 return False
-            
-            with open(playlist_file, 'r+', encoding='utf-8') as f:
-                playlist = json.load(f)
-                playlist['tracks'].extend(tracks)
-                playlist['updated_at'] = datetime.now().isoformat()
-                
-                f.seek(0)
-                json.dump(playlist, f, indent=2)
-                f.truncate()
-            
+
+            end = db.session.execute(
+                select(table.c.track_count).where(table.c.id == playlist_id)
+            ).scalar_one()
+            start = end - len(tracks) + 1
+            if tracks:
+                db.session.execute(insert(MetadataPlaylistEntry.__table__), [
+                    {'playlist_id': playlist_id, 'position': start + offset, 'data': track}
+                    for offset, track in enumerate(tracks)
+                ])
+            db.session.commit()
             return True
             
         except Exception as e:
+            db.session.rollback()
             self.logger.error(f"Erreur lors de l'ajout à la playlist: {str(e)}")
             return False
 
@@ -178,38 +170,93 @@ class MetadataManager:
         Récupère les informations d'une playlist
         """
         try:
-            playlist_file = self.playlists_path / f"{playlist_id}.json"
-            if not playlist_file.exists():
-                return None
-            
-            with open(playlist_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            playlist = db.session.get(MetadataPlaylist, playlist_id)
+            return playlist.to_dict() if playlist else None
                 
         except Exception as e:
             self.logger.error(f"Erreur lors de la lecture de la playlist: {str(e)}")
             return None
 
-    def list_playlists(self) -> List[Dict]:
+    def list_playlists(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Liste les playlists, de la plus récemment modifiée à la plus ancienne
+        (lecture de l'index sur updated_at, sans charger les pistes)
+        """
+        query = (
+            MetadataPlaylist.query
+            .options(noload(MetadataPlaylist.entries))
+            .order_by(MetadataPlaylist.updated_at.desc())
+            .offset(offset)
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        return [playlist.to_summary() for playlist in query]
+
+    def migrate_json_playlists(self, directory: Optional[Path] = None, batch_size: int = 500) -> Dict:
         """
-        Liste toutes les playlists disponibles
+        Importe une fois pour toutes les anciennes playlists JSON (data/playlists).
+
+        Chaque fichier importé est renommé en .json.migrated ; une playlist
+        déjà présente en base n'est pas importée deux fois.
+
+        Returns:
+            Compteurs : importées, déjà présentes, illisibles
         """
-        playlists = []
-        for playlist_file in self.playlists_path.glob("*.json"):
-            try:
-                with open(playlist_file, 'r', encoding='utf-8') as f:
-                    playlist = json.load(f)
-                    playlists.append({
-                        'id': playlist['id'],
-                        'name': playlist['name'],
-                        'description': playlist['description'],
-                        'track_count': len(playlist['tracks']),
-                        'updated_at': playlist['updated_at']
-                    })
-            except Exception as e:
-                self.logger.error(f"Erreur lors de la lecture de {playlist_file}: {str(e)}")
-                continue
-        
-        return sorted(playlists, key=lambda x: x['updated_at'], reverse=True)
+        directory = Path(directory or self.playlists_path)
+        stats = {'imported': 0, 'skipped': 0, 'failed': 0}
+        files = sorted(directory.glob('*.json')) if directory.is_dir() else []
+
+        for start in range(0, len(files), batch_size):
+            batch = files[start:start + batch_size]
+            migrated = []
+            playlists, entries = [], []
+            ids = [path.stem for path in batch]
+            existing = {
+                row[0] for row in db.session.execute(
+                    select(MetadataPlaylist.id).where(MetadataPlaylist.id.in_(ids))
+                )
+            }
+            for path in batch:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    playlist_id = str(data.get('id') or path.stem)
+                    tracks = list(data.get('tracks') or [])
+                    created_at = _parse_date(data.get('created_at'))
+                    updated_at = _parse_date(data.get('updated_at')) or created_at
+                except (OSError, ValueError, TypeError) as e:
+                    self.logger.error(f"Erreur lors de la lecture de {path}: {str(e)}")
+                    stats['failed'] += 1
+                    continue
+                migrated.append(path)
+                if playlist_id in existing:
+                    stats['skipped'] += 1
+                    continue
+                existing.add(playlist_id)
+                now = datetime.now(UTC)
+                playlists.append({
+                    'id': playlist_id,
+                    'name': data.get('name') or playlist_id,
+                    'description': data.get('description', ''),
+                    'track_count': len(tracks),
+                    'created_at': created_at or now,
+                    'updated_at': updated_at or now
+                })
+                entries.extend(
+                    {'playlist_id': playlist_id, 'position': position, 'data': track}
+                    for position, track in enumerate(tracks, start=1)
+                )
+                stats['imported'] += 1
+
+            if playlists:
+                db.session.execute(insert(MetadataPlaylist.__table__), playlists)
+            if entries:
+                db.session.execute(insert(MetadataPlaylistEntry.__table__), entries)
+            db.session.commit()
+            for path in migrated:
+                path.rename(path.with_name(f"{path.name}.migrated"))
+
+        return stats
 
 # Instance globale du gestionnaire de métadonnées
 metadata_manager = MetadataManager()
@@ -0,0 +1,153 @@
+"""
+Préchargement des prochaines pistes dans le cache de pages du système.
+
+Sur carte SD ou disque USB, les premiers octets de la piste suivante arrivent
+souvent trop tard pour une lecture sans blanc. Le lecteur envoie la suite de
+sa file d'attente au démarrage d'une piste ; on demande alors au noyau de
+lire ces fichiers à l'avance (posix_fadvise WILLNEED), dans la limite d'un
+budget mémoire.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Taille de lecture pour le repli sans posix_fadvise (macOS, Windows)
+FALLBACK_READ_SIZE = 1024 * 1024
+
+
+class PagePrefetcher:
+    """Précharge des fichiers dans le cache de pages sous un budget mémoire"""
+
+    def __init__(self, budget_bytes: int = 256 * 1024 * 1024, max_ahead: int = 3,
+                 workers: int = 2):
+        """
+        Args:
+            budget_bytes: Volume maximal considéré comme préchargé
+            max_ahead: Nombre maximal de pistes préchargées par indication
+            workers: Nombre de threads de préchargement
+        """
+        self.budget_bytes = budget_bytes
+        self.max_ahead = max_ahead
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self.lock = threading.Lock()
+        self.resident: 'OrderedDict[str, int]' = OrderedDict()  # chemin -> octets préchargés
+        self.resident_bytes = 0
+        self.pending = set()
+        self.stats = {
+            'hints': 0,
+            'prefetched': 0,
+            'prefetched_bytes': 0,
+            'evicted': 0,
+            'hits': 0,
+            'misses': 0
+        }
+
+    def hint(self, paths: List[str]) -> int:
+        """
+        Planifie le préchargement des prochaines pistes, dans l'ordre de lecture.
+
+        Returns:
+            Nombre de fichiers effectivement planifiés
+        """
+        scheduled = 0
+        with self.lock:
+            self.stats['hints'] += 1
+            for path in paths[:self.max_ahead]:
+                if path in self.resident:
+                    # Déjà en cache : simplement rafraîchir sa place dans la LRU
+                    self.resident.move_to_end(path)
+                    continue
+                if path in self.pending:
+                    continue
+                self.pending.add(path)
+                scheduled += 1
+                self.executor.submit(self._prefetch, path)
+        return scheduled
+
+    def record_access(self, path: str) -> bool:
+        """
+        Enregistre l'ouverture d'une piste en lecture.
+
+        Returns:
+            True si la piste avait été préchargée
+        """
+        with self.lock:
+            hit = path in self.resident
+            self.stats['hits' if hit else 'misses'] += 1
+            if hit:
+                self.resident.move_to_end(path)
+            return hit
+
+    def get_stats(self) -> Dict:
+        """Statistiques de préchargement et taux de succès"""
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0,
+                'resident_files': len(self.resident),
+                'resident_bytes': self.resident_bytes,
+                'budget_bytes': self.budget_bytes,
+                'pending': len(self.pending)
+            }
+
+    def _prefetch(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            length = min(size, self.budget_bytes)
+
+            evicted = []
+            with self.lock:
+                while self.resident and self.resident_bytes + length > self.budget_bytes:
+                    old_path, old_length = self.resident.popitem(last=False)
+                    self.resident_bytes -= old_length
+                    self.stats['evicted'] += 1
+                    evicted.append((old_path, old_length))
+
+            # Rendre au noyau les pages des pistes sorties du budget
+            for old_path, old_length in evicted:
+                self._advise(old_path, old_length, willneed=False)
+
+            self._advise(path, length, willneed=True)
+
+            with self.lock:
+                self.resident[path] = length
+                self.resident_bytes += length
+                self.stats['prefetched'] += 1
+                self.stats['prefetched_bytes'] += length
+        except OSError as e:
+            logger.warning(f"Préchargement impossible pour {path}: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+
+    def _advise(self, path: str, length: int, willneed: bool):
+        """Conseille le noyau sur l'usage prochain d'un fichier"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                advice = os.POSIX_FADV_WILLNEED if willneed else os.POSIX_FADV_DONTNEED
+                os.posix_fadvise(fd, 0, length, advice)
+            elif willneed:
+                # Repli : lire le fichier remplit le cache de pages
+                remaining = length
+                while remaining > 0:
+                    data = os.read(fd, min(FALLBACK_READ_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+        finally:
+            os.close(fd)
+
+
+# Instance globale du préchargeur
+page_prefetcher = PagePrefetcher()
@@ -0,0 +1,172 @@
+"""
+Annulation des sous-processus (spotDL, ffmpeg) et nettoyage des fichiers partiels.
+
+Les commandes sont lancées dans leur propre groupe de processus : une
+annulation termine la commande et tout ce qu'elle a lancé (spotDL démarre
+lui-même yt-dlp et ffmpeg), d'abord poliment puis de force.
+"""
+
+import os
+import signal
+import logging
+import subprocess
+import threading
+from typing import Callable, Iterable, Optional, Sequence
+
+import psutil
+
+from .exceptions import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+# Délai laissé à un processus pour s'arrêter avant SIGKILL (secondes)
+KILL_GRACE = 0.5
+# Intervalle de vérification de l'annulation pendant l'attente d'une commande
+POLL_INTERVAL = 0.1
+
+
+def terminate_group(process: subprocess.Popen, grace: float = KILL_GRACE):
+    """Termine un processus lancé avec start_new_session=True et tout son groupe"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            process.wait(timeout=grace)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+    try:
+        # Récupérer les sorties restantes et le code de retour (pas de zombie)
+        process.communicate(timeout=grace)
+    except (subprocess.TimeoutExpired, ValueError):
+        pass
+
+
+def run_cancellable(cmd: Sequence[str], cancel_event: Optional[threading.Event] = None,
+                    timeout: Optional[float] = None, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Équivalent de subprocess.run(capture_output=True, text=True) interrompu
+    dès que cancel_event est levé.
+
+    Raises:
+        TaskCancelled: La commande a été annulée (son groupe est terminé)
+        subprocess.TimeoutExpired: Délai dépassé (son groupe est terminé)
+    """
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        start_new_session=True, **kwargs
+    )
+    waited = 0.0
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=POLL_INTERVAL)
+            return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            waited += POLL_INTERVAL
+        if cancel_event is not None and cancel_event.is_set():
+            terminate_group(process)
+            raise TaskCancelled(f"Commande annulée: {cmd[0]}")
+        if timeout is not None and waited >= timeout:
+            terminate_group(process)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+
+def run_streaming(cmd: Sequence[str], on_line: Callable[[str], None],
+                  cancel_event: Optional[threading.Event] = None, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Comme run_cancellable, mais la sortie standard est transmise ligne par
+    ligne à on_line pendant l'exécution (progression de ffmpeg -progress).
+
+    Raises:
+        TaskCancelled: La commande a été annulée (son groupe est terminé)
+    """
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        start_new_session=True, **kwargs
+    )
+    # stderr lu à part : un tampon plein bloquerait la commande
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+
+    cancelled = threading.Event()
+    if cancel_event is not None:
+        def watch():
+            while process.poll() is None:
+                if cancel_event.wait(POLL_INTERVAL):
+                    cancelled.set()
+                    for sig in (signal.SIGTERM, signal.SIGKILL):
+                        try:
+                            os.killpg(process.pid, sig)
+                            process.wait(timeout=KILL_GRACE)
+                            break
+                        except ProcessLookupError:
+                            break
+                        except subprocess.TimeoutExpired:
+                            continue
+                    return
+        threading.Thread(target=watch, daemon=True).start()
+
+    for line in process.stdout:
+        on_line(line.rstrip('\n'))
+    process.wait()
+    reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    if cancelled.is_set():
+        raise TaskCancelled(f"Commande annulée: {cmd[0]}")
+    return subprocess.CompletedProcess(cmd, process.returncode, '', ''.join(stderr))
+
+
+def kill_children(match: str, grace: float = KILL_GRACE) -> int:
+    """
+    Termine les processus fils du serveur dont la ligne de commande contient
+    `match` (ffmpeg lancé par yt-dlp pour une tâche donnée).
+
+    Returns:
+        Nombre de processus terminés
+    """
+    targets = []
+    for child in psutil.Process().children(recursive=True):
+        try:
+            if match in ' '.join(child.cmdline()):
+                targets.append(child)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    for child in targets:
+        try:
+            child.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(targets, timeout=grace)
+    for child in alive:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+    return len(targets)
+
+
+def remove_partial_files(paths: Iterable[str], since: Optional[float] = None) -> int:
+    """
+    Supprime les fichiers laissés par une tâche interrompue.
+
+    Args:
+        since: Date (epoch) de début de la tâche : un fichier plus ancien
+            appartient à un autre téléchargement et est conservé
+
+    Returns:
+        Nombre de fichiers supprimés
+    """
+    removed = 0
+    for path in set(paths):
+        try:
+            if since is not None and os.path.getmtime(path) < since:
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    return removed
@@ -11,6 +11,7 @@ import threading
 import json
 from flask import current_app
 import logging
+from .events import event_bus, STREAMS
 
 class StreamManager:
     def __init__(self):
@@ -113,16 +114,21 @@ class StreamManager:
             return
 
         handle = stream['handle']
-        while handle.status().progress < 1:
+        while True:
             status = handle.status()
-            self.active_streams[stream_id].update({
+            update = {
                 'progress': status.progress * 100,
                 'download_rate': status.download_rate,
                 'upload_rate': status.upload_rate,
                 'num_peers': status.num_peers
-            })
+            }
+            self.active_streams[stream_id].update(update)
             if status.progress >= 1:
                 self.active_streams[stream_id]['status'] = 'completed'
+                event_bus.publish(STREAMS, stream_id, {**update, 'status': 'completed', 'type': 'torrent'},
+                                  immediate=True)
+                break
+            event_bus.publish(STREAMS, stream_id, {**update, 'status': 'downloading', 'type': 'torrent'})
             threading.Event().wait(1.0)
 
     def get_stream_status(self, stream_id):
@@ -211,5 +211,129 @@ class TestPlaylistRoutes(unittest.TestCase):
         response = self.client.get('/api/playlists/999')
         self.assertEqual(response.status_code, 404)
 
+
+def write_tagged_mp3(path, title):
+    """MP3 de trames vides avec un titre ID3"""
+    from mutagen.id3 import ID3, TIT2
+    with open(path, 'wb') as f:
+        f.write((b'\xff\xfb\x90\x64' + b'\x00' * 413) * 50)
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.save(path)
+    return path
+
+
+class TestTrackMetadataRoutes(unittest.TestCase):
+    """Tests de la modification des balises par l'API des pistes"""
+
+    def setUp(self):
+        import tempfile
+        import src.models  # noqa: F401 (tables liées aux pistes)
+        from src.database import db
+        from src.routes.api import api_bp
+
+        self.folder = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['LOGIN_DISABLED'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.folder, 'library.db')}"
+        db.init_app(self.app)
+        self.app.register_blueprint(api_bp)
+        with self.app.app_context():
+            db.create_all()
+            for i in range(2):
+                path = write_tagged_mp3(os.path.join(self.folder, f'{i}.mp3'), f'Titre {i}')
+                db.session.add(Track(title=f'Titre {i}', file_path=path))
+            db.session.commit()
+            self.ids = [track.id for track in Track.query.order_by(Track.id)]
+        self.client = self.app.test_client()
+
+    def _titles(self):
+        from src.database import db
+        with self.app.app_context():
+            return [db.session.get(Track, track_id).title for track_id in self.ids]
+
+    def test_single_edit_uses_url_track(self):
+        """Test que l'identifiant du corps ne désigne pas une autre piste"""
+        first, second = self.ids
+        response = self.client.patch(f'/api/tracks/{first}/metadata', json={'id': second, 'title': 'Piégée'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._titles(), ['Titre 0', 'Titre 1'])
+
+        response = self.client.patch(f'/api/tracks/{first}/metadata', json={'id': first, 'title': 'Nouveau'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['id'], first)
+        self.assertEqual(self._titles(), ['Nouveau', 'Titre 1'])
+
+    def test_download_goes_through_download_manager(self):
+        """Test que /api/download confie l'URL au gestionnaire de téléchargements"""
+        from types import SimpleNamespace
+        from unittest import mock
+        manager = mock.Mock()
+        manager.add_download.return_value = 'tache1'
+        manager.get_status.return_value = {'status': 'pending'}
+        with mock.patch('src.routes.download.download_manager', manager), \
+                mock.patch('src.routes.api.current_user', SimpleNamespace(id=3)):
+            response = self.client.post('/api/download', json={
+                'url': 'https://youtu.be/dQw4w9WgXcQ', 'title': 'Titre', 'artist': 'Artiste'
+            })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['task_id'], 'tache1')
+        args, kwargs = manager.add_download.call_args
+        self.assertEqual(args, ('https://youtu.be/dQw4w9WgXcQ', 'youtube'))
+        self.assertEqual(kwargs['user_id'], 3)
+        self.assertEqual(kwargs['tags']['title'], 'Titre')
+
+    def test_batch_edit(self):
+        """Test la modification d'un lot et le rapport des pistes absentes"""
+        first, second = self.ids
+        response = self.client.patch('/api/tracks/metadata', json={'tracks': [
+            {'id': first, 'album': 'Commun'},
+            {'id': second, 'title': 'Deuxième'},
+            {'id': 999, 'title': 'Absente'}
+        ]})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(list(response.get_json()['errors']), ['999'])
+        self.assertEqual(self._titles(), ['Titre 0', 'Deuxième'])
+
+        response = self.client.patch('/api/tracks/metadata', json={'tracks': [{'title': 'Sans id'}]})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class TestMediaRoutes(unittest.TestCase):
+    """Tests des routes de conversion des médias"""
+
+    def test_convert_is_owned_by_session_user(self):
+        """Test que la conversion est rattachée à l'utilisateur de la session"""
+        import tempfile
+        from types import SimpleNamespace
+        from unittest import mock
+        from src.routes.media import media_bp
+
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        app.config['SECRET_KEY'] = 'test_key'
+        app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'temp'))
+        app.register_blueprint(media_bp)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 7
+
+        processor = mock.Mock()
+        processor.convert_media.return_value = 'conv1'
+        processor.get_conversion_status.return_value = {'output': 'sortie.mp3'}
+        with mock.patch('src.utils.auth.db_session') as db_session, \
+                mock.patch('src.routes.media.media_processor', processor):
+            db_session.get.return_value = SimpleNamespace(id=7)
+            response = client.post('/media/convert', data={
+                'file': (BytesIO(b'RIFF'), 'entree.wav'), 'format': 'mp3'
+            }, content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(response.get_json()['conversion_id'], 'conv1')
+        self.assertEqual(processor.convert_media.call_args.kwargs['user_id'], 7)
+
 if __name__ == '__main__':
     unittest.main()